@@ -1,34 +1,90 @@
 import os
 import sys
-from flask import Flask, request, render_template, jsonify
-import numpy as np
-import pandas as pd
-import json
-import plotly
-import plotly.graph_objs as go
-from plotly.subplots import make_subplots
-import matplotlib
-matplotlib.use('Agg')  # Use non-interactive backend
-import matplotlib.pyplot as plt
-from io import BytesIO
-import base64
+import time
+import threading
+from flask import Flask, request, render_template, jsonify, url_for, abort, make_response, g
 
 from src.exception import CustomException
 from src.logger import logging
+from src.metrics import metrics
 from src.pipeline.predict_pipeline import CustomData, PredictPipeline
+from src.pipeline.model_registry import get_model_registry
+from src.pipeline.forecast_cache import get_forecast_cache
+from src.components.segment_store import get_segment_store
+from src.pipeline.plot_renderer import PLOT_KINDS, get_plot_renderer
+from src.pipeline.training_jobs import get_training_job_store, start_worker_process
 
 application = Flask(__name__)
 app = application
 
-def fig_to_base64(fig):
-    """Convert matplotlib figure to base64 string."""
-    buf = BytesIO()
-    fig.savefig(buf, format='png', dpi=150, bbox_inches='tight')
-    buf.seek(0)
-    img_str = base64.b64encode(buf.read()).decode('utf-8')
-    plt.close(fig)
-    return img_str
+# Load the model once per worker process; requests share it and it hot-swaps
+# itself when a new model version is promoted.
+model_registry = get_model_registry()
+plot_renderer = get_plot_renderer()
 
+MAX_FORECAST_DAYS = 180
+MAX_BATCH_QUERIES = 1000
+MAX_SCENARIOS = 5000
+
+# Progress of the background warm-up, reported by /ready
+warmup_state = {'status': 'warming', 'error': None, 'seconds': None}
+
+def warm_up():
+    '''
+    Loads the model and computes the longest forecast into the cache, off
+    the import path so the worker starts accepting connections right away.
+    '''
+    start_time = time.time()
+    try:
+        PredictPipeline(registry=model_registry).predict(
+            CustomData(periods=MAX_FORECAST_DAYS).get_data_as_data_frame()
+        )
+        warmup_state.update(status='ready', error=None)
+        logging.info(f"Model warm after {time.time() - start_time:.2f}s")
+    except Exception as e:
+        warmup_state.update(status='error', error=str(e))
+        logging.warning(f"Model not loaded at startup, will retry on first request: {e}")
+    warmup_state['seconds'] = round(time.time() - start_time, 3)
+
+threading.Thread(target=warm_up, name='model-warmup', daemon=True).start()
+
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+
+@app.after_request
+def record_request_metrics(response):
+    # The route pattern, not the URL, keeps the label set small
+    endpoint = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+    if 'request_start' in g:
+        metrics.observe('http_request_duration_seconds', time.perf_counter() - g.request_start,
+                        endpoint=endpoint, method=request.method)
+    metrics.inc('http_requests_total', endpoint=endpoint, method=request.method, status=response.status_code)
+    return response
+
+def parse_forecast_queries(payload):
+    '''
+    Validates the body of /api/forecast and returns a list of CustomData.
+    Raises ValueError with a client-facing message on bad input.
+    '''
+    if not isinstance(payload, dict) or not isinstance(payload.get('queries'), list):
+        raise ValueError("Body must be a JSON object with a 'queries' list.")
+    queries = payload['queries']
+    if not 1 <= len(queries) <= MAX_BATCH_QUERIES:
+        raise ValueError(f"'queries' must hold between 1 and {MAX_BATCH_QUERIES} items.")
+
+    parsed = []
+    for idx, query in enumerate(queries):
+        if not isinstance(query, dict):
+            raise ValueError(f"Query {idx} must be an object.")
+        periods = query.get('periods')
+        if isinstance(periods, bool) or not isinstance(periods, int) or not 1 <= periods <= MAX_FORECAST_DAYS:
+            raise ValueError(f"Query {idx}: 'periods' must be an integer between 1 and {MAX_FORECAST_DAYS}.")
+        segment = query.get('segment')
+        if segment is not None and not isinstance(segment, str):
+            raise ValueError(f"Query {idx}: 'segment' must be a string or null.")
+        parsed.append(CustomData(periods=periods, segment=segment))
+    return parsed
 
 @app.route('/')
 def index():
@@ -59,40 +115,21 @@ def predict_datapoint():
             pred_df = data.get_data_as_data_frame()
             logging.info(f"Prediction requested for {periods_to_forecast} periods.")
 
-            # Initialize the prediction pipeline
-            predict_pipeline = PredictPipeline()
+            # Initialize the prediction pipeline from the shared model registry
+            predict_pipeline = PredictPipeline(registry=model_registry)
             
             # Get the forecast dataframe (full forecast with historical)
             forecast_df = predict_pipeline.predict(pred_df)
             
-            # Get the Prophet model for plotting
-            model = predict_pipeline.get_model()
-            
+            # Plots are rendered in the background and served from /plots/...
+            model_version = predict_pipeline.model_version
+            plot_renderer.prefetch(model_version, periods_to_forecast, predict_pipeline.get_model(), forecast_df)
+
             logging.info("Prediction successful.")
 
             # Separate historical and forecast data
             forecast_data = forecast_df.tail(periods_to_forecast).copy()
-            
-            # Generate Prophet plots          
-            # Plot 1: Main forecast plot with historical data
-            fig1 = model.plot(forecast_df, figsize=(14, 6))
-            ax1 = fig1.gca()
-            ax1.set_title(f'{periods_to_forecast}-Day Sales Forecast', fontsize=16, fontweight='bold')
-            ax1.set_xlabel('Date', fontsize=12)
-            ax1.set_ylabel('Quantity Sold', fontsize=12)
-            
-            # Add vertical line at forecast start
-            last_historical_date = forecast_df.iloc[-periods_to_forecast - 1]['ds']
-            ax1.axvline(x=last_historical_date, color='red', linestyle='--', linewidth=2, label='Forecast Start')
-            ax1.legend()
-            ax1.grid(alpha=0.3)
-            
-            prophet_forecast_img = fig_to_base64(fig1)
-            
-            # Plot 2: Components plot (trend, weekly, yearly seasonality)
-            fig2 = model.plot_components(forecast_df, figsize=(14, 10))
-            prophet_components_img = fig_to_base64(fig2)
-            
+
             # Calculate summary statistics
             forecast_summary = {
                 'total_predicted': int(forecast_data['yhat'].sum()),
@@ -119,8 +156,9 @@ def predict_datapoint():
                 'home.html', 
                 results=results_list, 
                 periods=periods_to_forecast,
-                prophet_forecast_img=prophet_forecast_img,
-                prophet_components_img=prophet_components_img,
+                prophet_forecast_url=url_for('plot_image', kind='forecast', periods=periods_to_forecast, v=model_version),
+                prophet_components_url=url_for('plot_image', kind='components', periods=periods_to_forecast, v=model_version),
+                plot_data_url=url_for('plot_data', periods=periods_to_forecast),
                 summary=forecast_summary
             )
         
@@ -131,5 +169,264 @@ def predict_datapoint():
                 error=f"An error occurred: {str(e)}"
             )
 
+@app.route('/api/forecast', methods=['POST'])
+def forecast_api():
+    '''
+    JSON forecast API. Body: {"queries": [{"periods": 30}, {"segment": "Cafe", "periods": 7}]}.
+    Each distinct segment is forecast once over its longest requested horizon.
+    '''
+    try:
+        queries = parse_forecast_queries(request.get_json(silent=True))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    requested_segments = {query.segment for query in queries if query.segment is not None}
+    unknown_segments = sorted(requested_segments - set(get_segment_store().segments()))
+    if unknown_segments:
+        return jsonify({'error': f"Unknown segments: {unknown_segments}"}), 404
+
+    try:
+        results = PredictPipeline(registry=model_registry).predict_batch(queries)
+        logging.info(f"Answered {len(queries)} forecast queries via the API.")
+        return jsonify({'results': results})
+    except Exception as e:
+        logging.error(f"Error in forecast API: {e}", exc_info=True)
+        return jsonify({'error': 'Forecast failed, see server logs.'}), 500
+
+@app.route('/api/scenarios', methods=['POST'])
+def scenarios_api():
+    '''
+    What-if simulation of regressor scenarios against the baseline forecast.
+    Body: {"periods": 30, "segment": null, "series": true, "scenarios": [
+    {"name": "promo", "changes": [{"regressor": "promotion", "set": 1, "start": "2024-12-10", "end": "2024-12-14"}]},
+    {"name": "price +10%", "changes": [{"regressor": "price_index", "scale": 1.1}]}]}.
+    Every scenario gets its totals and, unless "series" is false, its daily
+    forecast and delta to the baseline.
+    '''
+    body = request.get_json(silent=True)
+    if not isinstance(body, dict):
+        return jsonify({'error': "Body must be a JSON object."}), 400
+    periods = body.get('periods', 30)
+    if isinstance(periods, bool) or not isinstance(periods, int) or not 1 <= periods <= MAX_FORECAST_DAYS:
+        return jsonify({'error': f"'periods' must be an integer between 1 and {MAX_FORECAST_DAYS}."}), 400
+    scenarios = body.get('scenarios')
+    if not isinstance(scenarios, list) or not 1 <= len(scenarios) <= MAX_SCENARIOS:
+        return jsonify({'error': f"'scenarios' must hold between 1 and {MAX_SCENARIOS} items."}), 400
+    segment = body.get('segment')
+    if segment is not None and segment not in get_segment_store().segments():
+        return jsonify({'error': f"Unknown segment: {segment}"}), 404
+
+    try:
+        result = PredictPipeline(registry=model_registry).simulate(periods, scenarios, segment)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logging.error(f"Error in scenario API: {e}", exc_info=True)
+        return jsonify({'error': 'Simulation failed, see server logs.'}), 500
+
+    baseline, simulated = result['baseline'], result['simulated']
+    baseline_total = float(baseline[:, 0].sum())
+    totals = simulated['yhat'].sum(axis=1)
+    delta_totals = simulated['delta'].sum(axis=1)
+    response = []
+    for i, name in enumerate(result['names']):
+        scenario = {
+            'name': name,
+            'total': round(float(totals[i]), 2),
+            'delta_total': round(float(delta_totals[i]), 2),
+            'delta_pct': round(100 * float(delta_totals[i]) / baseline_total, 4) if baseline_total else None
+        }
+        if body.get('series', True):
+            for key in ('yhat', 'yhat_lower', 'yhat_upper', 'delta'):
+                scenario[key] = simulated[key][i].round(2).tolist()
+        response.append(scenario)
+
+    logging.info(f"Simulated {len(response)} scenarios over {periods} days.")
+    return jsonify({
+        'model_version': result['model_version'],
+        'ds': result['ds'],
+        'regressors': result['regressors'],
+        'baseline': {
+            'total': round(baseline_total, 2),
+            'yhat': baseline[:, 0].round(2).tolist(),
+            'yhat_lower': baseline[:, 1].round(2).tolist(),
+            'yhat_upper': baseline[:, 2].round(2).tolist()
+        },
+        'scenarios': response
+    })
+
+@app.route('/metrics')
+def metrics_endpoint():
+    '''Prometheus scrape endpoint with the metrics of this worker process.'''
+    metrics.set_gauge('model_loaded', 1 if model_registry.is_loaded else 0)
+    metrics.set_gauge('forecast_cache_entries', len(get_forecast_cache()))
+    return app.response_class(metrics.render_prometheus(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/health')
+def health():
+    '''Liveness: the worker is up and serving requests.'''
+    return jsonify({'status': 'ok'})
+
+@app.route('/ready')
+def ready():
+    '''
+    Readiness: 200 once the model is loaded and its forecast cached,
+    503 while warming up or if no model could be loaded.
+    '''
+    body = dict(warmup_state)
+    # After a failed warm-up a later request may still have loaded the model
+    if body['status'] == 'ready' or (body['status'] == 'error' and model_registry.is_loaded):
+        body['status'] = 'ready'
+        body['model_version'] = model_registry.get().version
+        return jsonify(body)
+    return jsonify(body), 503
+
+def parse_periods(periods):
+    if not 1 <= periods <= MAX_FORECAST_DAYS:
+        abort(400, description=f"periods must be between 1 and {MAX_FORECAST_DAYS}")
+    return periods
+
+@app.route('/plots/<kind>/<int:periods>.png')
+def plot_image(kind, periods):
+    '''
+    Serves a rendered Prophet plot. URLs carry the model version (?v=), so
+    they can be cached for a long time; the ETag lets clients revalidate
+    without the plot being rendered again.
+    '''
+    if kind not in PLOT_KINDS:
+        abort(404)
+    periods = parse_periods(periods)
+    segment = request.args.get('segment')
+
+    predict_pipeline = PredictPipeline(registry=model_registry)
+    predict_pipeline.get_model(segment)
+    model_version = predict_pipeline.model_version
+    etag = plot_renderer.etag(model_version, periods, kind)
+    if etag in request.if_none_match:
+        response = make_response('', 304)
+    else:
+        forecast_df = predict_pipeline.predict(CustomData(periods, segment).get_data_as_data_frame())
+        plot = plot_renderer.get(model_version, periods, kind, predict_pipeline.get_model(segment), forecast_df)
+        response = make_response(plot.png)
+        response.mimetype = 'image/png'
+
+    response.set_etag(etag)
+    if request.args.get('v') == model_version:
+        response.headers['Cache-Control'] = 'public, max-age=86400, immutable'
+    else:
+        response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+@app.route('/api/plot-data/<int:periods>')
+def plot_data(periods):
+    '''
+    Returns the data behind the plots instead of pixels, for client-side
+    Plotly charts: history, forecast with intervals and the components.
+    '''
+    periods = parse_periods(periods)
+    segment = request.args.get('segment')
+    try:
+        predict_pipeline = PredictPipeline(registry=model_registry)
+        forecast_df = predict_pipeline.predict(CustomData(periods, segment).get_data_as_data_frame())
+        history = predict_pipeline.get_model(segment).history
+    except Exception as e:
+        logging.error(f"Error in plot data API: {e}", exc_info=True)
+        return jsonify({'error': 'Forecast failed, see server logs.'}), 500
+
+    components = [col for col in ('trend', 'weekly', 'yearly') if col in forecast_df.columns]
+    ds = forecast_df['ds'].dt.strftime('%Y-%m-%d').tolist()
+    return jsonify({
+        'model_version': predict_pipeline.model_version,
+        'forecast_start': ds[-periods] if periods <= len(ds) else None,
+        'history': {
+            'ds': history['ds'].dt.strftime('%Y-%m-%d').tolist(),
+            'y': history['y'].tolist()
+        },
+        'forecast': {
+            'ds': ds,
+            'yhat': forecast_df['yhat'].round(2).tolist(),
+            'yhat_lower': forecast_df['yhat_lower'].round(2).tolist(),
+            'yhat_upper': forecast_df['yhat_upper'].round(2).tolist()
+        },
+        'components': {col: forecast_df[col].round(4).tolist() for col in components}
+    })
+
+@app.route('/api/outliers', methods=['POST'])
+def check_outliers():
+    '''
+    Judges observations by the outlier boundaries fitted on the training
+    data. Body: {"observations": [{"ds": "2024-12-10", "y": 5200},
+    {"ds": "2024-12-10", "y": 90, "segment": "Cafe"}]}; observations with
+    a segment use the boundaries of the segment (fleet) training.
+    '''
+    import numpy as np
+    import pandas as pd
+    from src.components.data_transformation import DataTransformationConfig
+    from src.components.outlier_detection import OutlierFilter, get_boundary_cache
+
+    body = request.get_json(silent=True) or {}
+    try:
+        df = pd.DataFrame(body.get('observations') or [], columns=['ds', 'y', 'segment'])
+        if df.empty:
+            raise ValueError("observations must be a non-empty list")
+        df['ds'] = pd.to_datetime(df['ds'])
+        df['y'] = pd.to_numeric(df['y'])
+    except (ValueError, TypeError) as e:
+        return jsonify({'error': str(e)}), 400
+
+    config = DataTransformationConfig()
+    outlier = np.zeros(len(df), dtype=bool)
+    has_segment = df['segment'].notna().to_numpy()
+    try:
+        for rows, path, segment_col in ((~has_segment, config.outlier_boundaries_path, None),
+                                        (has_segment, config.segment_outlier_boundaries_path, 'segment')):
+            if rows.any():
+                outlier[rows] = OutlierFilter.apply(df[rows], get_boundary_cache().load(path), segment_col)
+    except FileNotFoundError:
+        return jsonify({'error': 'No outlier boundaries available, train a model first.'}), 503
+    except Exception as e:
+        logging.error(f"Error in outlier API: {e}", exc_info=True)
+        return jsonify({'error': 'Outlier check failed, see server logs.'}), 500
+
+    return jsonify({'outliers': outlier.tolist()})
+
+@app.route('/api/train-jobs', methods=['GET', 'POST'])
+def train_jobs():
+    '''
+    POST queues a training pipeline run, body e.g. {"incremental": true}
+    or {"search_strategy": "halving", "n_jobs": 4}, and returns 202 with
+    the job. Runs happen in a separate worker process; the app swaps to the
+    new model once the run has finished. GET lists the latest jobs.
+    '''
+    store = get_training_job_store()
+    if request.method == 'GET':
+        return jsonify({'jobs': store.list(limit=request.args.get('limit', 20, type=int))})
+
+    try:
+        job = store.submit(request.get_json(silent=True))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    if store.config.autostart_worker:
+        start_worker_process(store)
+    response = jsonify(job)
+    response.status_code = 202
+    response.headers['Location'] = url_for('train_job', job_id=job['id'])
+    return response
+
+@app.route('/api/train-jobs/<job_id>')
+def train_job(job_id):
+    '''Status of a training job, with per-stage and per-trial progress.'''
+    job = get_training_job_store().get(job_id)
+    if job is None:
+        return jsonify({'error': f"Unknown job {job_id}"}), 404
+    return jsonify(job)
+
+@app.route('/api/train-jobs/<job_id>/cancel', methods=['POST'])
+def cancel_train_job(job_id):
+    job = get_training_job_store().cancel(job_id)
+    if job is None:
+        return jsonify({'error': f"Unknown job {job_id}"}), 404
+    return jsonify(job)
+
 if __name__ == "__main__":
     app.run(host="0.0.0.0", port=5000, debug=True)
\ No newline at end of file
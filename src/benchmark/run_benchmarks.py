@@ -0,0 +1,351 @@
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import subprocess
+import threading
+import dataclasses
+import statistics
+from dataclasses import dataclass, field
+
+from src.exception import CustomException
+from src.logger import logging
+from src.benchmark.synthetic_data import SyntheticDataConfig, write_sales_data
+
+STAGES = ['ingestion', 'transformation', 'tuning', 'predict_init', 'predict', 'predict_materialized', 'predict_route']
+
+@dataclass
+class BenchmarkConfig:
+    data: SyntheticDataConfig = field(default_factory=SyntheticDataConfig)
+    stages: list = field(default_factory=lambda: list(STAGES))
+    # Everything the benchmark writes goes here, never to the real artifacts
+    work_dir: str = os.path.join('artifacts', 'benchmark')
+    # The tuning stage runs this many random-search candidates (0 = full grid)
+    tuning_trials: int = 6
+    n_jobs: int = 1
+    # Timed repetitions of the ingestion and transformation stages
+    data_repeats: int = 3
+    # Timed repetitions of the fast stages (predict, predict_route)
+    repeats: int = 20
+    periods: int = 30
+
+class PeakMemorySampler:
+    '''
+    Samples the resident set size of this process on a background thread
+    and keeps the peak. Child processes (Stan, pool workers) are not
+    included. Without /proc it falls back to the lifetime peak of getrusage.
+    '''
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.start_rss = self.peak_rss = self.rss()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='memory-sampler', daemon=True)
+
+    @staticmethod
+    def rss():
+        try:
+            with open('/proc/self/statm', 'r') as file_obj:
+                return int(file_obj.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+        except (OSError, ValueError):
+            import resource
+            scale = 1 if sys.platform == 'darwin' else 1024
+            return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.peak_rss = max(self.peak_rss, self.rss())
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak_rss = max(self.peak_rss, self.rss())
+
+def measure(run, n_items=None, unit='rows', repeats=1):
+    '''
+    Runs run() `repeats` times and returns its timings (total, median and
+    p95 seconds per call), the peak resident memory, and the throughput of
+    n_items per call. Returns the stats and the last result of run().
+    '''
+    timings = []
+    with PeakMemorySampler() as memory:
+        for _ in range(repeats):
+            start_time = time.perf_counter()
+            result = run()
+            timings.append(time.perf_counter() - start_time)
+
+    median = statistics.median(timings)
+    stats = {
+        'seconds': round(median, 6),
+        'total_seconds': round(sum(timings), 6),
+        'repeats': repeats,
+        'p95_seconds': round(sorted(timings)[max(0, int(round(0.95 * repeats)) - 1)], 6),
+        'peak_rss_mb': round(memory.peak_rss / 2**20, 2),
+        'rss_delta_mb': round((memory.peak_rss - memory.start_rss) / 2**20, 2)
+    }
+    if n_items:
+        stats['items'] = n_items
+        stats['unit'] = unit
+        stats['throughput'] = round(n_items / median, 2) if median > 0 else None
+    return stats, result
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+class BenchmarkRunner:
+    '''
+    Runs the training and serving stages on a synthetic dataset, each in
+    isolation under config.work_dir, and collects per-stage timings, peak
+    memory and throughput.
+    '''
+    def __init__(self, config: BenchmarkConfig = None):
+        self.config = config or BenchmarkConfig()
+        self.results = {}
+
+    def path(self, name):
+        return os.path.join(self.config.work_dir, name)
+
+    def record(self, stage, stats):
+        self.results[stage] = stats
+        logging.info(f"Benchmark stage '{stage}': {stats}")
+
+    def run(self):
+        # Imported here so generating data does not pull in the training stack
+        from src.components.data_ingestion import DataIngestion, DataIngestionConfig
+        from src.components.data_transformation import DataTransformation, DataTransformationConfig
+        from src.components.model_trainer import ModelTrainer, ModelTrainerConfig
+        from src.components.model_store import ModelStore, ModelStoreConfig
+        from src.components.regressor_store import RegressorStoreConfig
+        from src.utils import artifact_path, load_frame
+
+        config = self.config
+        stages = set(config.stages)
+        os.makedirs(config.work_dir, exist_ok=True)
+
+        source_path = self.path('sales.csv')
+        stats, n_source_rows = measure(lambda: write_sales_data(config.data, source_path))
+        self.record('generate', dict(stats, items=n_source_rows, unit='rows'))
+
+        ingestion = DataIngestion()
+        ingestion.ingestion_config = DataIngestionConfig(
+            source_data_path=source_path,
+            train_data_path=self.path(os.path.basename(artifact_path('train'))),
+            test_data_path=self.path(os.path.basename(artifact_path('test'))),
+            raw_data_path=self.path(os.path.basename(artifact_path('data'))),
+            regressor_store=RegressorStoreConfig(store_dir=self.path('regressors'))
+        )
+        stats, (train_path, test_path) = measure(
+            ingestion.initiate_data_ingestion, n_source_rows, repeats=config.data_repeats
+        )
+        if 'ingestion' in stages:
+            self.record('ingestion', stats)
+
+        transformation = DataTransformation()
+        transformation.transformation_config = DataTransformationConfig(
+            cleaned_train_data_path=self.path(os.path.basename(artifact_path('train_cleaned'))),
+            cleaned_test_data_path=self.path(os.path.basename(artifact_path('test_cleaned')))
+        )
+        n_days = len(load_frame(train_path)) + len(load_frame(test_path))
+        stats, (cleaned_train_path, cleaned_test_path) = measure(
+            lambda: transformation.initiate_data_transformation(train_path, test_path), n_days, unit='days',
+            repeats=config.data_repeats
+        )
+        if 'transformation' in stages:
+            self.record('transformation', stats)
+
+        serving = stages & {'predict_init', 'predict', 'predict_materialized', 'predict_route'}
+        if not serving and 'tuning' not in stages:
+            return self.results
+
+        trainer = ModelTrainer(ModelTrainerConfig(
+            n_jobs=config.n_jobs,
+            search_strategy='random' if config.tuning_trials else 'grid',
+            search_trials=config.tuning_trials,
+            trained_model_file_path=self.path('model.pkl'),
+            lite_model_file_path=self.path('model_lite.npz'),
+            model_store_dir=self.path('models'),
+            tuning_trials_path=self.path('tuning_trials.csv'),
+            best_params_path=self.path('best_params.json')
+        ))
+        cleaned_train_df = load_frame(cleaned_train_path)
+        stats, best_params = measure(lambda: trainer.find_best_params(cleaned_train_df))
+        trials_df = load_frame(self.path('tuning_trials.csv'))
+        if 'tuning' in stages:
+            self.record('tuning', dict(stats, items=int(trials_df['n_fits'].sum()), unit='fits',
+                                       throughput=round(trials_df['n_fits'].sum() / stats['seconds'], 2)))
+
+        if serving:
+            store = ModelStore(ModelStoreConfig(root_dir=self.path('models')))
+            best_model = trainer.fit_final_model(best_params, cleaned_train_df)
+            store.promote(store.publish(best_model, cleaned_train_df)['version'])
+            self.run_serving(cleaned_train_path, stages)
+        return self.results
+
+    def run_serving(self, cleaned_train_path, stages):
+        from src.pipeline.model_registry import ModelRegistry, ModelRegistryConfig
+        from src.pipeline.forecast_cache import ForecastCache
+        from src.pipeline.predict_pipeline import PredictPipeline, CustomData
+        from src.components.forecast_store import ForecastStore, ForecastStoreConfig
+
+        config = self.config
+        registry_config = ModelRegistryConfig(model_store_dir=self.path('models'))
+        forecast_store = ForecastStore(ForecastStoreConfig(store_dir=self.path('forecasts')))
+
+        def init_pipeline():
+            pipeline = PredictPipeline(registry=ModelRegistry(registry_config), forecast_cache=ForecastCache(),
+                                       forecast_store=forecast_store)
+            pipeline.registry.warm_up()
+            return pipeline
+
+        stats, pipeline = measure(init_pipeline)
+        if 'predict_init' in stages:
+            self.record('predict_init', stats)
+
+        features = CustomData(periods=config.periods).get_data_as_data_frame()
+        if 'predict' in stages:
+            def predict_uncached():
+                pipeline.forecast_cache.clear()
+                return pipeline.predict(features)
+
+            stats, _ = measure(predict_uncached, config.periods, unit='days', repeats=config.repeats)
+            self.record('predict', stats)
+            stats, _ = measure(lambda: pipeline.predict(features), config.periods, unit='days', repeats=config.repeats)
+            self.record('predict_cached', stats)
+
+        if 'predict_materialized' in stages:
+            # Lookups into the forecasts the training pipeline would materialize
+            pipeline.materialize(forecast_store.config.horizon_days)
+            stats, _ = measure(lambda: pipeline.predict(features), config.periods, unit='days', repeats=config.repeats)
+            self.record('predict_materialized', stats)
+
+        if 'predict_route' in stages:
+            import app as app_module
+            # Serve the benchmark model instead of the one in artifacts/
+            app_module.model_registry = pipeline.registry
+            client = app_module.app.test_client()
+
+            def post():
+                response = client.post('/predictdata', data={'periods': str(config.periods)})
+                if response.status_code != 200 or b'class="error-message"' in response.data:
+                    raise CustomException(f"/predictdata failed with status {response.status_code}", sys)
+                return response
+
+            stats, _ = measure(post, 1, unit='requests', repeats=config.repeats)
+            self.record('predict_route', stats)
+
+    def report(self):
+        return {
+            'meta': {
+                'commit': git_commit(),
+                'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'cpu_count': os.cpu_count(),
+                'config': dataclasses.asdict(self.config)
+            },
+            'stages': self.results
+        }
+
+def compare_reports(current, baseline, threshold=0.2):
+    '''
+    Returns one row per stage present in both reports with the baseline
+    and current median seconds, their ratio, and whether the stage got
+    slower by more than threshold.
+    '''
+    rows = []
+    for stage, stats in current['stages'].items():
+        previous = baseline['stages'].get(stage)
+        if previous is None:
+            continue
+        ratio = stats['seconds'] / previous['seconds'] if previous['seconds'] else float('inf')
+        rows.append({
+            'stage': stage,
+            'baseline_seconds': previous['seconds'],
+            'seconds': stats['seconds'],
+            'ratio': round(ratio, 3),
+            'regression': ratio > 1 + threshold
+        })
+    return rows
+
+def format_table(report, comparison=None):
+    lines = [f"{'stage':<22}{'median s':>12}{'p95 s':>12}{'throughput':>22}{'peak RSS MB':>14}"]
+    for stage, stats in report['stages'].items():
+        throughput = f"{stats['throughput']:,.1f} {stats['unit']}/s" if stats.get('throughput') else '-'
+        lines.append(f"{stage:<22}{stats['seconds']:>12.4f}{stats['p95_seconds']:>12.4f}"
+                     f"{throughput:>22}{stats['peak_rss_mb']:>14.1f}")
+    if comparison:
+        lines.append("")
+        lines.append(f"{'stage':<22}{'baseline s':>12}{'current s':>12}{'ratio':>8}")
+        for row in comparison:
+            flag = '  REGRESSION' if row['regression'] else ''
+            lines.append(f"{row['stage']:<22}{row['baseline_seconds']:>12.4f}{row['seconds']:>12.4f}"
+                         f"{row['ratio']:>8.2f}{flag}")
+    return "\n".join(lines)
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the forecasting pipeline on synthetic data.")
+    parser.add_argument("--restaurants", type=int, default=50, help="Number of synthetic restaurants.")
+    parser.add_argument("--days", type=int, default=365, help="Number of synthetic days.")
+    parser.add_argument("--rows-per-day", type=float, default=1.0,
+                        help="Average menu items sold per restaurant and day.")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--stages", default=",".join(STAGES),
+                        help=f"Comma-separated stages to report, from {', '.join(STAGES)}.")
+    parser.add_argument("--tuning-trials", type=int, default=6,
+                        help="Random-search candidates in the tuning stage (0 = full grid).")
+    parser.add_argument("--n-jobs", type=int, default=1, help="Worker processes for the tuning stage.")
+    parser.add_argument("--repeats", type=int, default=20, help="Repetitions of the predict stages.")
+    parser.add_argument("--output", default=None,
+                        help="Where to save the JSON report (default: artifacts/benchmarks/<commit>.json).")
+    parser.add_argument("--compare", default=None, help="Baseline JSON report to compare against.")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="Relative slowdown that counts as a regression.")
+    parser.add_argument("--fail-on-regression", action="store_true",
+                        help="Exit with status 1 if any stage regressed.")
+    return parser.parse_args(argv)
+
+if __name__ == "__main__":
+    args = parse_args()
+    try:
+        config = BenchmarkConfig(
+            data=SyntheticDataConfig(
+                n_restaurants=args.restaurants,
+                n_days=args.days,
+                rows_per_restaurant_day=args.rows_per_day,
+                seed=args.seed
+            ),
+            stages=[stage.strip() for stage in args.stages.split(',') if stage.strip()],
+            tuning_trials=args.tuning_trials,
+            n_jobs=args.n_jobs,
+            repeats=args.repeats
+        )
+        runner = BenchmarkRunner(config)
+        runner.run()
+        report = runner.report()
+
+        output = args.output or os.path.join('artifacts', 'benchmarks', f"{report['meta']['commit'] or 'latest'}.json")
+        os.makedirs(os.path.dirname(output), exist_ok=True)
+        with open(output, 'w', encoding='utf-8') as file_obj:
+            json.dump(report, file_obj, indent=2)
+
+        comparison = None
+        if args.compare:
+            with open(args.compare, 'r', encoding='utf-8') as file_obj:
+                comparison = compare_reports(report, json.load(file_obj), args.threshold)
+
+        print(format_table(report, comparison))
+        print(f"\nReport saved to {output}")
+        if args.fail_on_regression and comparison and any(row['regression'] for row in comparison):
+            sys.exit(1)
+    except Exception as e:
+        logging.critical(f"Benchmark failed: {e}")
+        sys.exit(1)
@@ -0,0 +1,146 @@
+import os
+import sys
+import numpy as np
+import pandas as pd
+from dataclasses import dataclass
+
+from src.exception import CustomException
+from src.logger import logging
+
+# (menu_item_name, meal_type, key_ingredients_tags, typical_ingredient_cost, observed_market_price, mean quantity)
+# taken from notebooks/dataset/restaurant_sales_data.csv
+MENU_ITEMS = [
+    ('Beef Rendang', 'Dinner', 'beef, coconut milk, galangal, lemongrass, spices, chili', 9.0, 28.25, 105),
+    ('Cendol', 'Lunch', 'rice flour jelly, coconut milk, palm sugar, red beans', 2.0, 5.12, 249),
+    ('Char Kway Teow', 'Dinner', 'flat rice noodles, prawns, cockles, bean sprouts, chives, soy sauce', 5.0, 12.48, 170),
+    ('Chicken Chop', 'Lunch', 'chicken thigh, black pepper sauce, fries, coleslaw', 8.0, 30.73, 158),
+    ('Chicken Rice', 'Dinner', 'chicken, rice, ginger, garlic, chili sauce, cucumber', 4.0, 9.84, 233),
+    ('Iced Lemon Tea', 'Lunch', 'black tea, lemon, sugar syrup', 1.2, 4.62, 347),
+    ('Kaya Toast Set', 'Breakfast', 'white bread, kaya, butter, soft-boiled eggs', 2.8, 7.27, 437),
+    ('Laksa', 'Lunch', 'rice noodles, fish broth, tamarind, shrimp paste, cucumber, mint', 4.5, 10.83, 199),
+    ('Mushroom Soup', 'Dinner', 'mushrooms, cream, onion, garlic, vegetable broth', 3.5, 13.39, 104),
+    ('Nasi Lemak', 'Breakfast', 'rice, coconut milk, sambal, anchovies, egg, peanuts', 2.5, 7.9, 344),
+    ('Roti Canai', 'Dinner', 'flour, ghee, egg, water, curry', 0.8, 1.8, 405),
+    ('Spaghetti Carbonara', 'Dinner', 'spaghetti, eggs, cheese, beef bacon, black pepper', 9.0, 33.94, 135),
+    ('Tandoori Chicken', 'Dinner', 'chicken, yogurt, tandoori masala, ginger, garlic', 7.0, 15.96, 125),
+    ('Teh Tarik', 'Dinner', 'black tea, condensed milk, evaporated milk', 0.9, 2.31, 560)
+]
+
+# restaurant_type -> (share of restaurants, price markup over the market price)
+RESTAURANT_TYPES = {
+    'Food Stall': (0.44, 0.95),
+    'Casual Dining': (0.24, 1.15),
+    'Fine Dining': (0.16, 1.9),
+    'Cafe': (0.14, 1.1),
+    'Kopitiam': (0.02, 1.0)
+}
+
+WEATHER = (['Sunny', 'Cloudy', 'Rainy'], [0.495, 0.3045, 0.2005])
+
+COLUMNS = [
+    'date', 'restaurant_id', 'restaurant_type', 'menu_item_name', 'meal_type', 'key_ingredients_tags',
+    'typical_ingredient_cost', 'observed_market_price', 'actual_selling_price', 'quantity_sold',
+    'has_promotion', 'special_event', 'weather_condition'
+]
+
+@dataclass
+class SyntheticDataConfig:
+    n_restaurants: int = 50
+    n_days: int = 365
+    # Average number of menu items sold per restaurant and day
+    rows_per_restaurant_day: float = 1.0
+    start_date: str = '2024-01-01'
+    promotion_rate: float = 0.15
+    special_event_rate: float = 0.05
+    seed: int = 42
+    # Days generated and written at a time; bounds memory for large datasets
+    days_per_chunk: int = 90
+
+def format_dates(dates):
+    '''Formats dates like the source data (e.g. 1/31/2024), once per distinct date.'''
+    return np.array([f"{d.month}/{d.day}/{d.year}" for d in dates], dtype=object)
+
+def generate_sales_chunk(config, restaurant_types, day_offsets, rng):
+    '''
+    Generates the sales rows of every restaurant on the given days.
+    Quantities follow the item's mean with a weekend lift, a yearly cycle,
+    promotion and event effects and lognormal noise, as seen in the EDA.
+    '''
+    n_restaurants = len(restaurant_types)
+    counts = rng.poisson(config.rows_per_restaurant_day, size=(len(day_offsets), n_restaurants))
+    day_idx, restaurant_idx = np.nonzero(counts)
+    repeats = counts[day_idx, restaurant_idx]
+    day_idx = np.repeat(day_idx, repeats)
+    restaurant_idx = np.repeat(restaurant_idx, repeats)
+    n_rows = len(day_idx)
+
+    dates = pd.Timestamp(config.start_date) + pd.to_timedelta(day_offsets, unit='D')
+    item_idx = rng.integers(0, len(MENU_ITEMS), size=n_rows)
+    items = list(zip(*MENU_ITEMS))
+    names, meals, tags = (np.array(col, dtype=object) for col in items[:3])
+    cost, market, mean_quantity = (np.array(col, dtype=float) for col in items[3:])
+
+    types = restaurant_types[restaurant_idx]
+    markup = np.array([RESTAURANT_TYPES[t][1] for t in RESTAURANT_TYPES])[
+        pd.Categorical(types, categories=list(RESTAURANT_TYPES)).codes
+    ]
+    has_promotion = rng.random(n_rows) < config.promotion_rate
+    special_event = rng.random(n_rows) < config.special_event_rate
+
+    weekday = dates.dayofweek.to_numpy()[day_idx]
+    day_of_year = dates.dayofyear.to_numpy()[day_idx]
+    quantity = (
+        mean_quantity[item_idx]
+        * np.where(weekday >= 5, 1.45, 1.0)
+        * (1 + 0.1 * np.sin(2 * np.pi * day_of_year / 365.25))
+        * np.where(has_promotion, 1.9, 1.0)
+        * np.where(special_event, 1.3, 1.0)
+        * rng.lognormal(0.0, 0.35, size=n_rows)
+    )
+    market_price = market[item_idx] * rng.uniform(0.9, 1.1, size=n_rows)
+
+    return pd.DataFrame({
+        'date': format_dates(dates)[day_idx],
+        'restaurant_id': restaurant_idx + 1,
+        'restaurant_type': types,
+        'menu_item_name': names[item_idx],
+        'meal_type': meals[item_idx],
+        'key_ingredients_tags': tags[item_idx],
+        'typical_ingredient_cost': cost[item_idx],
+        'observed_market_price': market_price.round(2),
+        'actual_selling_price': (market_price * markup * rng.uniform(0.95, 1.2, size=n_rows)).round(2),
+        'quantity_sold': np.round(quantity).astype(np.int64),
+        'has_promotion': np.where(has_promotion, 'TRUE', 'FALSE'),
+        'special_event': np.where(special_event, 'TRUE', 'FALSE'),
+        'weather_condition': rng.choice(WEATHER[0], p=WEATHER[1], size=n_rows)
+    }, columns=COLUMNS)
+
+def write_sales_data(config: SyntheticDataConfig, file_path):
+    '''
+    Writes a synthetic dataset with the schema of restaurant_sales_data.csv,
+    for config.n_restaurants restaurants over config.n_days days, in chunks
+    of days. The same config always produces the same file. Returns the
+    number of rows written.
+    '''
+    try:
+        rng = np.random.default_rng(config.seed)
+        type_names = list(RESTAURANT_TYPES)
+        shares = np.array([RESTAURANT_TYPES[t][0] for t in type_names])
+        restaurant_types = rng.choice(np.array(type_names, dtype=object), p=shares / shares.sum(),
+                                      size=config.n_restaurants)
+
+        os.makedirs(os.path.dirname(file_path) or '.', exist_ok=True)
+        n_rows = 0
+        with open(file_path, 'w', encoding='utf-8', newline='') as file_obj:
+            for start in range(0, config.n_days, config.days_per_chunk):
+                day_offsets = np.arange(start, min(start + config.days_per_chunk, config.n_days))
+                chunk = generate_sales_chunk(config, restaurant_types, day_offsets, rng)
+                chunk.to_csv(file_obj, header=(start == 0), index=False)
+                n_rows += len(chunk)
+
+        logging.info(f"Wrote {n_rows} synthetic sales rows ({config.n_restaurants} restaurants x "
+                     f"{config.n_days} days) to {file_path}")
+        return n_rows
+
+    except Exception as e:
+        raise CustomException(e, sys)
@@ -0,0 +1,342 @@
+import os
+import sys
+import json
+import time
+import argparse
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import contextmanager
+from dataclasses import dataclass
+
+from src.exception import CustomException
+from src.logger import logging
+from src.metrics import metrics, span, tracer
+from src.utils import FrameWriter, artifact_path, load_frame
+from src.components.outlier_detection import TOTAL_SEGMENT
+
+METRIC_COLUMNS = ['mape', 'smape', 'mae', 'coverage']
+
+@dataclass
+class BacktestConfig:
+    horizon_days: int = 30
+    period_days: int = 30
+    # History before the first cutoff (None = 74% of the calendar, as in tuning)
+    initial_days: int = None
+    # Worker processes for the (model, series, cutoff) folds (0 = one per CPU core)
+    n_jobs: int = 1
+    # Folds of series with fewer training rows at their cutoff are skipped
+    min_train_rows: int = 60
+    # Posterior samples for the intervals scored by coverage (0 = skip, coverage is NaN)
+    uncertainty_samples: int = 200
+    results_path: str = os.path.join('artifacts', 'backtests', 'backtest_results.parquet')
+    # Folds are appended to results_path in batches of this many
+    flush_every: int = 50
+
+def walk_forward_cutoffs(dates, horizon_days, period_days, initial_days=None):
+    '''
+    Cutoffs of a walk-forward backtest over a calendar, computed once and
+    shared by every model and series: the last is horizon_days before the
+    end and each earlier one period_days before the next, as long as
+    initial_days of history remain before it.
+    '''
+    dates = pd.to_datetime(pd.Series(dates)).drop_duplicates().sort_values()
+    first, last = dates.iloc[0], dates.iloc[-1]
+    if initial_days is None:
+        initial_days = int(((last - first).days + 1) * 0.74)
+    cutoff = last - pd.Timedelta(days=horizon_days)
+    cutoffs = []
+    while cutoff >= first + pd.Timedelta(days=initial_days):
+        cutoffs.append(cutoff)
+        cutoff -= pd.Timedelta(days=period_days)
+    if not cutoffs:
+        raise ValueError(f"Not enough history for a backtest: {(last - first).days + 1} days for "
+                         f"{initial_days} initial and {horizon_days} horizon days")
+    return sorted(cutoffs)
+
+class SeriesWindows:
+    '''
+    Every series of a long frame as flat arrays sorted by (series, ds).
+    A fold's training and test windows are contiguous slices of them,
+    located with searchsorted, so folds are described by three offsets and
+    no data is copied until a window is handed to a model. Regressor
+    columns, if any, are carried along as one (rows, regressors) array.
+    '''
+    def __init__(self, df, segment_col=None, regressor_cols=()):
+        segments = df[segment_col] if segment_col else pd.Series(TOTAL_SEGMENT, index=df.index)
+        codes, self.names = pd.factorize(segments, sort=True)
+        ds = pd.to_datetime(df['ds']).to_numpy(dtype='datetime64[ns]')
+        order = np.lexsort((ds, codes))
+        self.ds = ds[order]
+        self.y = df['y'].to_numpy(dtype=np.float64)[order]
+        self.regressor_cols = list(regressor_cols)
+        self.regressors = df[self.regressor_cols].to_numpy(dtype=np.float64)[order]
+        bounds = np.searchsorted(codes[order], np.arange(len(self.names) + 1))
+        self.starts, self.stops = bounds[:-1], bounds[1:]
+
+    def __len__(self):
+        return len(self.names)
+
+    def fold(self, series, cutoff, horizon):
+        '''Returns (start, split, stop): train rows are [start, split), test rows [split, stop).'''
+        start, stop = self.starts[series], self.stops[series]
+        ds = self.ds[start:stop]
+        split = start + np.searchsorted(ds, np.datetime64(cutoff, 'ns'), side='right')
+        end = start + np.searchsorted(ds, np.datetime64(cutoff + horizon, 'ns'), side='right')
+        return start, split, end
+
+    def frame(self, start, stop):
+        frame = pd.DataFrame({'ds': self.ds[start:stop], 'y': self.y[start:stop]})
+        for i, col in enumerate(self.regressor_cols):
+            frame[col] = self.regressors[start:stop, i]
+        return frame
+
+def fold_metrics(y, yhat, lower=None, upper=None):
+    '''MAPE and sMAPE (as fractions, like Prophet's cross-validation), MAE and interval coverage.'''
+    error = np.abs(y - yhat)
+    nonzero = y != 0
+    with np.errstate(divide='ignore', invalid='ignore'):
+        smape_terms = 2 * error / (np.abs(y) + np.abs(yhat))
+    return {
+        'mape': float(np.mean(error[nonzero] / np.abs(y[nonzero]))) if nonzero.any() else np.nan,
+        'smape': float(np.nanmean(smape_terms)) if len(y) else np.nan,
+        'mae': float(np.mean(error)),
+        'coverage': float(np.mean((y >= lower) & (y <= upper))) if lower is not None else np.nan
+    }
+
+def run_fold(windows, holidays_df, uncertainty_samples, task):
+    '''Fits one model on one training window and scores it on the following horizon.'''
+    # Imported here so the module can be used for its helpers without Prophet
+    from src.components.model_trainer import build_prophet
+
+    model_idx, params, series, cutoff, start, split, stop = task
+    row = {'model': model_idx, 'segment': windows.names[series], 'cutoff': cutoff,
+           'n_train': int(split - start), 'n_test': int(stop - split)}
+    start_time = time.time()
+    try:
+        m = build_prophet(params, holidays_df, windows.regressor_cols)
+        m.uncertainty_samples = uncertainty_samples
+        with span('prophet_fit', cutoff=str(cutoff.date()), segment=row['segment']):
+            m.fit(windows.frame(start, split))
+        test = windows.frame(split, stop)
+        forecast = m.predict(test.drop(columns='y'))
+        has_intervals = uncertainty_samples > 0
+        row.update(fold_metrics(
+            test['y'].to_numpy(), forecast['yhat'].to_numpy(),
+            forecast['yhat_lower'].to_numpy() if has_intervals else None,
+            forecast['yhat_upper'].to_numpy() if has_intervals else None
+        ))
+    except Exception as e:
+        row['error'] = str(e)
+    row['seconds'] = time.time() - start_time
+    return row
+
+# Backtest data shared with pool workers once, instead of pickling it per task
+_worker_state = {}
+
+def _init_backtest_worker(windows, holidays_df, uncertainty_samples):
+    from src.components.model_trainer import silence_prophet_logs
+
+    silence_prophet_logs()
+    _worker_state.update(windows=windows, holidays_df=holidays_df, uncertainty_samples=uncertainty_samples)
+
+def _run_fold_in_worker(task):
+    with tracer.collect() as spans:
+        row = run_fold(_worker_state['windows'], _worker_state['holidays_df'], _worker_state['uncertainty_samples'], task)
+    row['spans'] = spans
+    return row
+
+class BacktestSession:
+    '''
+    The series of one dataset, ready to backtest any number of models on:
+    serially, or on a process pool that received the data once when the
+    session was opened.
+    '''
+    def __init__(self, config, windows, holidays_df=None, executor=None):
+        self.config = config
+        self.windows = windows
+        self.holidays_df = holidays_df
+        self.executor = executor
+
+    def tasks(self, models, cutoffs):
+        '''One (model index, params, series, cutoff, start, split, stop) task per fold with enough data.'''
+        horizon = pd.Timedelta(days=self.config.horizon_days)
+        tasks = []
+        for model_idx, params in enumerate(models):
+            for series in range(len(self.windows)):
+                for cutoff in cutoffs:
+                    start, split, stop = self.windows.fold(series, cutoff, horizon)
+                    if split - start >= self.config.min_train_rows and stop > split:
+                        tasks.append((model_idx, params, series, cutoff, start, split, stop))
+        return tasks
+
+    def iter_folds(self, models, cutoffs, tasks=None):
+        '''
+        Yields one row per fold as it completes (in any order): the model
+        index, segment, cutoff, window sizes, METRIC_COLUMNS and seconds,
+        or 'error' if the fit failed.
+        '''
+        tasks = self.tasks(models, cutoffs) if tasks is None else tasks
+        logging.info(f"Backtesting {len(models)} models on {len(self.windows)} series x {len(cutoffs)} cutoffs: "
+                     f"{len(tasks)} folds")
+        if self.executor is None:
+            for task in tasks:
+                yield run_fold(self.windows, self.holidays_df, self.config.uncertainty_samples, task)
+            return
+
+        futures = [self.executor.submit(_run_fold_in_worker, task) for task in tasks]
+        try:
+            for future in as_completed(futures):
+                row = future.result()
+                tracer.add_events(row.pop('spans', []))
+                yield row
+        finally:
+            # Drops the folds not started yet if the caller stopped early
+            for future in futures:
+                future.cancel()
+
+class Backtester:
+    '''
+    Walk-forward backtests of one or more Prophet hyperparameter sets over
+    one or many series. The cutoffs are computed once; every (model,
+    series, cutoff) fold is an independent task, fanned out over a process
+    pool that receives the data once at startup. Folds are yielded as they
+    complete and streamed to a results table.
+    '''
+    def __init__(self, config: BacktestConfig = None):
+        self.config = config or BacktestConfig()
+
+    @contextmanager
+    def session(self, df, segment_col=None, holidays_df=None, regressor_cols=()):
+        '''
+        Yields a BacktestSession over the series of df, with its pool kept
+        open until the block ends. The models are fitted with regressor_cols
+        of df as extra regressors.
+        '''
+        windows = SeriesWindows(df, segment_col, regressor_cols)
+        n_jobs = self.config.n_jobs if self.config.n_jobs and self.config.n_jobs > 0 else (os.cpu_count() or 1)
+        if n_jobs == 1:
+            from src.components.model_trainer import silence_prophet_logs
+
+            silence_prophet_logs()
+            yield BacktestSession(self.config, windows, holidays_df)
+            return
+
+        with ProcessPoolExecutor(
+            max_workers=n_jobs,
+            initializer=_init_backtest_worker,
+            initargs=(windows, holidays_df, self.config.uncertainty_samples)
+        ) as executor:
+            try:
+                yield BacktestSession(self.config, windows, holidays_df, executor)
+            except BaseException:
+                # Don't wait for the queued folds of an aborted backtest
+                executor.shutdown(wait=False, cancel_futures=True)
+                raise
+
+    def iter_folds(self, df, models, segment_col=None, holidays_df=None, cutoffs=None):
+        '''Backtests models on the series of df, see BacktestSession.iter_folds.'''
+        config = self.config
+        if cutoffs is None:
+            cutoffs = walk_forward_cutoffs(df['ds'], config.horizon_days, config.period_days, config.initial_days)
+        with self.session(df, segment_col, holidays_df) as session:
+            yield from session.iter_folds(models, cutoffs)
+
+    def run(self, df, models, segment_col=None, holidays_df=None, cutoffs=None, on_fold=None):
+        '''
+        Runs the backtest, appending the folds to config.results_path as
+        they come in, and returns them as a dataframe sorted by model,
+        segment and cutoff. on_fold is called with every fold row.
+        '''
+        try:
+            results_path = self.config.results_path
+            tmp_path = None
+            writer = None
+            if results_path:
+                tmp_path = results_path + '.tmp' + os.path.splitext(results_path)[1]
+                writer = FrameWriter(tmp_path)
+            rows, batch = [], []
+            with span('backtest', n_models=len(models)):
+                for row in self.iter_folds(df, models, segment_col, holidays_df, cutoffs):
+                    metrics.inc('backtest_folds_total', status='error' if 'error' in row else 'ok')
+                    rows.append(row)
+                    batch.append(row)
+                    if on_fold is not None:
+                        on_fold(row)
+                    if writer is not None and len(batch) >= self.config.flush_every:
+                        writer.write(self.to_frame(batch))
+                        batch = []
+            if writer is not None:
+                if batch or writer.rows_written == 0:
+                    writer.write(self.to_frame(batch))
+                writer.close()
+                os.replace(tmp_path, results_path)
+                logging.info(f"Wrote {len(rows)} backtest folds to {results_path}")
+            return self.to_frame(rows).sort_values(['model', 'segment', 'cutoff'], kind='stable').reset_index(drop=True)
+
+        except Exception as e:
+            raise CustomException(e, sys)
+
+    @staticmethod
+    def to_frame(rows):
+        columns = ['model', 'segment', 'cutoff', 'n_train', 'n_test'] + METRIC_COLUMNS + ['seconds', 'error']
+        # String dtypes, so a first batch without errors fixes a string column for later batches
+        return pd.DataFrame(rows).reindex(columns=columns).astype({'error': 'string', 'segment': 'string'})
+
+def summarize(results, by=('model',)):
+    '''Mean fold metrics per group, with the number of folds and failed folds.'''
+    grouped = results.groupby(list(by), sort=True)
+    summary = grouped[METRIC_COLUMNS].mean()
+    summary['n_folds'] = grouped.size()
+    summary['n_errors'] = grouped['error'].count()
+    return summary.reset_index()
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Walk-forward backtest report of the forecasting models.")
+    parser.add_argument("--data", default=artifact_path('segments_train_cleaned'),
+                        help="Long frame with ds, y and optionally segment, e.g. the fleet pipeline's cleaned data.")
+    parser.add_argument("--params", default=None,
+                        help="JSON file with the Prophet params to backtest (default: artifacts/best_params.json "
+                             "if it exists and holds Prophet params, else the fleet defaults).")
+    parser.add_argument("--n-jobs", type=int, default=0, help="Worker processes (0 = one per CPU core).")
+    parser.add_argument("--horizon", type=int, default=30, help="Forecast horizon in days.")
+    parser.add_argument("--period", type=int, default=30, help="Days between cutoffs.")
+    parser.add_argument("--initial", type=int, default=None, help="Days of history before the first cutoff.")
+    parser.add_argument("--output", default=os.path.join('artifacts', 'backtests', 'report'),
+                        help="Prefix of the folds (<output>_folds.parquet) and summary (<output>_summary.csv) files.")
+    return parser.parse_args(argv)
+
+if __name__ == "__main__":
+    args = parse_args()
+    try:
+        from src.components.fleet_trainer import DEFAULT_SEGMENT_PARAMS
+
+        params_path = args.params or os.path.join('artifacts', 'best_params.json')
+        params = dict(DEFAULT_SEGMENT_PARAMS)
+        if os.path.exists(params_path):
+            with open(params_path, 'r', encoding='utf-8') as file_obj:
+                saved = json.load(file_obj)
+            saved = saved.get('params', saved)
+            # e.g. the gbm backend's params after a --backend gbm training run
+            if set(saved) != set(DEFAULT_SEGMENT_PARAMS):
+                message = f"{params_path} does not hold Prophet params ({sorted(saved)})"
+                if args.params:
+                    raise ValueError(f"{message}, expected {sorted(DEFAULT_SEGMENT_PARAMS)}")
+                logging.warning(f"{message}, backtesting the default Prophet params instead")
+                print(f"Warning: {message}, backtesting the default Prophet params instead.")
+            else:
+                params = saved
+
+        df = load_frame(args.data)
+        backtester = Backtester(BacktestConfig(
+            horizon_days=args.horizon, period_days=args.period, initial_days=args.initial,
+            n_jobs=args.n_jobs, results_path=args.output + '_folds.parquet'
+        ))
+        results = backtester.run(df, [params], segment_col='segment' if 'segment' in df else None)
+        summary = summarize(results, by=['segment'])
+        summary.to_csv(args.output + '_summary.csv', index=False)
+        logging.info(f"Backtest report of {len(summary)} series saved to {args.output}_summary.csv")
+        print(summary.to_string(index=False))
+    except Exception as e:
+        logging.critical(f"Backtest failed: {e}")
+        sys.exit(1)
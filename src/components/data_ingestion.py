@@ -1,44 +1,142 @@
 import os
 import sys
+import glob
 from src.exception import CustomException
 from src.logger import logging
+from src.utils import artifact_path, save_frame, FrameWriter
+from src.components.regressor_store import (
+    RegressorStore, RegressorStoreConfig, SOURCE_COLUMNS, TOTAL_TABLE, SEGMENT_TABLE, regressor_sums, daily_regressors
+)
 import pandas as pd
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 
 @dataclass
 class DataIngestionConfig:
-    train_data_path: str = os.path.join('artifacts', 'train.csv')
-    test_data_path: str = os.path.join('artifacts', 'test.csv')
-    raw_data_path: str = os.path.join('artifacts', 'data.csv')
+    # A file, a glob pattern or a comma-separated list of either
+    source_data_path: str = os.path.join('notebooks', 'dataset', 'restaurant_sales_data.csv')
+    train_data_path: str = artifact_path('train')
+    test_data_path: str = artifact_path('test')
+    raw_data_path: str = artifact_path('data')
+    segment_train_data_path: str = artifact_path('segments_train')
+    segment_test_data_path: str = artifact_path('segments_test')
+    # Bottom series of the hierarchy (see src.components.hierarchy)
+    hierarchy_train_data_path: str = artifact_path('hierarchy_train')
+    hierarchy_test_data_path: str = artifact_path('hierarchy_test')
+    test_size: int = 30
+    # Rows read from the source files at a time; bounds peak memory
+    chunksize: int = 100_000
+    # None lets pandas infer the format of the 'date' column
+    date_format: str = None
+    # Also stream a copy of every source column to raw_data_path. This reads
+    # all 13 columns instead of only the ones the aggregation needs.
+    save_raw_copy: bool = False
+    # Daily promotion, event, weather and price regressors, built alongside the sales
+    regressor_store: RegressorStoreConfig = field(default_factory=RegressorStoreConfig)
+
+def segment_key(values):
+    '''
+    Returns the string key of a segment from its grouping values,
+    e.g. ('Casual Dining', 'Laksa') -> 'Casual Dining|Laksa'.
+    '''
+    if not isinstance(values, (tuple, list)):
+        values = (values,)
+    return '|'.join(str(v) for v in values)
+
+def resolve_source_paths(source):
+    '''
+    Expands a file, glob pattern or comma-separated list of them into the
+    sorted list of matching files.
+    '''
+    paths = []
+    for pattern in str(source).split(','):
+        pattern = pattern.strip()
+        matches = sorted(glob.glob(pattern)) if glob.has_magic(pattern) else [pattern]
+        paths.extend(path for path in matches if path not in paths)
+    if not paths or not all(os.path.isfile(path) for path in paths):
+        raise FileNotFoundError(f"No source data files found for '{source}'")
+    return paths
 
 class DataIngestion:
     def __init__(self):
         self.ingestion_config = DataIngestionConfig()
 
+    def aggregate_source(self, group_keys=()):
+        '''
+        Streams the source files in chunks and returns the daily sum of
+        quantity_sold per date (and group_keys), as columns 'ds', *group_keys, 'y',
+        and the daily regressors of the same groups (see daily_regressors).
+
+        Only the needed columns are read, as categoricals, and every chunk is
+        reduced to its partial sums right away, so peak memory is bounded by
+        chunksize and the number of distinct groups, not by the file size.
+        Dates are parsed once per distinct value at the end.
+        '''
+        config = self.ingestion_config
+        group_keys = list(group_keys)
+        keys = ['date'] + group_keys
+        paths = resolve_source_paths(config.source_data_path)
+        # The regressors are derived from whichever of their columns the source has
+        header = pd.read_csv(paths[0], nrows=0).columns
+        source_columns = [col for col in SOURCE_COLUMNS if col in header]
+        usecols = None if config.save_raw_copy else keys + ['quantity_sold'] + source_columns
+        dtypes = {key: 'category' for key in keys + ['has_promotion', 'special_event', 'weather_condition']}
+        dtypes['quantity_sold'] = 'float64'
+
+        partials = []
+        n_rows = 0
+        raw_writer = FrameWriter(config.raw_data_path) if config.save_raw_copy else None
+        try:
+            for path in paths:
+                logging.info(f"Streaming {path} in chunks of {config.chunksize} rows")
+                for chunk in pd.read_csv(path, usecols=usecols, dtype=dtypes, chunksize=config.chunksize):
+                    n_rows += len(chunk)
+                    if raw_writer is not None:
+                        raw_writer.write(chunk)
+                    sums = regressor_sums(chunk[source_columns]).assign(quantity_sold=chunk['quantity_sold'])
+                    partial = sums.groupby([chunk[key] for key in keys], observed=True, sort=False).sum()
+                    partials.append(partial.reset_index())
+                    if len(partials) >= 32:
+                        # Fold partial sums together to keep the list short
+                        partials = [pd.concat(partials).groupby(keys, sort=False).sum().reset_index()]
+        finally:
+            if raw_writer is not None:
+                raw_writer.close()
+
+        if not partials:
+            raise CustomException("The source data is empty", sys)
+
+        df = pd.concat(partials, ignore_index=True)
+        for key in keys:
+            df[key] = df[key].astype(object)
+        # Weather conditions missing from a chunk are NaN there, which sum() skips
+        df = df.groupby(keys, sort=False).sum().reset_index()
+        logging.info(f"Aggregated {n_rows} source rows into {len(df)} daily rows")
+
+        ## Fix the date conversion, once per distinct date string
+        unique_dates = pd.Index(df['date'].unique())
+        parsed = pd.Series(pd.to_datetime(unique_dates, format=config.date_format), index=unique_dates)
+        df['date'] = df['date'].map(parsed)
+
+        # Renaming columns to 'ds' and 'y' for Prophet
+        df = df.rename(columns={'date': 'ds', 'quantity_sold': 'y'})
+        df = df.groupby(['ds'] + group_keys).sum().reset_index()
+        return df[['ds'] + group_keys + ['y']], daily_regressors(df, ['ds'] + group_keys)
+
     def initiate_data_ingestion(self):
         logging.info("Entered the data ingestion method")
         try:
-            df = pd.read_csv('notebooks/dataset/restaurant_sales_data.csv')
-            logging.info("Read the dataset as dataframe")
-
             os.makedirs(os.path.dirname(self.ingestion_config.train_data_path), exist_ok=True)
 
-            df.to_csv(self.ingestion_config.raw_data_path, index=False)
-
             ## Basic preprocessing steps must be done here
             logging.info("Basic preprocessing initiated")
-            ## Fix the date conversion
-            df['date'] = pd.to_datetime(df['date'])
-            df['date'] = pd.to_datetime(df['date'], format='%Y-%m-%d')
             ## Aggregate sales by date
-            df = df.groupby('date')['quantity_sold'].sum().reset_index()
-            # Renaming columns to 'ds' and 'y' for Prophet
-            df = df.rename(columns={'date': 'ds', 'quantity_sold': 'y'}) 
+            df, regressors = self.aggregate_source()
+            RegressorStore(self.ingestion_config.regressor_store).build(TOTAL_TABLE, regressors)
             logging.info("Basic preprocessing done")
-            
+
             logging.info("Train test split initiated")
             # Time series split: Use last 30 days for test
-            test_size = 30
+            test_size = self.ingestion_config.test_size
             if len(df) <= test_size:
                 raise CustomException(f"Not enough data for test split. Need > {test_size} rows, but got {len(df)}", sys)
 
@@ -46,8 +144,8 @@ class DataIngestion:
             test_set = df.iloc[-test_size:]
 
             # saving the train and test files
-            train_set.to_csv(self.ingestion_config.train_data_path, index=False, header=True)
-            test_set.to_csv(self.ingestion_config.test_data_path, index=False, header=True)
+            save_frame(train_set, self.ingestion_config.train_data_path)
+            save_frame(test_set, self.ingestion_config.test_data_path)
 
             logging.info(f"Train set saved to: {self.ingestion_config.train_data_path}")
             logging.info(f"Test set saved to: {self.ingestion_config.test_data_path}")
@@ -59,3 +157,58 @@ class DataIngestion:
         except Exception as e:
             logging.info("Exception occurred in the data ingestion method")
             raise CustomException(e, sys)
+
+    def initiate_segment_ingestion(self, segment_keys, train_path=None, test_path=None, regressor_table=SEGMENT_TABLE):
+        '''
+        Aggregates daily sales per segment (e.g. restaurant_type, or
+        restaurant_id + menu_item_name) into one long dataframe with a
+        'segment' key column, 'ds' and 'y', and splits it on the calendar:
+        the last test_size days of the dataset go to the test set.
+        The segments' regressors are stored as regressor_table (None = skip).
+        '''
+        logging.info(f"Entered the segment ingestion method (keys: {segment_keys})")
+        try:
+            train_path = train_path or self.ingestion_config.segment_train_data_path
+            test_path = test_path or self.ingestion_config.segment_test_data_path
+            os.makedirs(os.path.dirname(train_path), exist_ok=True)
+
+            df, regressors = self.aggregate_source(segment_keys)
+            df.insert(0, 'segment', [segment_key(v) for v in df[list(segment_keys)].itertuples(index=False)])
+            if regressor_table is not None:
+                regressors.insert(0, 'segment', df['segment'].to_numpy())
+                RegressorStore(self.ingestion_config.regressor_store).build(
+                    regressor_table, regressors.drop(columns=list(segment_keys)), segment_col='segment',
+                    extra={'segment_keys': list(segment_keys)}
+                )
+            df = df.sort_values(['segment', 'ds']).reset_index(drop=True)
+            logging.info(f"Aggregated {df['segment'].nunique()} segments")
+
+            test_size = self.ingestion_config.test_size
+            dates = df['ds'].drop_duplicates().sort_values()
+            if len(dates) <= test_size:
+                raise CustomException(f"Not enough data for test split. Need > {test_size} days, but got {len(dates)}", sys)
+            test_start = dates.iloc[-test_size]
+
+            train_set = df[df['ds'] < test_start]
+            test_set = df[df['ds'] >= test_start]
+
+            save_frame(train_set, train_path)
+            save_frame(test_set, test_path)
+
+            logging.info(f"Segment train set saved to: {train_path}")
+            logging.info(f"Segment test set saved to: {test_path}")
+            return train_path, test_path
+        except Exception as e:
+            logging.info("Exception occurred in the segment ingestion method")
+            raise CustomException(e, sys)
+
+    def initiate_hierarchy_ingestion(self, levels):
+        '''
+        Segment ingestion of the bottom series of a hierarchy, e.g. levels
+        ['restaurant_type', 'restaurant_id', 'menu_item_name']. Their key
+        columns define every aggregate above them.
+        '''
+        config = self.ingestion_config
+        return self.initiate_segment_ingestion(
+            levels, config.hierarchy_train_data_path, config.hierarchy_test_data_path, regressor_table=None
+        )
@@ -1,75 +1,100 @@
-import os
 import sys
-import pandas as pd
-import numpy as np
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 
 from src.exception import CustomException
 from src.logger import logging
-from src.utils import save_object 
+from src.utils import artifact_path, save_frame, load_frame
+from src.components.outlier_detection import OutlierDetectionConfig, OutlierFilter, log_outliers
 
 @dataclass
 class DataTransformationConfig:
-    cleaned_train_data_path: str = os.path.join('artifacts', 'train_cleaned.csv')
-    cleaned_test_data_path: str = os.path.join('artifacts', 'test_cleaned.csv')
+    cleaned_train_data_path: str = artifact_path('train_cleaned')
+    cleaned_test_data_path: str = artifact_path('test_cleaned')
+    # Outlier boundaries fitted on the training data, for serving-time checks
+    outlier_boundaries_path: str = artifact_path('outlier_boundaries')
+    segment_cleaned_train_data_path: str = artifact_path('segments_train_cleaned')
+    segment_cleaned_test_data_path: str = artifact_path('segments_test_cleaned')
+    segment_outlier_boundaries_path: str = artifact_path('segments_outlier_boundaries')
+    outliers: OutlierDetectionConfig = field(default_factory=OutlierDetectionConfig)
 
 class DataTransformation:
-    def __init__(self):
-        self.transformation_config = DataTransformationConfig()
+    def __init__(self, config: DataTransformationConfig = None):
+        self.transformation_config = config or DataTransformationConfig()
+
+    def remove_outliers(self, train_df, test_df, segment_col=None):
+        '''
+        Fits the outlier detectors on the training data only and drops the
+        outliers of both sets, judging the test set by the training
+        boundaries to prevent data leakage. Returns both cleaned frames
+        and the boundaries.
+        '''
+        outlier_filter = OutlierFilter(self.transformation_config.outliers)
+        logging.info(f"Calculating outlier boundaries ({', '.join(outlier_filter.detectors)}) using training data only")
+
+        train_mask, counts, boundaries = outlier_filter.fit(train_df, segment_col)
+        log_outliers("Training data", len(train_df), counts, train_mask)
+        train_df_cleaned = train_df[~train_mask].reset_index(drop=True)
+
+        # Apply the SAME boundaries to the test data
+        test_mask = OutlierFilter.apply(test_df, boundaries, segment_col)
+        log_outliers("Test data", len(test_df), {}, test_mask)
+        test_df_cleaned = test_df[~test_mask].reset_index(drop=True)
+
+        return train_df_cleaned, test_df_cleaned, boundaries
 
     def initiate_data_transformation(self, train_path, test_path):
         '''
         This function applies outlier removal based on
         the training and test sets to prevent data leakage.
-        ''' 
+        '''
         logging.info("Entered data transformation method")
         try:
-            train_df = pd.read_csv(train_path)
-            test_df = pd.read_csv(test_path)
-            
-            logging.info(f"Read train data ({len(train_df)} rows) and test data ({len(test_df)} rows)")
+            config = self.transformation_config
+            train_df = load_frame(train_path)
+            test_df = load_frame(test_path)
 
-            # Outlier Removal using Z-Score 
-            logging.info("Calculating outlier boundaries using training data only")
+            logging.info(f"Read train data ({len(train_df)} rows) and test data ({len(test_df)} rows)")
 
-            # Calculate boundaries (mean/std) from the training data
-            train_y = train_df['y']
-            train_mean = train_y.mean()
-            train_std = train_y.std()
-            threshold = 13.59  # ~95.44% of data
-            
-            logging.info(f"Train data: Mean={train_mean:.2f}, Std={train_std:.2f}, Threshold={threshold}")
+            train_df_cleaned, test_df_cleaned, boundaries = self.remove_outliers(train_df, test_df)
 
-            # Apply boundaries to the training data
-            z_train = np.abs((train_df['y'] - train_mean) / train_std)
-            outlier_index_train = np.where(z_train > threshold)[0]
+            save_frame(train_df_cleaned, config.cleaned_train_data_path)
+            save_frame(test_df_cleaned, config.cleaned_test_data_path)
+            save_frame(boundaries, config.outlier_boundaries_path, export_csv=False)
 
-            logging.info(f"Total training data points: {len(train_df)}")
-            logging.info(f"Dropping {len(outlier_index_train)} training outlier rows (z-score > {threshold})")
-            train_df_cleaned = train_df.drop(train_df.index[outlier_index_train]).reset_index(drop=True)
-            logging.info(f"Remaining training data points: {len(train_df_cleaned)}")
+            logging.info("Data transformation completed. Saved cleaned files to artifacts.")
 
-            # Apply the SAME boundaries to the test data
-            logging.info("Applying same z-score boundaries to test data")
-            # Use train_mean and train_std to prevent data leakage
-            z_test = np.abs((test_df['y'] - train_mean) / train_std) 
-            outlier_index_test = np.where(z_test > threshold)[0]
+            # Return the paths to the new files
+            return (
+                config.cleaned_train_data_path,
+                config.cleaned_test_data_path,
+            )
 
-            logging.info(f"Total test data points: {len(test_df)}")
-            logging.info(f"Dropping {len(outlier_index_test)} test outlier rows (z-score > {threshold})")
-            test_df_cleaned = test_df.drop(test_df.index[outlier_index_test]).reset_index(drop=True) 
-            logging.info(f"Remaining test data points: {len(test_df_cleaned)}") 
+        except Exception as e:
+            raise CustomException(e, sys)
 
+    def initiate_segment_transformation(self, train_path, test_path):
+        '''
+        Outlier removal for the long per-segment frames of the segment
+        ingestion, with boundaries fitted per segment in one pass.
+        '''
+        logging.info("Entered segment transformation method")
+        try:
+            config = self.transformation_config
+            train_df = load_frame(train_path)
+            test_df = load_frame(test_path)
+            logging.info(f"Read {train_df['segment'].nunique()} segments: train data ({len(train_df)} rows) "
+                         f"and test data ({len(test_df)} rows)")
 
-            train_df_cleaned.to_csv(self.transformation_config.cleaned_train_data_path, index=False)
-            test_df_cleaned.to_csv(self.transformation_config.cleaned_test_data_path, index=False) 
+            train_df_cleaned, test_df_cleaned, boundaries = self.remove_outliers(train_df, test_df, segment_col='segment')
 
-            logging.info("Data transformation completed. Saved cleaned files to artifacts.")
+            save_frame(train_df_cleaned, config.segment_cleaned_train_data_path)
+            save_frame(test_df_cleaned, config.segment_cleaned_test_data_path)
+            save_frame(boundaries, config.segment_outlier_boundaries_path, export_csv=False)
 
-            # Return the paths to the new files
+            logging.info("Segment transformation completed. Saved cleaned files to artifacts.")
             return (
-                self.transformation_config.cleaned_train_data_path,
-                self.transformation_config.cleaned_test_data_path, 
+                config.segment_cleaned_train_data_path,
+                config.segment_cleaned_test_data_path
             )
 
         except Exception as e:
@@ -0,0 +1,188 @@
+import os
+import sys
+import json
+import time
+import hashlib
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+
+from src.exception import CustomException
+from src.logger import logging
+from src.metrics import metrics, span, tracer
+from src.utils import mape, frame_fingerprint, load_frame
+from src.components.model_trainer import build_prophet, silence_prophet_logs
+from src.components.segment_store import SegmentModelStore, SegmentStoreConfig, segment_file_name, GLOBAL_MODEL_FILE
+
+# Prophet's own defaults, used unless the caller passes tuned params
+DEFAULT_SEGMENT_PARAMS = {
+    'changepoint_prior_scale': 0.05,
+    'seasonality_prior_scale': 10.0,
+    'holidays_prior_scale': 10.0,
+    'seasonality_mode': 'additive'
+}
+
+@dataclass
+class FleetTrainerConfig:
+    segment_keys: list = field(default_factory=lambda: ['restaurant_type'])
+    params: dict = field(default_factory=lambda: dict(DEFAULT_SEGMENT_PARAMS))
+    # Worker processes for fitting segments (0 = one per CPU core)
+    n_jobs: int = 0
+    # Segments with fewer training days than this are skipped
+    min_train_days: int = 60
+    store: SegmentStoreConfig = field(default_factory=SegmentStoreConfig)
+
+def segment_fingerprint(train_df, params):
+    '''
+    Hash of a segment's training series and params; a segment whose
+    fingerprint is unchanged does not need to be refitted.
+    '''
+    digest = hashlib.sha256(frame_fingerprint(train_df[['ds', 'y']]).encode())
+    digest.update(json.dumps(params, sort_keys=True).encode())
+    return digest.hexdigest()
+
+def fit_segment(key, train_df, test_df, params, store_dir):
+    '''
+    Fits, evaluates and saves the model of one segment. In a pool worker
+    only the small metadata dict travels back to the parent.
+    '''
+    start_time = time.time()
+    entry = {'file': segment_file_name(key), 'n_train_rows': len(train_df), 'params': params}
+    try:
+        m = build_prophet(params)
+        with span('prophet_fit', segment=key, n_rows=len(train_df)):
+            m.fit(train_df[['ds', 'y']])
+
+        if len(test_df):
+            forecast = m.predict(test_df[['ds']])
+            entry['test_mape'] = float(mape(test_df['y'], forecast['yhat']))
+
+        SegmentModelStore(SegmentStoreConfig(store_dir=store_dir)).save_model(key, m)
+    except Exception as e:
+        entry['error'] = str(e)
+    entry['seconds'] = time.time() - start_time
+    return entry
+
+def _fit_segment_in_worker(task):
+    with tracer.collect() as spans:
+        entry = fit_segment(*task)
+    entry['spans'] = spans
+    return entry
+
+class FleetTrainer:
+    def __init__(self, config: FleetTrainerConfig = None):
+        self.fleet_trainer_config = config or FleetTrainerConfig()
+        self.store = SegmentModelStore(self.fleet_trainer_config.store)
+
+    def initiate_fleet_training(self, segment_train_path, segment_test_path):
+        '''
+        Trains one model per segment on a process pool and writes them into
+        the segment store. Segments whose data and params are unchanged since
+        the last run keep their existing model.
+        '''
+        logging.info("Entered fleet training method")
+        try:
+            config = self.fleet_trainer_config
+            train_df = load_frame(segment_train_path)
+            test_df = load_frame(segment_test_path)
+            train_groups = dict(tuple(train_df.groupby('segment', sort=True)))
+            test_groups = dict(tuple(test_df.groupby('segment', sort=True)))
+            logging.info(f"Read {len(train_groups)} segments for keys {config.segment_keys}")
+
+            index = self.store.read_index()
+            if index.get('segment_keys') != list(config.segment_keys) or index.get('backend', 'prophet') != 'prophet':
+                # Different grouping or backend, none of the stored models apply
+                index = {'segment_keys': list(config.segment_keys), 'segments': {}}
+            segments = dict(index['segments'])
+
+            tasks, fingerprints, skipped = [], {}, 0
+            for key, seg_train in train_groups.items():
+                if len(seg_train) < config.min_train_days:
+                    logging.warning(f"Skipping segment '{key}': only {len(seg_train)} training days")
+                    continue
+                fingerprint = segment_fingerprint(seg_train, config.params)
+                previous = segments.get(key)
+                if (previous is not None and previous.get('fingerprint') == fingerprint
+                        and os.path.exists(self.store.model_path(key))):
+                    skipped += 1
+                    continue
+                fingerprints[key] = fingerprint
+                seg_test = test_groups.get(key, seg_train.iloc[:0])
+                tasks.append((key, seg_train, seg_test, config.params, config.store.store_dir))
+
+            logging.info(f"Fitting {len(tasks)} segments, {skipped} unchanged segments reused")
+
+            n_jobs = config.n_jobs if config.n_jobs and config.n_jobs > 0 else (os.cpu_count() or 1)
+            start_time = time.time()
+            if n_jobs == 1 or len(tasks) <= 1:
+                silence_prophet_logs()
+                results = [fit_segment(*task) for task in tasks]
+            else:
+                with ProcessPoolExecutor(max_workers=n_jobs, initializer=silence_prophet_logs) as executor:
+                    results = list(executor.map(_fit_segment_in_worker, tasks, chunksize=max(1, len(tasks) // (4 * n_jobs))))
+                for entry in results:
+                    tracer.add_events(entry.pop('spans'))
+
+            failed = 0
+            for (key, *_), entry in zip(tasks, results):
+                metrics.inc('segment_fits_total', status='error' if 'error' in entry else 'ok')
+                if 'error' in entry:
+                    failed += 1
+                    logging.warning(f"Failed to fit segment '{key}': {entry['error']}")
+                    continue
+                entry['fingerprint'] = fingerprints[key]
+                entry['trained_at'] = time.time()
+                segments[key] = entry
+
+            index = {'segment_keys': list(config.segment_keys), 'segments': segments}
+            self.store.write_index(index)
+            logging.info(f"Fleet training finished in {time.time() - start_time:.2f}s: "
+                         f"{len(tasks) - failed} fitted, {skipped} reused, {failed} failed")
+
+            return self.store.index_path
+
+        except Exception as e:
+            raise CustomException(e, sys)
+
+    def initiate_global_training(self, segment_train_path, segment_test_path, model_trainer):
+        '''
+        Trains one gbm model across all segments with model_trainer (tuned
+        on a holdout, see ModelTrainer.find_best_global_params) instead of
+        a model per segment, and points every segment of the store at it.
+        Short segments are kept: the global model forecasts them from the
+        patterns of the others.
+        '''
+        logging.info("Entered global fleet training method")
+        try:
+            config = self.fleet_trainer_config
+            train_df = load_frame(segment_train_path)
+            test_df = load_frame(segment_test_path)
+            logging.info(f"Read {train_df['segment'].nunique()} segments for keys {config.segment_keys}")
+
+            start_time = time.time()
+            params, holdout_mape, _ = model_trainer.find_best_global_params(train_df)
+            model = model_trainer.fit_global_model(params, train_df)
+            test_mape, segment_mapes = model_trainer.evaluate_global_model(model, test_df)
+            self.store.save_global_model(model)
+
+            fingerprint = segment_fingerprint(train_df.sort_values(['segment', 'ds']), params)
+            n_rows = train_df['segment'].value_counts()
+            segments = {}
+            for key in model.segments:
+                segments[key] = {
+                    'file': GLOBAL_MODEL_FILE, 'global': True, 'n_train_rows': int(n_rows[key]), 'params': params,
+                    'fingerprint': fingerprint, 'trained_at': time.time()
+                }
+                if key in segment_mapes:
+                    segments[key]['test_mape'] = segment_mapes[key]
+
+            self.store.write_index({
+                'segment_keys': list(config.segment_keys), 'backend': 'gbm',
+                'holdout_mape': holdout_mape, 'test_mape': test_mape, 'segments': segments
+            })
+            logging.info(f"Global fleet training finished in {time.time() - start_time:.2f}s: "
+                         f"{len(segments)} segments, test MAPE {test_mape:.4f}")
+
+            return self.store.index_path
+
+        except Exception as e:
+            raise CustomException(e, sys)
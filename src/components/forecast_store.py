@@ -0,0 +1,216 @@
+import os
+import sys
+import json
+import time
+import uuid
+import shutil
+import hashlib
+import argparse
+import threading
+import numpy as np
+import pandas as pd
+from dataclasses import dataclass
+
+from src.exception import CustomException
+from src.logger import logging
+
+VALUES_FILE = 'values.npy'
+DAYS_FILE = 'days.npy'
+INDEX_FILE = 'index.json'
+
+@dataclass
+class ForecastStoreConfig:
+    store_dir: str = os.path.join('artifacts', 'forecasts')
+    # Future days materialized per model, the longest horizon served
+    horizon_days: int = 180
+
+class ForecastTable:
+    '''
+    One materialized snapshot: the forecasts of every model stacked into a
+    float64 array of shape (rows, columns), memory-mapped from disk, with
+    their dates as day numbers. The index maps a key (a segment, or the
+    total) to its slice of rows, its columns and the model version it was
+    computed with, so a lookup is a dict access and two slices.
+    '''
+    def __init__(self, index, values, days):
+        self.index = index
+        self.version = index['version']
+        self.horizon = index['horizon']
+        self.columns = list(index['columns'])
+        self.entries = index['entries']
+        self.values = values
+        self.days = days
+
+    def entry(self, key):
+        return self.entries.get(key)
+
+    def frame(self, key, periods=None):
+        '''
+        The stored forecast of key in the layout of the live one: its
+        history followed by the next periods days (default: all stored).
+        '''
+        entry = self.entries[key]
+        n_rows = entry['n_rows'] if periods is None else entry['n_history'] + periods
+        rows = slice(entry['offset'], entry['offset'] + n_rows)
+        columns = entry['columns']
+        frame = pd.DataFrame(np.asarray(self.values[rows])[:, columns], columns=[self.columns[i] for i in columns])
+        frame.insert(0, 'ds', np.asarray(self.days[rows]).astype('datetime64[D]').astype('datetime64[ns]'))
+        return frame
+
+class ForecastStore:
+    '''
+    Key-indexed store of precomputed forecasts, written by the training
+    pipeline's materialization stage and read by serving.
+
+    A snapshot is a directory named after its content hash holding the
+    values and dates as .npy files; index.json names the current one and
+    is replaced atomically, so readers always see a complete snapshot. The
+    loaded snapshot is cached and reloaded when the index changes.
+    '''
+    def __init__(self, config: ForecastStoreConfig = None):
+        self.config = config or ForecastStoreConfig()
+        self._lock = threading.Lock()
+        self._table = None
+
+    @property
+    def index_path(self):
+        return os.path.join(self.config.store_dir, INDEX_FILE)
+
+    def write(self, forecasts, horizon):
+        '''
+        Writes a snapshot from a dict of key -> {'version', 'regressors',
+        'n_history', 'frame'}, where frame is a forecast with ds and numeric
+        columns, and returns its index.
+        '''
+        try:
+            columns = []
+            for entry in forecasts.values():
+                columns.extend(col for col in entry['frame'].columns if col != 'ds' and col not in columns)
+
+            entries, blocks, day_blocks, offset = {}, [], [], 0
+            for key, entry in forecasts.items():
+                frame = entry['frame']
+                frame_columns = [col for col in frame.columns if col != 'ds']
+                block = np.full((len(frame), len(columns)), np.nan)
+                col_idx = [columns.index(col) for col in frame_columns]
+                block[:, col_idx] = frame[frame_columns].to_numpy(dtype=np.float64)
+                blocks.append(block)
+                day_blocks.append(pd.to_datetime(frame['ds']).to_numpy(dtype='datetime64[D]').astype(np.int64))
+                entries[key] = {
+                    'version': entry['version'],
+                    'regressors': bool(entry['regressors']),
+                    'offset': offset,
+                    'n_rows': len(frame),
+                    'n_history': int(entry['n_history']),
+                    'columns': col_idx
+                }
+                offset += len(frame)
+
+            values = np.vstack(blocks) if blocks else np.empty((0, len(columns)))
+            days = np.concatenate(day_blocks) if day_blocks else np.empty(0, dtype=np.int64)
+            return self._publish(values, days, columns, entries, horizon)
+
+        except Exception as e:
+            raise CustomException(e, sys)
+
+    def _publish(self, values, days, columns, entries, horizon):
+        digest = hashlib.sha256(values.tobytes())
+        digest.update(days.tobytes())
+        digest.update(json.dumps([columns, entries], sort_keys=True).encode())
+        version = digest.hexdigest()[:12]
+        index = {
+            'version': version,
+            'dir': f"forecasts-{version}",
+            'created_at': time.time(),
+            'horizon': int(horizon),
+            'columns': columns,
+            'entries': entries
+        }
+
+        os.makedirs(self.config.store_dir, exist_ok=True)
+        final_dir = os.path.join(self.config.store_dir, index['dir'])
+        if not os.path.isdir(final_dir):
+            staging_dir = os.path.join(self.config.store_dir, f".staging-{uuid.uuid4().hex}")
+            os.makedirs(staging_dir)
+            try:
+                np.save(os.path.join(staging_dir, VALUES_FILE), values)
+                np.save(os.path.join(staging_dir, DAYS_FILE), days)
+                os.rename(staging_dir, final_dir)
+            except BaseException:
+                shutil.rmtree(staging_dir, ignore_errors=True)
+                raise
+
+        previous_dir = None
+        if os.path.exists(self.index_path):
+            with open(self.index_path, 'r', encoding='utf-8') as file_obj:
+                previous_dir = json.load(file_obj).get('dir')
+        tmp_path = self.index_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as file_obj:
+            json.dump(index, file_obj, indent=2)
+        os.replace(tmp_path, self.index_path)
+
+        # The previous snapshot is kept for readers that read its index just
+        # before the swap; older ones are only held open by their mappings
+        for name in os.listdir(self.config.store_dir):
+            if name.startswith('forecasts-') and name not in (index['dir'], previous_dir):
+                shutil.rmtree(os.path.join(self.config.store_dir, name), ignore_errors=True)
+
+        logging.info(f"Wrote {len(entries)} forecasts ({values.shape[0]} rows x {len(columns)} columns, "
+                     f"{horizon} days ahead) to {final_dir}")
+        return index
+
+    def load(self):
+        '''
+        Returns the current snapshot, memory-mapped, re-reading it only
+        after it was rewritten, or None if nothing was materialized yet.
+        '''
+        try:
+            with self._lock:
+                try:
+                    mtime = os.stat(self.index_path).st_mtime_ns
+                except FileNotFoundError:
+                    return None
+                cached = self._table
+                if cached is not None and cached[0] == mtime:
+                    return cached[1]
+                with open(self.index_path, 'r', encoding='utf-8') as file_obj:
+                    index = json.load(file_obj)
+                snapshot_dir = os.path.join(self.config.store_dir, index['dir'])
+                loaded = ForecastTable(
+                    index,
+                    np.load(os.path.join(snapshot_dir, VALUES_FILE), mmap_mode='r'),
+                    np.load(os.path.join(snapshot_dir, DAYS_FILE), mmap_mode='r')
+                )
+                self._table = (mtime, loaded)
+                return loaded
+        except Exception as e:
+            raise CustomException(e, sys)
+
+_default_store = None
+_default_store_lock = threading.Lock()
+
+def get_forecast_store() -> ForecastStore:
+    '''Returns the shared forecast store of this process, creating it on first use.'''
+    global _default_store
+    if _default_store is None:
+        with _default_store_lock:
+            if _default_store is None:
+                _default_store = ForecastStore()
+    return _default_store
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Inspect the materialized forecasts.")
+    parser.add_argument("--key", default=None, help="Print the stored forecast of this segment (or 'total').")
+    return parser.parse_args(argv)
+
+if __name__ == "__main__":
+    args = parse_args()
+    table = ForecastStore().load()
+    if table is None:
+        print("No forecasts materialized yet.")
+    elif args.key is not None:
+        print(table.frame(args.key).tail(table.horizon).to_string(index=False))
+    else:
+        print(f"Snapshot {table.version}: {len(table.entries)} forecasts, {table.horizon} days ahead")
+        for key, entry in table.entries.items():
+            print(f"  {key}  model {entry['version']}  {entry['n_history']} history rows")
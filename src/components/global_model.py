@@ -0,0 +1,312 @@
+import sys
+import numpy as np
+import pandas as pd
+from statistics import NormalDist
+
+from src.exception import CustomException
+from src.components.outlier_detection import TOTAL_SEGMENT
+
+# Lags and trailing windows of the features, in days
+GBM_LAGS = (1, 2, 3, 7, 14, 21, 28)
+GBM_WINDOWS = (7, 28)
+CALENDAR_FEATURES = ('day_of_week', 'day_of_month', 'day_of_year', 'month')
+# HistGradientBoostingRegressor bins a categorical feature into at most 255
+# categories; with more segments the segment code is used as a number
+MAX_CATEGORICAL_SEGMENTS = 254
+
+GBM_PARAM_GRID = {
+    'learning_rate': [0.05, 0.1],
+    'min_samples_leaf': [5, 20],
+    'loss': ['squared_error', 'absolute_error']
+}
+
+def calendar_features(dates):
+    '''The calendar features of dates, shape (days, len(CALENDAR_FEATURES)).'''
+    dates = pd.DatetimeIndex(dates)
+    return np.column_stack([
+        dates.dayofweek, dates.day, dates.dayofyear, dates.month
+    ]).astype(np.float64)
+
+def with_segment(df):
+    '''df with a 'segment' column, the total's key if it is a single series.'''
+    return df if 'segment' in df else df.assign(segment=TOTAL_SEGMENT)
+
+def wide_panel(df, segments, dates):
+    '''
+    The long frame df (segment, ds, y) as a (segments, dates) matrix.
+    Days without a row, e.g. dropped as outliers, are NaN.
+    '''
+    codes = pd.Index(segments).get_indexer(df['segment'])
+    days = pd.Index(dates).get_indexer(pd.to_datetime(df['ds']))
+    inside = (codes >= 0) & (days >= 0)
+    panel = np.full((len(segments), len(dates)), np.nan)
+    panel[codes[inside], days[inside]] = df['y'].to_numpy(dtype=np.float64)[inside]
+    return panel
+
+class SeriesPanel:
+    '''
+    Every series as one row of a (segments, days) matrix, with running
+    sums, sums of squares and counts of the observed values along the days.
+
+    The lag, rolling-window and calendar features of any set of days are
+    then sliced for all segments at once: a lag is a column offset and a
+    trailing window the difference of two running sums. The recursive
+    forecast appends one predicted day at a time with append().
+    '''
+    def __init__(self, values, start, log_scale, lags=GBM_LAGS, windows=GBM_WINDOWS, capacity=None):
+        n_segments, n_days = values.shape
+        capacity = max(capacity or n_days, n_days)
+        self.start = pd.Timestamp(start)
+        self.lags = tuple(lags)
+        self.windows = tuple(windows)
+        self.log_scale = np.asarray(log_scale, dtype=np.float64)
+        self.values = np.full((n_segments, capacity), np.nan)
+        self.values[:, :n_days] = values
+        self.sums = np.zeros((n_segments, capacity + 1))
+        self.squares = np.zeros((n_segments, capacity + 1))
+        self.counts = np.zeros((n_segments, capacity + 1))
+        observed = ~np.isnan(values)
+        filled = np.where(observed, values, 0.0)
+        self.sums[:, 1:n_days + 1] = np.cumsum(filled, axis=1)
+        self.squares[:, 1:n_days + 1] = np.cumsum(filled ** 2, axis=1)
+        self.counts[:, 1:n_days + 1] = np.cumsum(observed, axis=1)
+        self.n_days = n_days
+
+    def append(self, column):
+        '''Adds the values of the next day, e.g. a forecast, to every series.'''
+        t = self.n_days
+        self.values[:, t] = column
+        self.sums[:, t + 1] = self.sums[:, t] + column
+        self.squares[:, t + 1] = self.squares[:, t] + column ** 2
+        self.counts[:, t + 1] = self.counts[:, t] + 1
+        self.n_days += 1
+
+    def features(self, days):
+        '''
+        The features of the given day offsets, from the values before each
+        day only. Shape (segments * days, features), segment-major.
+        '''
+        days = np.asarray(days, dtype=np.int64)
+        n_segments = self.values.shape[0]
+        blocks = [
+            np.broadcast_to(np.arange(n_segments, dtype=np.float64)[:, None], (n_segments, len(days))),
+            np.broadcast_to(self.log_scale[:, None], (n_segments, len(days)))
+        ]
+        for lag in self.lags:
+            block = self.values[:, np.maximum(days - lag, 0)]
+            blocks.append(np.where(days - lag >= 0, block, np.nan))
+        with np.errstate(invalid='ignore', divide='ignore'):
+            for window in self.windows:
+                lower = np.maximum(days - window, 0)
+                count = self.counts[:, days] - self.counts[:, lower]
+                mean = (self.sums[:, days] - self.sums[:, lower]) / count
+                variance = (self.squares[:, days] - self.squares[:, lower]) / count - mean ** 2
+                blocks.append(mean)
+                blocks.append(np.sqrt(np.maximum(variance, 0.0)))
+        calendar = calendar_features(self.start + pd.to_timedelta(days, unit='D'))
+        blocks.extend(np.broadcast_to(calendar[:, i], (n_segments, len(days))) for i in range(calendar.shape[1]))
+        return np.stack(blocks, axis=-1).reshape(n_segments * len(days), len(blocks))
+
+class GlobalForecaster:
+    '''
+    One scikit-learn gradient-boosting model fitted across all series of a
+    long frame (segment, ds, y), instead of one Prophet model per series.
+
+    Each series is divided by its mean, so the model learns the shape of
+    the demand shared by all of them; the segment code (categorical up to
+    MAX_CATEGORICAL_SEGMENTS segments) and its log scale tell them apart. Future days are
+    forecast recursively, one day for every segment per model call.
+    Intervals are the in-sample residual spread of each series around
+    yhat; unlike Prophet's they do not widen with the horizon.
+    '''
+    def __init__(self, params=None, lags=GBM_LAGS, windows=GBM_WINDOWS, interval_width=0.8, random_state=42):
+        self.params = dict(params or {})
+        self.lags = tuple(lags)
+        self.windows = tuple(windows)
+        self.interval_width = interval_width
+        self.random_state = random_state
+        self._forecast = None
+        self._fitted = None
+
+    def __getstate__(self):
+        # The memoized forecasts are recomputed after loading
+        state = self.__dict__.copy()
+        state['_forecast'] = None
+        state['_fitted'] = None
+        return state
+
+    def panel(self, capacity=None):
+        return SeriesPanel(self.values / self.scale[:, None], self.start, np.log1p(self.scale),
+                           self.lags, self.windows, capacity)
+
+    def fit(self, df):
+        '''
+        Fits the model on a long frame with columns ds and y, and a
+        'segment' column unless it is a single series.
+        '''
+        try:
+            from sklearn.ensemble import HistGradientBoostingRegressor
+
+            df = with_segment(df)
+            ds = pd.to_datetime(df['ds'])
+            self.segments = pd.Index(np.sort(df['segment'].unique()))
+            self.start = ds.min()
+            dates = pd.date_range(self.start, ds.max(), freq='D')
+            self.values = wide_panel(df, self.segments, dates)
+            scale = np.nanmean(np.abs(self.values), axis=1)
+            self.scale = np.where(np.isfinite(scale) & (scale > 0), scale, 1.0)
+
+            panel = self.panel()
+            days = np.arange(1, len(dates))
+            X = panel.features(days)
+            y = panel.values[:, days].ravel()
+            observed = ~np.isnan(y)
+            categorical = [0] if len(self.segments) <= MAX_CATEGORICAL_SEGMENTS else None
+            self.regressor = HistGradientBoostingRegressor(
+                categorical_features=categorical, random_state=self.random_state, **self.params
+            )
+            self.regressor.fit(X[observed], y[observed])
+
+            # Normalized one-step residual spread of every series, for the intervals
+            residuals = (y - self.regressor.predict(X)).reshape(len(self.segments), len(days))
+            sigma = np.nanstd(residuals, axis=1)
+            self.sigma = np.where(np.isfinite(sigma), sigma, 0.0)
+            self._forecast = None
+            self._fitted = None
+            return self
+
+        except Exception as e:
+            raise CustomException(e, sys)
+
+    @property
+    def end(self):
+        return self.start + pd.Timedelta(days=self.values.shape[1] - 1)
+
+    def fitted(self):
+        '''One-step-ahead predictions of every history day, shape (segments, days).'''
+        if self._fitted is None:
+            n_days = self.values.shape[1]
+            predictions = self.regressor.predict(self.panel().features(np.arange(n_days)))
+            self._fitted = predictions.reshape(len(self.segments), n_days) * self.scale[:, None]
+        return self._fitted
+
+    def forecast(self, horizon):
+        '''
+        The next horizon days of every series, shape (segments, horizon).
+        The longest forecast made so far is kept and sliced for shorter ones.
+        '''
+        cached = self._forecast
+        if cached is not None and cached.shape[1] >= horizon:
+            return cached[:, :horizon]
+        n_days = self.values.shape[1]
+        panel = self.panel(capacity=n_days + horizon)
+        for t in range(n_days, n_days + horizon):
+            panel.append(self.regressor.predict(panel.features([t])))
+        forecast = panel.values[:, n_days:n_days + horizon] * self.scale[:, None]
+        self._forecast = forecast
+        return forecast
+
+    def predict_frame(self, segments, ds):
+        '''
+        yhat and its interval for pairs of segment and date, in history
+        (one step ahead) or after it (recursive).
+        '''
+        codes = self.segments.get_indexer(pd.Index(segments))
+        if (codes < 0).any():
+            raise ValueError(f"Unknown segments {sorted(set(pd.Index(segments)[codes < 0]))}")
+        days = ((pd.to_datetime(pd.Series(ds)) - self.start) // pd.Timedelta(days=1)).to_numpy()
+        if len(days) and days.min() < 0:
+            raise ValueError(f"Dates before the start of the history ({self.start.date()}) cannot be predicted")
+
+        n_days = self.values.shape[1]
+        yhat = np.empty(len(days))
+        past = days < n_days
+        if past.any():
+            yhat[past] = self.fitted()[codes[past], days[past]]
+        if (~past).any():
+            future = self.forecast(int(days.max()) - n_days + 1)
+            yhat[~past] = future[codes[~past], days[~past] - n_days]
+
+        width = NormalDist().inv_cdf((1 + self.interval_width) / 2) * self.sigma[codes] * self.scale[codes]
+        return yhat, yhat - width, yhat + width
+
+    def series(self, segment=TOTAL_SEGMENT):
+        '''The forecaster of one segment, with the Prophet API serving uses.'''
+        if segment not in self.segments:
+            raise ValueError(f"Unknown segment '{segment}'")
+        return SeriesForecaster(self, segment)
+
+class SeriesForecaster:
+    '''
+    One series of a GlobalForecaster behind the parts of the Prophet API
+    that training and serving use (history, extra_regressors,
+    make_future_dataframe, predict, plot, plot_components), like
+    LiteForecaster. Pickling it pickles the shared global model.
+    '''
+    model_format = 'gbm-pickle'
+
+    def __init__(self, model, segment):
+        self.model = model
+        self.segment = segment
+        self.interval_width = model.interval_width
+
+    @property
+    def extra_regressors(self):
+        return {}
+
+    @property
+    def history(self):
+        values = self.model.values[self.model.segments.get_loc(self.segment)]
+        observed = ~np.isnan(values)
+        dates = pd.date_range(self.model.start, periods=len(values), freq='D')
+        return pd.DataFrame({'ds': dates[observed], 'y': values[observed]})
+
+    def make_future_dataframe(self, periods, freq='D', include_history=True):
+        history = self.history
+        last_date = history['ds'].max()
+        dates = pd.date_range(start=last_date, periods=periods + 1, freq=freq)
+        dates = dates[dates > last_date][:periods]
+        if include_history:
+            dates = np.concatenate((history['ds'].to_numpy(), dates))
+        return pd.DataFrame({'ds': dates})
+
+    def predict(self, df):
+        '''Returns the forecast of the dates in df['ds'] with Prophet's yhat columns.'''
+        ds = pd.to_datetime(df['ds']).sort_values(kind='mergesort').reset_index(drop=True)
+        yhat, lower, upper = self.model.predict_frame(np.repeat(self.segment, len(ds)), ds)
+        return pd.DataFrame({'ds': ds, 'yhat': yhat, 'yhat_lower': lower, 'yhat_upper': upper})
+
+    def plot(self, fcst, figsize=(10, 6)):
+        '''Forecast with history and interval, in the style of Prophet.plot.'''
+        import matplotlib.pyplot as plt
+        history = self.history
+        fig = plt.figure(facecolor='w', figsize=figsize)
+        ax = fig.add_subplot(111)
+        ax.plot(history['ds'], history['y'], 'k.', label='Observed data points')
+        ax.plot(fcst['ds'], fcst['yhat'], ls='-', c='#0072B2', label='Forecast')
+        ax.fill_between(fcst['ds'], fcst['yhat_lower'], fcst['yhat_upper'], color='#0072B2', alpha=0.2,
+                        label='Uncertainty interval')
+        ax.grid(True, which='major', c='gray', ls='-', lw=1, alpha=0.2)
+        ax.set_xlabel('ds')
+        ax.set_ylabel('y')
+        fig.tight_layout()
+        return fig
+
+    def plot_components(self, fcst, figsize=None):
+        '''The model has no additive components: plots the mean yhat per weekday and per month.'''
+        import matplotlib.pyplot as plt
+        ds = pd.to_datetime(fcst['ds'])
+        fig, axes = plt.subplots(2, 1, facecolor='w', figsize=figsize or (9, 6))
+        weekly = fcst['yhat'].groupby(ds.dt.dayofweek.to_numpy()).mean().reindex(range(7))
+        axes[0].plot(range(7), weekly.to_numpy(), ls='-', c='#0072B2')
+        axes[0].set_xticks(range(7))
+        axes[0].set_xticklabels(pd.date_range('2017-01-02', periods=7).day_name())
+        axes[0].set_ylabel('weekly')
+        monthly = fcst['yhat'].groupby(ds.dt.month.to_numpy()).mean().reindex(range(1, 13))
+        axes[1].plot(range(1, 13), monthly.to_numpy(), ls='-', c='#0072B2')
+        axes[1].set_xticks(range(1, 13))
+        axes[1].set_ylabel('monthly')
+        for ax in axes:
+            ax.grid(True, which='major', c='gray', ls='-', lw=1, alpha=0.2)
+        fig.tight_layout()
+        return fig
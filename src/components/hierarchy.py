@@ -0,0 +1,335 @@
+import os
+import sys
+import time
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+from scipy.sparse.linalg import splu
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+
+from src.exception import CustomException
+from src.logger import logging
+from src.metrics import metrics, span, tracer
+from src.utils import artifact_path, save_frame, load_frame
+from src.components.data_ingestion import segment_key
+from src.components.outlier_detection import TOTAL_SEGMENT
+from src.components.fleet_trainer import DEFAULT_SEGMENT_PARAMS
+
+# Level of the single grand-total node above the configured levels
+TOTAL_LEVEL = 'total'
+RECONCILIATION_METHODS = ('bottom_up', 'top_down', 'mint')
+# Error covariance W of MinT: the identity, the in-sample residual variances,
+# or the residual covariance shrunk towards its diagonal
+MINT_COVARIANCES = ('ols', 'wls', 'shrink')
+# Days of the naive forecast (mean of the last days) for nodes whose fit failed
+NAIVE_WINDOW_DAYS = 28
+
+@dataclass
+class HierarchyConfig:
+    # Key columns from the top of the hierarchy down; the total is added above them
+    levels: list = field(default_factory=lambda: ['restaurant_type', 'restaurant_id', 'menu_item_name'])
+    # Levels given base forecasts, e.g. ['total', 'restaurant_type'] (None = every level).
+    # Bottom-up and MinT need the bottom level; top-down uses the highest one given.
+    forecast_levels: list = None
+    # One of RECONCILIATION_METHODS
+    method: str = 'mint'
+    # One of MINT_COVARIANCES
+    mint_covariance: str = 'wls'
+    params: dict = field(default_factory=lambda: dict(DEFAULT_SEGMENT_PARAMS))
+    horizon_days: int = 30
+    # Worker processes for the base forecasts (0 = one per CPU core)
+    n_jobs: int = 0
+    forecast_path: str = artifact_path('hierarchy_forecast')
+    metrics_path: str = os.path.join('artifacts', 'hierarchy_metrics.csv')
+
+class Hierarchy:
+    '''
+    The nodes of a hierarchy and its summing matrix S, derived from the key
+    columns of the bottom series: one row per node (the total, then every
+    level top down), one column per bottom series, and S[node, series] = 1
+    if the series is part of the node. The bottom rows of S are the
+    identity, so S @ bottom values gives every node's value at once.
+    '''
+    def __init__(self, bottom_keys, levels):
+        self.levels = [TOTAL_LEVEL] + list(levels)
+        n_bottom = len(bottom_keys)
+        rows, nodes, self.level_rows = [], [], {}
+        offset = 0
+        for depth, level in enumerate(self.levels):
+            if depth == 0:
+                keys = np.full(n_bottom, TOTAL_SEGMENT, dtype=object)
+            else:
+                keys = [segment_key(v) for v in bottom_keys[list(levels[:depth])].itertuples(index=False)]
+            codes, names = pd.factorize(pd.Series(keys, dtype=object), sort=True)
+            rows.append(offset + codes)
+            nodes.append(pd.DataFrame({'level': level, 'node': np.asarray(names, dtype=object)}))
+            self.level_rows[level] = np.arange(offset, offset + len(names))
+            offset += len(names)
+
+        self.nodes = pd.concat(nodes, ignore_index=True)
+        self.S = sp.csr_matrix(
+            (np.ones(n_bottom * len(self.levels)), (np.concatenate(rows), np.tile(np.arange(n_bottom), len(self.levels)))),
+            shape=(offset, n_bottom)
+        )
+        if len(self.level_rows[self.levels[-1]]) != n_bottom:
+            raise ValueError(f"The levels {levels} do not identify the bottom series uniquely")
+
+    @property
+    def bottom_rows(self):
+        return self.level_rows[self.levels[-1]]
+
+    def rows_of(self, levels):
+        return np.concatenate([self.level_rows[level] for level in levels])
+
+def dense_panel(df, segments, dates):
+    '''
+    The long frame df (segment, ds, y) as a (segments, dates) matrix.
+    Days without a row had no sales and are 0.
+    '''
+    codes = pd.Index(segments).get_indexer(df['segment'])
+    days = pd.Index(dates).get_indexer(pd.to_datetime(df['ds']))
+    inside = (codes >= 0) & (days >= 0)
+    panel = np.zeros((len(segments), len(dates)))
+    np.add.at(panel, (codes[inside], days[inside]), df['y'].to_numpy(dtype=np.float64)[inside])
+    return panel
+
+def shrunk_covariance(residuals):
+    '''
+    Residual covariance shrunk towards its diagonal with the Schäfer-Strimmer
+    intensity, as in MinT-shrink; well conditioned even with more nodes
+    than days.
+    '''
+    n_obs = residuals.shape[1]
+    covariance = residuals @ residuals.T / n_obs
+    std = np.sqrt(np.maximum(np.diag(covariance), 1e-12))
+    standardized = residuals / std[:, None]
+    correlation = standardized @ standardized.T / n_obs
+    squares = standardized ** 2
+    # Estimated variance of every sample correlation
+    variance = (squares @ squares.T - n_obs * correlation ** 2) / (n_obs * (n_obs - 1))
+    np.fill_diagonal(variance, 0)
+    off_diagonal = correlation ** 2
+    np.fill_diagonal(off_diagonal, 0)
+    intensity = float(np.clip(variance.sum() / max(off_diagonal.sum(), 1e-12), 0, 1))
+    logging.info(f"MinT shrinkage intensity: {intensity:.4f}")
+    shrunk = (1 - intensity) * covariance
+    shrunk[np.diag_indices_from(shrunk)] = np.diag(covariance)
+    return shrunk
+
+def reconcile(hierarchy, base, forecast_rows, method='mint', residuals=None, history=None, covariance='wls'):
+    '''
+    Reconciles the base forecasts (len(forecast_rows), horizon) of some
+    nodes into coherent forecasts (nodes, horizon) of every node, for all
+    horizon days in one batched solve:
+
+    - bottom_up: the bottom base forecasts, summed up with S.
+    - top_down: the highest forecast level, split over its bottom series
+      by their share of its history (history: (nodes, days) actuals).
+    - mint: the bottom forecasts minimizing the trace of the reconciled
+      error covariance, (S_F' W^-1 S_F)^-1 S_F' W^-1 base, with S_F the
+      forecast rows of S and W from the in-sample residuals.
+    '''
+    if method not in RECONCILIATION_METHODS:
+        raise ValueError(f"Unknown reconciliation method '{method}'. Choose from {list(RECONCILIATION_METHODS)}")
+    S = hierarchy.S
+    forecast_rows = np.asarray(forecast_rows)
+    position = pd.Index(forecast_rows)
+
+    if method == 'bottom_up':
+        missing = np.setdiff1d(hierarchy.bottom_rows, forecast_rows)
+        if len(missing):
+            raise ValueError("Bottom-up reconciliation needs base forecasts of the bottom level")
+        bottom = base[position.get_indexer(hierarchy.bottom_rows)]
+
+    elif method == 'top_down':
+        level = next(level for level in hierarchy.levels if np.isin(hierarchy.level_rows[level], forecast_rows).all())
+        rows = hierarchy.level_rows[level]
+        # Every bottom series has exactly one ancestor on the level
+        ancestor = rows[S[rows].tocsc().indices]
+        totals = history[ancestor].sum(axis=1)
+        shares = np.divide(history[hierarchy.bottom_rows].sum(axis=1), totals, out=np.zeros(len(ancestor)), where=totals > 0)
+        bottom = shares[:, None] * base[position.get_indexer(ancestor)]
+
+    else:
+        if np.setdiff1d(hierarchy.bottom_rows, forecast_rows).size:
+            raise ValueError("MinT reconciliation needs base forecasts of the bottom level")
+        S_F = S[forecast_rows]
+        if covariance == 'shrink':
+            W = shrunk_covariance(residuals)
+            W_inv_S = np.linalg.solve(W, S_F.toarray())
+            bottom = np.linalg.solve(S_F.T @ W_inv_S, W_inv_S.T @ base)
+        else:
+            if covariance == 'wls':
+                weights = np.mean(residuals ** 2, axis=1)
+                # Nodes fitted without error would otherwise get an infinite weight
+                weights = np.maximum(weights, 1e-6 * max(weights.max(), 1e-12))
+            elif covariance == 'ols':
+                weights = np.ones(len(forecast_rows))
+            else:
+                raise ValueError(f"Unknown MinT covariance '{covariance}'. Choose from {list(MINT_COVARIANCES)}")
+            W_inv = sp.diags(1.0 / weights)
+            # Sparse (bottom, bottom) normal equations, factorized once for every horizon day
+            bottom = splu((S_F.T @ W_inv @ S_F).tocsc()).solve(np.ascontiguousarray(S_F.T @ (W_inv @ base)))
+
+    return S @ bottom
+
+def forecast_node(ds, y, params, horizon_days):
+    '''Fits one node and returns its fitted values over ds followed by horizon_days of forecast.'''
+    from src.components.model_trainer import build_prophet
+
+    m = build_prophet(params)
+    # Only yhat is reconciled, so skip the uncertainty simulation
+    m.uncertainty_samples = 0
+    m.fit(pd.DataFrame({'ds': ds, 'y': y}))
+    return m.predict(m.make_future_dataframe(periods=horizon_days))['yhat'].to_numpy()
+
+def fit_node(ds, series, params, horizon_days, i):
+    '''Forecasts node i of series, returning its yhat or the error, with the seconds taken.'''
+    start_time = time.time()
+    try:
+        with span('prophet_fit', node=int(i), n_rows=len(ds)):
+            result = {'yhat': forecast_node(ds, series[i], params, horizon_days)}
+    except Exception as e:
+        result = {'error': str(e)}
+    result.update(index=i, seconds=time.time() - start_time)
+    return result
+
+# Node series shared with pool workers once, instead of pickling them per task
+_worker_state = {}
+
+def _init_node_worker(ds, series, params, horizon_days):
+    from src.components.model_trainer import silence_prophet_logs
+
+    silence_prophet_logs()
+    _worker_state.update(ds=ds, series=series, params=params, horizon_days=horizon_days)
+
+def _fit_node_in_worker(i):
+    state = _worker_state
+    with tracer.collect() as spans:
+        result = fit_node(state['ds'], state['series'], state['params'], state['horizon_days'], i)
+    result['spans'] = spans
+    return result
+
+class HierarchicalForecaster:
+    '''
+    Forecasts a hierarchy coherently: base Prophet forecasts for the chosen
+    levels only (fitted on a process pool that receives the node series
+    once), then one reconciliation solve that yields forecasts for every
+    node of every level, which add up exactly.
+    '''
+    def __init__(self, config: HierarchyConfig = None):
+        self.config = config or HierarchyConfig()
+
+    def base_forecasts(self, ds, series):
+        '''(nodes, days + horizon) fitted values and forecasts of the given node series.'''
+        config = self.config
+        n_days = len(ds)
+        output = np.full((len(series), n_days + config.horizon_days), np.nan)
+        n_jobs = config.n_jobs if config.n_jobs and config.n_jobs > 0 else (os.cpu_count() or 1)
+        if n_jobs == 1 or len(series) <= 1:
+            from src.components.model_trainer import silence_prophet_logs
+
+            silence_prophet_logs()
+            results = (fit_node(ds, series, config.params, config.horizon_days, i) for i in range(len(series)))
+            executor = None
+        else:
+            executor = ProcessPoolExecutor(max_workers=n_jobs, initializer=_init_node_worker,
+                                           initargs=(ds, series, config.params, config.horizon_days))
+            results = executor.map(_fit_node_in_worker, range(len(series)), chunksize=max(1, len(series) // (4 * n_jobs)))
+        try:
+            for result in results:
+                if executor is not None:
+                    tracer.add_events(result.pop('spans'))
+                metrics.inc('hierarchy_node_fits_total', status='error' if 'error' in result else 'ok')
+                i = result['index']
+                if 'error' in result:
+                    # A flat forecast keeps the node in the reconciliation
+                    logging.warning(f"Fit of hierarchy node {i} failed ({result['error']}), using a naive forecast")
+                    output[i] = series[i][-NAIVE_WINDOW_DAYS:].mean()
+                else:
+                    output[i] = result['yhat']
+        finally:
+            if executor is not None:
+                executor.shutdown(cancel_futures=True)
+        return output
+
+    def initiate_hierarchical_forecast(self, train_path, test_path):
+        '''
+        Builds the hierarchy from the bottom series of train_path, forecasts
+        the configured levels and reconciles them. Saves the coherent
+        forecast of every node (with its base forecast and the actuals of
+        the test days it covers) and the WAPE per level, before and after
+        reconciliation. Returns both paths.
+        '''
+        logging.info("Entered hierarchical forecasting method")
+        try:
+            config = self.config
+            train_df = load_frame(train_path)
+            test_df = load_frame(test_path)
+
+            bottom_keys = train_df.drop_duplicates('segment').sort_values('segment')[['segment'] + list(config.levels)]
+            hierarchy = Hierarchy(bottom_keys, config.levels)
+            forecast_levels = hierarchy.levels if config.forecast_levels is None else list(config.forecast_levels)
+            unknown = sorted(set(forecast_levels) - set(hierarchy.levels))
+            if unknown:
+                raise ValueError(f"Unknown forecast levels {unknown}, the hierarchy has {hierarchy.levels}")
+            forecast_rows = hierarchy.rows_of([level for level in hierarchy.levels if level in forecast_levels])
+            logging.info(f"Hierarchy of {len(hierarchy.nodes)} nodes over {len(bottom_keys)} bottom series; "
+                         f"base forecasts for {len(forecast_rows)} nodes of {forecast_levels}")
+
+            dates = pd.date_range(pd.to_datetime(train_df['ds']).min(), pd.to_datetime(train_df['ds']).max(), freq='D')
+            history = hierarchy.S @ dense_panel(train_df, bottom_keys['segment'], dates)
+
+            start_time = time.time()
+            with span('hierarchy_base_forecasts', n_nodes=len(forecast_rows)):
+                base = self.base_forecasts(dates, history[forecast_rows])
+            logging.info(f"Base forecasts of {len(forecast_rows)} nodes in {time.time() - start_time:.2f}s")
+
+            with span('hierarchy_reconcile', method=config.method, n_nodes=len(hierarchy.nodes)):
+                start_time = time.time()
+                coherent = reconcile(
+                    hierarchy, base[:, len(dates):], forecast_rows, config.method,
+                    residuals=history[forecast_rows] - base[:, :len(dates)],
+                    history=history, covariance=config.mint_covariance
+                )
+            logging.info(f"Reconciled {len(hierarchy.nodes)} nodes ({config.method}) in {time.time() - start_time:.3f}s")
+
+            future = pd.date_range(dates[-1] + pd.Timedelta(days=1), periods=config.horizon_days, freq='D')
+            actual = hierarchy.S @ dense_panel(test_df, bottom_keys['segment'], future)
+            has_actual = np.isin(future, pd.to_datetime(test_df['ds']).unique())
+            base_future = np.full_like(coherent, np.nan)
+            base_future[forecast_rows] = base[:, len(dates):]
+
+            n_nodes, horizon = coherent.shape
+            forecast = pd.DataFrame({
+                'level': np.repeat(hierarchy.nodes['level'].to_numpy(), horizon),
+                'node': np.repeat(hierarchy.nodes['node'].to_numpy(), horizon),
+                'ds': np.tile(future, n_nodes),
+                'yhat': coherent.ravel(),
+                'yhat_base': base_future.ravel(),
+                'y': np.where(has_actual, actual, np.nan).ravel()
+            })
+            save_frame(forecast, config.forecast_path)
+
+            level_metrics = []
+            for level in hierarchy.levels:
+                rows = hierarchy.level_rows[level]
+                y = actual[rows][:, has_actual]
+                scale = np.abs(y).sum()
+                level_metrics.append({
+                    'level': level,
+                    'n_nodes': len(rows),
+                    'forecast': level in forecast_levels,
+                    'wape_base': np.abs(base_future[rows][:, has_actual] - y).sum() / scale if level in forecast_levels and scale else np.nan,
+                    'wape_reconciled': np.abs(coherent[rows][:, has_actual] - y).sum() / scale if scale else np.nan
+                })
+            level_metrics = pd.DataFrame(level_metrics)
+            os.makedirs(os.path.dirname(config.metrics_path), exist_ok=True)
+            level_metrics.to_csv(config.metrics_path, index=False)
+            logging.info(f"Hierarchical forecast saved to {config.forecast_path}:\n{level_metrics.to_string(index=False)}")
+
+            return config.forecast_path, config.metrics_path
+
+        except Exception as e:
+            raise CustomException(e, sys)
@@ -0,0 +1,143 @@
+import os
+import sys
+import threading
+import pandas as pd
+from dataclasses import dataclass
+from importlib.metadata import version as package_version
+
+from src.exception import CustomException
+from src.logger import logging
+from src.utils import FRAME_EXTENSIONS, ARTIFACT_FORMAT, save_frame, load_frame
+
+HOLIDAY_COLUMNS = ['ds', 'holiday', 'lower_window', 'upper_window']
+
+@dataclass
+class HolidayProviderConfig:
+    # Country calendars are cached here, one file per (calendar, year range)
+    cache_dir: str = os.path.join('artifacts', 'holidays')
+    # Days before/after each holiday that it also affects
+    lower_window: int = -2
+    upper_window: int = 1
+
+def parse_calendar(calendar):
+    '''Splits 'MY' or 'MY-SGR' into (country, subdivision or None).'''
+    country, _, subdiv = str(calendar).strip().partition('-')
+    return country.upper(), (subdiv.upper() or None)
+
+class HolidayProvider:
+    '''
+    Builds Prophet holiday frames from country calendars (of the holidays
+    package, optionally for a subdivision) and custom event files.
+
+    Country calendars are memoized by (calendar, year range) in memory and
+    as files under cache_dir, so they are generated once, not on every
+    training run or tuning fit.
+    '''
+    def __init__(self, config: HolidayProviderConfig = None):
+        self.config = config or HolidayProviderConfig()
+        self._memo = {}
+        self._lock = threading.Lock()
+
+    def _cache_path(self, calendar, first_year, last_year):
+        # The calendars change between releases of the holidays package
+        name = f"{calendar}_{first_year}_{last_year}_v{package_version('holidays')}"
+        return os.path.join(self.config.cache_dir, name + FRAME_EXTENSIONS[ARTIFACT_FORMAT])
+
+    def country_holidays(self, calendar, years):
+        '''
+        Returns the holidays of a calendar ('MY', 'MY-SGR', ...) in the
+        given years as a dataframe with columns 'ds' and 'name'.
+        '''
+        first_year, last_year = min(years), max(years)
+        key = (calendar, first_year, last_year)
+        with self._lock:
+            if key in self._memo:
+                return self._memo[key]
+
+        cache_path = self._cache_path(calendar, first_year, last_year)
+        if os.path.exists(cache_path):
+            df = load_frame(cache_path)
+        else:
+            # Imported here: only training needs the holiday calendars
+            import holidays
+
+            country, subdiv = parse_calendar(calendar)
+            logging.info(f"Generating {calendar} holidays for years {first_year}-{last_year}")
+            days = holidays.country_holidays(country, subdiv=subdiv, years=range(first_year, last_year + 1))
+            df = pd.DataFrame({
+                'ds': pd.to_datetime(list(days.keys())),
+                'name': list(days.values())
+            }).sort_values('ds', kind='stable').reset_index(drop=True)
+            save_frame(df, cache_path)
+
+        with self._lock:
+            self._memo[key] = df
+        return df
+
+    def custom_events(self, file_path):
+        '''
+        Reads a custom event calendar (CSV, parquet or feather) with the
+        columns 'ds' and 'holiday', and optionally 'lower_window' and
+        'upper_window'.
+        '''
+        key = (file_path, os.stat(file_path).st_mtime_ns)
+        with self._lock:
+            if key in self._memo:
+                return self._memo[key]
+
+        df = load_frame(file_path)
+        missing = {'ds', 'holiday'} - set(df.columns)
+        if missing:
+            raise ValueError(f"Event calendar {file_path} is missing columns {sorted(missing)}")
+        df['ds'] = pd.to_datetime(df['ds'])
+
+        with self._lock:
+            self._memo[key] = df
+        return df
+
+    def get_holidays(self, calendars=(), years=(), event_paths=(), per_holiday=False):
+        '''
+        Returns the Prophet holidays dataframe (ds, holiday, lower_window,
+        upper_window) of the country calendars over years plus the custom
+        event files. Country holidays are named '<calendar>-Holiday', or by
+        their own name with per_holiday=True.
+        '''
+        try:
+            frames = []
+            for calendar in calendars:
+                df = self.country_holidays(calendar, years)
+                frames.append(pd.DataFrame({
+                    'ds': df['ds'],
+                    'holiday': df['name'] if per_holiday else f"{calendar}-Holiday",
+                    'lower_window': self.config.lower_window,
+                    'upper_window': self.config.upper_window
+                }))
+            for file_path in event_paths:
+                df = self.custom_events(file_path)
+                frames.append(df.assign(
+                    lower_window=df['lower_window'] if 'lower_window' in df else self.config.lower_window,
+                    upper_window=df['upper_window'] if 'upper_window' in df else self.config.upper_window
+                )[HOLIDAY_COLUMNS])
+
+            if not frames:
+                return pd.DataFrame(columns=HOLIDAY_COLUMNS)
+            holidays_df = pd.concat(frames, ignore_index=True)
+            # Remove any duplicate dates
+            holidays_df = holidays_df.drop_duplicates(subset=['holiday', 'ds']).reset_index(drop=True)
+            logging.info(f"Loaded {len(holidays_df)} holidays from {len(frames)} calendars")
+            return holidays_df
+
+        except Exception as e:
+            raise CustomException(e, sys)
+
+_default_provider = None
+_default_provider_lock = threading.Lock()
+
+def get_holiday_provider() -> HolidayProvider:
+    '''Returns the shared holiday provider of this process, creating it on first use.'''
+    global _default_provider
+    if _default_provider is None:
+        with _default_provider_lock:
+            if _default_provider is None:
+                _default_provider = HolidayProvider()
+    return _default_provider
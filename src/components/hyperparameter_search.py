@@ -0,0 +1,185 @@
+import math
+import numpy as np
+
+from src.logger import logging
+
+class SearchStrategy:
+    '''
+    Base class of the hyperparameter search strategies used by ModelTrainer.
+
+    A strategy decides which candidates get evaluated on which CV cutoffs.
+    It calls evaluate(params_list, cutoffs, prior), which returns one result
+    dict per params (in order) holding 'mape', 'cutoff_mapes' (the MAPE per
+    cutoff), 'n_fits' and 'seconds', or 'error'. prior optionally gives
+    each params' cutoff_mapes from earlier calls; those cutoffs are not
+    refitted but count towards 'mape' and 'cutoff_mapes'. search() returns every trial it ran, tagged with the rung and the number
+    of cutoffs it was scored on, so the cost of a strategy can be compared
+    with the full grid.
+    '''
+    name = None
+
+    def search(self, candidates, evaluate, cutoffs):
+        raise NotImplementedError
+
+    def _run(self, params_list, evaluate, cutoffs, rung=0, prior=None):
+        trials = []
+        for i, result in enumerate(evaluate(params_list, cutoffs, prior)):
+            result['strategy'] = self.name
+            result['rung'] = rung
+            result['n_cutoffs'] = len(cutoffs) + (len(prior[i]) if prior else 0)
+            trials.append(result)
+        return trials
+
+class GridSearch(SearchStrategy):
+    '''Evaluates every candidate on every cutoff (the original behaviour).'''
+    name = 'grid'
+
+    def search(self, candidates, evaluate, cutoffs):
+        return self._run(candidates, evaluate, cutoffs)
+
+class RandomSearch(SearchStrategy):
+    '''Evaluates n_trials candidates sampled without replacement.'''
+    name = 'random'
+
+    def __init__(self, n_trials=20, random_state=42):
+        self.n_trials = n_trials
+        self.random_state = random_state
+
+    def search(self, candidates, evaluate, cutoffs):
+        rng = np.random.default_rng(self.random_state)
+        n = min(self.n_trials, len(candidates))
+        picked = sorted(rng.choice(len(candidates), size=n, replace=False))
+        return self._run([candidates[i] for i in picked], evaluate, cutoffs)
+
+class BayesianSearch(SearchStrategy):
+    '''
+    Sequential model-based search: a Gaussian process fitted on the trials
+    so far picks the candidate with the highest expected improvement.
+    Starts from n_initial random candidates.
+    '''
+    name = 'bayesian'
+
+    def __init__(self, n_trials=20, n_initial=6, random_state=42):
+        self.n_trials = n_trials
+        self.n_initial = n_initial
+        self.random_state = random_state
+
+    @staticmethod
+    def _encode(candidates):
+        # Prior scales are searched on a log scale, categoricals become 0/1 codes
+        keys = list(candidates[0].keys())
+        columns = []
+        for key in keys:
+            values = [c[key] for c in candidates]
+            if all(isinstance(v, (int, float)) and v > 0 for v in values):
+                columns.append(np.log10(np.asarray(values, dtype=float)))
+            else:
+                levels = sorted(set(values))
+                columns.append(np.asarray([levels.index(v) for v in values], dtype=float))
+        X = np.column_stack(columns)
+        span = X.max(axis=0) - X.min(axis=0)
+        return (X - X.min(axis=0)) / np.where(span == 0, 1, span)
+
+    def search(self, candidates, evaluate, cutoffs):
+        from scipy.stats import norm
+        from sklearn.gaussian_process import GaussianProcessRegressor
+        from sklearn.gaussian_process.kernels import Matern, WhiteKernel
+
+        rng = np.random.default_rng(self.random_state)
+        X = self._encode(candidates)
+        n_trials = min(self.n_trials, len(candidates))
+        remaining = list(range(len(candidates)))
+        observed, scores, trials = [], [], []
+
+        initial = rng.choice(len(candidates), size=min(self.n_initial, n_trials), replace=False)
+        batch = sorted(int(i) for i in initial)
+
+        while batch:
+            for i, trial in zip(batch, self._run([candidates[i] for i in batch], evaluate, cutoffs)):
+                remaining.remove(i)
+                trials.append(trial)
+                if 'error' not in trial:
+                    observed.append(i)
+                    scores.append(trial['mape'])
+            if len(trials) >= n_trials or not remaining:
+                break
+            if len(observed) < 2:
+                batch = [int(rng.choice(remaining))]
+                continue
+
+            gp = GaussianProcessRegressor(
+                kernel=Matern(nu=2.5) + WhiteKernel(),
+                normalize_y=True,
+                random_state=self.random_state
+            )
+            gp.fit(X[observed], np.asarray(scores))
+            mu, sigma = gp.predict(X[remaining], return_std=True)
+            best = min(scores)
+            sigma = np.maximum(sigma, 1e-9)
+            z = (best - mu) / sigma
+            expected_improvement = (best - mu) * norm.cdf(z) + sigma * norm.pdf(z)
+            batch = [remaining[int(np.argmax(expected_improvement))]]
+
+        return trials
+
+class SuccessiveHalving(SearchStrategy):
+    '''
+    Successive halving with CV folds as the budget: every candidate is scored
+    on the most recent cutoff(s) first, only the best 1/eta survive to be
+    scored on more cutoffs, until the survivors are scored on all of them.
+    A survivor keeps its scores from earlier rungs, so each rung only fits
+    the cutoffs it adds.
+    '''
+    name = 'halving'
+
+    def __init__(self, eta=3, min_cutoffs=1):
+        self.eta = eta
+        self.min_cutoffs = min_cutoffs
+
+    def search(self, candidates, evaluate, cutoffs):
+        cutoffs = list(cutoffs)
+        n_rungs = max(1, int(math.ceil(math.log(len(cutoffs) / self.min_cutoffs, self.eta))) + 1)
+        survivors = list(range(len(candidates)))
+        # Per candidate, the MAPE of every cutoff it was scored on so far
+        scores = [{} for _ in candidates]
+        trials = []
+        n_scored = 0
+
+        for rung in range(n_rungs):
+            if rung == n_rungs - 1:
+                n_cutoffs = len(cutoffs)
+            else:
+                n_cutoffs = min(len(cutoffs), self.min_cutoffs * self.eta ** rung)
+            # The most recent n_scored cutoffs were scored in earlier rungs
+            new_cutoffs = cutoffs[len(cutoffs) - n_cutoffs:len(cutoffs) - n_scored]
+            rung_trials = self._run([candidates[i] for i in survivors], evaluate, new_cutoffs, rung=rung,
+                                    prior=[scores[i] for i in survivors] if n_scored else None)
+            trials.extend(rung_trials)
+            n_scored = n_cutoffs
+
+            scored = [(i, t) for i, t in zip(survivors, rung_trials) if 'error' not in t]
+            for i, trial in scored:
+                scores[i] = dict(trial['cutoff_mapes'])
+            logging.info(f"Halving rung {rung}: {len(survivors)} candidates on {n_cutoffs}/{len(cutoffs)} cutoffs "
+                         f"({len(new_cutoffs)} new)")
+            if rung == n_rungs - 1 or not scored:
+                break
+
+            keep = max(1, len(scored) // self.eta)
+            ranked = sorted(scored, key=lambda item: item[1]['mape'])[:keep]
+            # Keep the survivors in candidate order so the next rung is deterministic
+            survivors = sorted(i for i, _ in ranked)
+
+        return trials
+
+def get_search_strategy(name, n_trials=20, eta=3, random_state=42):
+    '''Returns the search strategy registered under name.'''
+    strategies = {
+        'grid': lambda: GridSearch(),
+        'random': lambda: RandomSearch(n_trials=n_trials, random_state=random_state),
+        'bayesian': lambda: BayesianSearch(n_trials=n_trials, random_state=random_state),
+        'halving': lambda: SuccessiveHalving(eta=eta),
+    }
+    if name not in strategies:
+        raise ValueError(f"Unknown search strategy '{name}'. Choose from {sorted(strategies)}")
+    return strategies[name]()
@@ -0,0 +1,374 @@
+import os
+import sys
+import json
+import numpy as np
+import pandas as pd
+from statistics import NormalDist
+
+from src.exception import CustomException
+from src.logger import logging
+
+# Holiday indicator days are precomputed this far past the end of the history
+HOLIDAY_HORIZON_DAYS = 3 * 365
+NANOSECONDS_PER_DAY = 24 * 60 * 60 * 10**9
+
+def lite_model_arrays(model):
+    '''
+    Returns the arrays of a fitted Prophet model that LiteForecaster
+    predicts from with NumPy alone: the trend changepoints and rates, the
+    seasonality Fourier coefficients, holiday indicator days, regressor
+    standardization and the noise level used for the intervals.
+
+    Only linear and flat growth and unconditional seasonalities are
+    supported, the setup ModelTrainer uses.
+    '''
+    try:
+        if model.growth not in ('linear', 'flat'):
+            raise ValueError(f"Growth '{model.growth}' is not supported by the lite model")
+        if any(props['condition_name'] is not None for props in model.seasonalities.values()):
+            raise ValueError("Conditional seasonalities are not supported by the lite model")
+
+        seasonal_features, _, component_cols, modes = model.make_all_seasonality_features(model.history)
+        columns = list(seasonal_features.columns)
+
+        seasonalities = [
+            {'name': name, 'period': float(props['period']), 'fourier_order': int(props['fourier_order'])}
+            for name, props in model.seasonalities.items()
+        ]
+        regressors = [
+            {'name': name, 'mu': float(props['mu']), 'std': float(props['std'])}
+            for name, props in model.extra_regressors.items()
+        ]
+        fourier_columns = [
+            f"{s['name']}_delim_{i + 1}" for s in seasonalities for i in range(2 * s['fourier_order'])
+        ]
+        regressor_columns = [r['name'] for r in regressors]
+        holiday_columns = columns[len(fourier_columns):len(columns) - len(regressor_columns)]
+        if columns == ['zeros']:
+            holiday_columns = []
+        elif columns[:len(fourier_columns)] != fourier_columns or columns[len(columns) - len(regressor_columns):] != regressor_columns:
+            raise ValueError("Unexpected seasonality feature layout, cannot export the lite model")
+
+        # Holidays are stored as (day, column) pairs of the indicator matrix
+        holiday_days = np.empty(0, dtype=np.int64)
+        holiday_cols = np.empty(0, dtype=np.int32)
+        if holiday_columns:
+            dates = pd.Series(pd.date_range(
+                model.history['ds'].min(),
+                model.history['ds'].max() + pd.Timedelta(days=HOLIDAY_HORIZON_DAYS),
+                freq='D'
+            ))
+            features = model.make_holiday_features(dates, model.construct_holiday_dataframe(dates))[0]
+            features = features.reindex(columns=holiday_columns, fill_value=0).to_numpy()
+            rows, holiday_cols = np.nonzero(features)
+            holiday_days = dates.to_numpy(dtype='datetime64[D]').astype(np.int64)[rows]
+            holiday_cols = holiday_cols.astype(np.int32)
+
+        meta = {
+            'growth': model.growth,
+            'k': float(np.nanmean(model.params['k'])),
+            'm': float(np.nanmean(model.params['m'])),
+            'sigma_obs': float(np.nanmean(model.params['sigma_obs'])),
+            'y_scale': float(model.y_scale),
+            'floor': float(model.y_min) if model.scaling == 'minmax' else 0.0,
+            'start': int(model.start.value),
+            't_scale': float(model.t_scale.value),
+            'history_dt': float(np.diff(model.history['t']).mean()) if len(model.history) > 1 else 1.0,
+            'interval_width': float(model.interval_width),
+            'seasonalities': seasonalities,
+            'holiday_columns': holiday_columns,
+            'regressors': regressors,
+            'components': list(component_cols.columns),
+            'additive_components': list(modes['additive']),
+            'column_mode': {
+                s['name']: model.seasonalities[s['name']]['mode'] for s in seasonalities
+            }
+        }
+
+        return {
+            'meta': np.array(json.dumps(meta)),
+            'changepoints_t': np.asarray(model.changepoints_t, dtype=np.float64),
+            'delta': np.nanmean(model.params['delta'], axis=0).astype(np.float64),
+            'beta': np.nanmean(model.params['beta'], axis=0).astype(np.float64),
+            'component_matrix': component_cols.to_numpy(dtype=np.float64),
+            'holiday_days': holiday_days,
+            'holiday_cols': holiday_cols,
+            'history_ds': model.history['ds'].to_numpy(dtype='datetime64[ns]').astype(np.int64),
+            'history_y': model.history['y'].to_numpy(dtype=np.float64)
+        }
+
+    except Exception as e:
+        raise CustomException(e, sys)
+
+def export_lite_model(model, file_path):
+    '''Exports a fitted Prophet model as a compact .npz artifact, see lite_model_arrays.'''
+    try:
+        arrays = lite_model_arrays(model)
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        tmp_path = file_path + '.tmp'
+        with open(tmp_path, 'wb') as file_obj:
+            np.savez(file_obj, **arrays)
+        os.replace(tmp_path, file_path)
+        logging.info(f"Exported lite model ({arrays['component_matrix'].shape[0]} features) to {file_path}")
+        return file_path
+
+    except Exception as e:
+        raise CustomException(e, sys)
+
+def export_lite_model_dir(model, dir_path):
+    '''
+    Exports a fitted Prophet model as a directory of .npy files, one per
+    array, which load_lite_model memory-maps: processes serving the same
+    directory then share one copy of the arrays in the page cache.
+    '''
+    try:
+        arrays = lite_model_arrays(model)
+        os.makedirs(dir_path, exist_ok=True)
+        for name, array in arrays.items():
+            np.save(os.path.join(dir_path, name + '.npy'), array, allow_pickle=False)
+        return dir_path
+
+    except Exception as e:
+        raise CustomException(e, sys)
+
+def load_lite_model(file_path):
+    '''Loads a lite model from an .npz file or, memory-mapped, from a directory of .npy files.'''
+    try:
+        if os.path.isdir(file_path):
+            arrays = {}
+            for name in os.listdir(file_path):
+                stem, extension = os.path.splitext(name)
+                if extension == '.npy':
+                    # The 0-d metadata string is read normally
+                    arrays[stem] = np.load(os.path.join(file_path, name), allow_pickle=False,
+                                           mmap_mode=None if stem == 'meta' else 'r')
+            return LiteForecaster(arrays)
+
+        with np.load(file_path, allow_pickle=False) as arrays:
+            return LiteForecaster({name: arrays[name] for name in arrays.files})
+
+    except Exception as e:
+        raise CustomException(e, sys)
+
+class LiteForecaster:
+    '''
+    Pure-NumPy stand-in for a fitted Prophet model, built from the artifact
+    written by export_lite_model. It offers the parts of the Prophet API
+    that serving uses (history, make_future_dataframe, predict, plot,
+    plot_components), so PredictPipeline works with either.
+
+    yhat, trend and the components match Prophet exactly. Instead of Monte
+    Carlo sampling the intervals use the closed-form variance of Prophet's
+    simulated future trend changes plus the observation noise, under a
+    normal approximation.
+    '''
+    def __init__(self, arrays):
+        self.meta = json.loads(str(arrays['meta']))
+        self.changepoints_t = arrays['changepoints_t']
+        self.delta = arrays['delta']
+        self.beta = arrays['beta']
+        self.component_matrix = arrays['component_matrix']
+        self.holiday_days = arrays['holiday_days']
+        self.holiday_cols = arrays['holiday_cols']
+        self.history = pd.DataFrame({
+            'ds': pd.to_datetime(arrays['history_ds']),
+            'y': arrays['history_y']
+        })
+        self.history_dates = pd.Series(self.history['ds'].unique())
+        self.interval_width = self.meta['interval_width']
+
+    @property
+    def extra_regressors(self):
+        '''Regressor name -> its standardization and mode, like Prophet's attribute.'''
+        return {regressor['name']: regressor for regressor in self.meta['regressors']}
+
+    def regressor_coefficients(self):
+        '''
+        Mode, center and coefficient (in data units, or relative to the
+        trend if multiplicative) of every regressor, like
+        prophet.utilities.regressor_coefficients.
+        '''
+        regressors = self.meta['regressors']
+        # The regressors are the last feature rows
+        first_row = self.component_matrix.shape[0] - len(regressors)
+        multiplicative_col = self.meta['components'].index('multiplicative_terms')
+        rows = []
+        for i, regressor in enumerate(regressors):
+            multiplicative = self.component_matrix[first_row + i, multiplicative_col] > 0
+            coef = self.beta[first_row + i] / regressor['std'] * (1.0 if multiplicative else self.meta['y_scale'])
+            rows.append({
+                'regressor': regressor['name'],
+                'regressor_mode': 'multiplicative' if multiplicative else 'additive',
+                'center': regressor['mu'],
+                'coef_lower': coef,
+                'coef': coef,
+                'coef_upper': coef
+            })
+        return pd.DataFrame(rows, columns=['regressor', 'regressor_mode', 'center', 'coef_lower', 'coef', 'coef_upper'])
+
+    def make_future_dataframe(self, periods, freq='D', include_history=True):
+        last_date = self.history_dates.max()
+        dates = pd.date_range(start=last_date, periods=periods + 1, freq=freq)
+        dates = dates[dates > last_date][:periods]
+        if include_history:
+            dates = np.concatenate((np.array(self.history_dates), dates))
+        return pd.DataFrame({'ds': dates})
+
+    def _time(self, ds):
+        ns = ds.to_numpy(dtype='datetime64[ns]').astype(np.int64)
+        return (ns - self.meta['start']) / self.meta['t_scale'], ns / NANOSECONDS_PER_DAY
+
+    def _trend(self, t):
+        if self.meta['growth'] == 'flat':
+            return np.full_like(t, self.meta['m'])
+        # Piecewise linear: every changepoint before t adjusts the rate and offset
+        active = self.changepoints_t[None, :] <= t[:, None]
+        deltas = active * self.delta
+        k_t = self.meta['k'] + deltas.sum(axis=1)
+        m_t = self.meta['m'] - (deltas * self.changepoints_t).sum(axis=1)
+        return k_t * t + m_t
+
+    @staticmethod
+    def _fourier(days, period, order):
+        x = 2 * np.pi * np.outer(days, np.arange(1, order + 1)) / period
+        features = np.empty((len(days), 2 * order))
+        features[:, 0::2] = np.sin(x)
+        features[:, 1::2] = np.cos(x)
+        return features
+
+    def _features(self, df, days):
+        blocks = [
+            self._fourier(days, s['period'], s['fourier_order']) for s in self.meta['seasonalities']
+        ]
+        n_holidays = len(self.meta['holiday_columns'])
+        if n_holidays:
+            unique_days, inverse = np.unique(np.floor(days).astype(np.int64), return_inverse=True)
+            rows = np.minimum(np.searchsorted(unique_days, self.holiday_days), len(unique_days) - 1)
+            found = unique_days[rows] == self.holiday_days
+            holidays = np.zeros((len(unique_days), n_holidays))
+            holidays[rows[found], self.holiday_cols[found]] = 1.0
+            blocks.append(holidays[inverse])
+        for regressor in self.meta['regressors']:
+            if regressor['name'] not in df:
+                raise ValueError(f"Regressor '{regressor['name']}' missing from dataframe")
+            values = pd.to_numeric(df[regressor['name']]).to_numpy(dtype=np.float64)
+            blocks.append(((values - regressor['mu']) / regressor['std'])[:, None])
+        if not blocks:
+            blocks.append(np.zeros((len(days), 1)))
+        return np.hstack(blocks)
+
+    def _trend_std(self, t):
+        '''
+        Standard deviation of Prophet's simulated future trend: a slope
+        change of Laplace(0, mean |delta|) size happens at every future step
+        with probability n_changepoints * dt, and the changes accumulate.
+        '''
+        std = np.zeros_like(t)
+        future = t > 1
+        if self.meta['growth'] == 'flat' or not future.any() or not len(self.changepoints_t):
+            return std
+        t_future = t[future]
+        dt = np.diff(t_future).mean() if len(t_future) > 1 else self.meta['history_dt']
+        likelihood = len(self.changepoints_t) * dt
+        scale = np.mean(np.abs(self.delta)) + 1e-8
+        n = np.arange(1, len(t_future) + 1)
+        variance = likelihood * 2 * scale ** 2 * dt ** 2 * n * (n + 1) * (2 * n + 1) / 6
+        std[np.flatnonzero(future)] = np.sqrt(variance)
+        return std
+
+    def predict(self, df):
+        '''Returns the forecast of the dates in df['ds'], in Prophet's column layout.'''
+        df = df.copy()
+        df['ds'] = pd.to_datetime(df['ds'])
+        df = df.sort_values('ds', kind='mergesort').reset_index(drop=True)
+        t, days = self._time(df['ds'])
+
+        y_scale = self.meta['y_scale']
+        trend = self._trend(t) * y_scale + self.meta['floor']
+
+        X = self._features(df, days)
+        component_values = X @ (self.component_matrix * self.beta[:, None])
+        additive = self.meta['additive_components']
+        components = {}
+        for i, name in enumerate(self.meta['components']):
+            values = component_values[:, i] * (y_scale if name in additive else 1.0)
+            components[name] = values
+            components[name + '_lower'] = values
+            components[name + '_upper'] = values
+
+        multiplicative_terms = components['multiplicative_terms']
+        yhat = trend * (1 + multiplicative_terms) + components['additive_terms']
+
+        z = NormalDist().inv_cdf((1 + self.interval_width) / 2)
+        trend_std = self._trend_std(t) * y_scale
+        yhat_std = np.sqrt((trend_std * (1 + multiplicative_terms)) ** 2 + (self.meta['sigma_obs'] * y_scale) ** 2)
+
+        forecast = pd.DataFrame({
+            'ds': df['ds'],
+            'trend': trend,
+            'yhat_lower': yhat - z * yhat_std,
+            'yhat_upper': yhat + z * yhat_std,
+            'trend_lower': trend - z * trend_std,
+            'trend_upper': trend + z * trend_std
+        })
+        forecast = pd.concat([forecast, pd.DataFrame(components)], axis=1)
+        forecast['yhat'] = yhat
+        return forecast
+
+    def seasonality(self, name, dates):
+        '''Values of one seasonality on dates, in data units (or relative for multiplicative ones).'''
+        _, days = self._time(pd.Series(pd.to_datetime(dates)))
+        offset = 0
+        for s in self.meta['seasonalities']:
+            width = 2 * s['fourier_order']
+            if s['name'] == name:
+                values = self._fourier(days, s['period'], s['fourier_order']) @ self.beta[offset:offset + width]
+                if self.meta['column_mode'][name] == 'additive':
+                    values = values * self.meta['y_scale']
+                return values
+            offset += width
+        raise KeyError(name)
+
+    def plot(self, fcst, figsize=(10, 6)):
+        '''Forecast with history and interval, in the style of Prophet.plot.'''
+        import matplotlib.pyplot as plt
+        fig = plt.figure(facecolor='w', figsize=figsize)
+        ax = fig.add_subplot(111)
+        ax.plot(self.history['ds'], self.history['y'], 'k.', label='Observed data points')
+        ax.plot(fcst['ds'], fcst['yhat'], ls='-', c='#0072B2', label='Forecast')
+        ax.fill_between(fcst['ds'], fcst['yhat_lower'], fcst['yhat_upper'], color='#0072B2', alpha=0.2,
+                        label='Uncertainty interval')
+        ax.grid(True, which='major', c='gray', ls='-', lw=1, alpha=0.2)
+        ax.set_xlabel('ds')
+        ax.set_ylabel('y')
+        fig.tight_layout()
+        return fig
+
+    def plot_components(self, fcst, figsize=None):
+        '''Trend, holidays/regressors and one period of every seasonality.'''
+        import matplotlib.pyplot as plt
+        panels = ['trend']
+        panels += [name for name in ('holidays', 'extra_regressors_additive', 'extra_regressors_multiplicative')
+                   if name in fcst and np.any(fcst[name] != 0)]
+        panels += [s['name'] for s in self.meta['seasonalities']]
+        fig, axes = plt.subplots(len(panels), 1, facecolor='w', figsize=figsize or (9, 3 * len(panels)))
+        axes = np.atleast_1d(axes)
+
+        periods = {s['name']: s['period'] for s in self.meta['seasonalities']}
+        for ax, name in zip(axes, panels):
+            if name not in periods:
+                ax.plot(fcst['ds'], fcst[name], ls='-', c='#0072B2')
+                if name == 'trend':
+                    ax.fill_between(fcst['ds'], fcst['trend_lower'], fcst['trend_upper'], color='#0072B2', alpha=0.2)
+            elif name == 'weekly':
+                days = pd.date_range('2017-01-01', periods=7)
+                ax.plot(range(7), self.seasonality(name, days), ls='-', c='#0072B2')
+                ax.set_xticks(range(7))
+                ax.set_xticklabels(days.day_name())
+            else:
+                dates = pd.date_range('2017-01-01', periods=max(int(np.ceil(periods[name])), 2))
+                ax.plot(dates, self.seasonality(name, dates), ls='-', c='#0072B2')
+            ax.grid(True, which='major', c='gray', ls='-', lw=1, alpha=0.2)
+            ax.set_ylabel(name)
+        fig.tight_layout()
+        return fig
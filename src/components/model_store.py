@@ -0,0 +1,260 @@
+import os
+import sys
+import json
+import time
+import uuid
+import shutil
+import argparse
+import threading
+from dataclasses import dataclass
+
+from src.exception import CustomException
+from src.logger import logging
+from src.utils import FRAME_EXTENSIONS, ARTIFACT_FORMAT, save_frame, load_frame, save_object, load_object, file_checksum, frame_fingerprint
+
+MODEL_FILE = 'model.json'
+# Models without a Prophet JSON form (e.g. the gbm backend's) are pickled
+PICKLED_MODEL_FILE = 'model.pkl'
+PROPHET_FORMAT = 'prophet-json'
+LITE_MODEL_DIR = 'lite'
+TRAIN_DATA_FILE = 'train_cleaned' + FRAME_EXTENSIONS[ARTIFACT_FORMAT]
+MANIFEST_FILE = 'manifest.json'
+POINTER_FILE = 'CURRENT'
+HISTORY_FILE = 'promotions.jsonl'
+
+@dataclass
+class ModelStoreConfig:
+    root_dir: str = os.path.join('artifacts', 'models')
+    # Versions kept on disk; older ones are pruned on promotion, never the current one
+    keep_versions: int = 10
+
+class ModelStore:
+    '''
+    Versioned store of trained models. Each version is an immutable
+    directory holding the model in Prophet's JSON format, its lite export
+    as memory-mappable .npy files, the training data it was fitted on and a
+    manifest with its metrics, params and data fingerprint. Models of
+    another format (their model_format attribute) are pickled instead and
+    served the same in both serving modes.
+
+    Versions are written to a staging directory and renamed into place, so
+    they appear complete or not at all. The served version is named by the
+    CURRENT pointer file, which promote() replaces atomically.
+    '''
+    def __init__(self, config: ModelStoreConfig = None):
+        self.config = config or ModelStoreConfig()
+
+    def version_dir(self, version):
+        return os.path.join(self.config.root_dir, version)
+
+    @property
+    def pointer_path(self):
+        return os.path.join(self.config.root_dir, POINTER_FILE)
+
+    def publish(self, model, train_df, metrics=None, params=None, extra=None):
+        '''
+        Writes a fitted model and its training data as a new version and
+        returns its manifest. The version is not served until it is
+        promoted.
+        '''
+        # Imported here: serving reads versions without needing the writers
+        from prophet.serialize import model_to_json
+        from src.components.lite_model import export_lite_model_dir
+
+        try:
+            model_format = getattr(model, 'model_format', PROPHET_FORMAT)
+            staging_dir = os.path.join(self.config.root_dir, f".staging-{uuid.uuid4().hex}")
+            os.makedirs(staging_dir)
+            try:
+                if model_format == PROPHET_FORMAT:
+                    with open(os.path.join(staging_dir, MODEL_FILE), 'w', encoding='utf-8') as file_obj:
+                        file_obj.write(model_to_json(model))
+                    export_lite_model_dir(model, os.path.join(staging_dir, LITE_MODEL_DIR))
+                    model_checksum = file_checksum(os.path.join(staging_dir, MODEL_FILE))
+                else:
+                    save_object(os.path.join(staging_dir, PICKLED_MODEL_FILE), model)
+                    model_checksum = file_checksum(os.path.join(staging_dir, PICKLED_MODEL_FILE))
+                version = time.strftime('%Y%m%dT%H%M%SZ', time.gmtime()) + '-' + model_checksum[:8]
+                final_dir = self.version_dir(version)
+                save_frame(train_df, os.path.join(staging_dir, TRAIN_DATA_FILE), export_csv=False)
+
+                files = {}
+                for dir_path, _, names in os.walk(staging_dir):
+                    for name in names:
+                        path = os.path.join(dir_path, name)
+                        files[os.path.relpath(path, staging_dir).replace(os.sep, '/')] = file_checksum(path)
+                manifest = {
+                    'version': version,
+                    'created_at': time.time(),
+                    'format': model_format,
+                    'metrics': metrics or {},
+                    'params': params or {},
+                    'data': {
+                        'fingerprint': frame_fingerprint(train_df),
+                        'n_rows': len(train_df),
+                        'start': str(train_df['ds'].min()),
+                        'end': str(train_df['ds'].max())
+                    },
+                    'files': dict(sorted(files.items()))
+                }
+                manifest.update(extra or {})
+                with open(os.path.join(staging_dir, MANIFEST_FILE), 'w', encoding='utf-8') as file_obj:
+                    json.dump(manifest, file_obj, indent=2, default=str)
+                os.rename(staging_dir, final_dir)
+            except BaseException:
+                shutil.rmtree(staging_dir, ignore_errors=True)
+                raise
+
+            logging.info(f"Published model version {version} to {final_dir}")
+            return manifest
+
+        except Exception as e:
+            raise CustomException(e, sys)
+
+    def manifest(self, version):
+        with open(os.path.join(self.version_dir(version), MANIFEST_FILE), 'r', encoding='utf-8') as file_obj:
+            return json.load(file_obj)
+
+    def versions(self):
+        '''Returns the manifests of all published versions, oldest first.'''
+        if not os.path.isdir(self.config.root_dir):
+            return []
+        manifests = [
+            self.manifest(name) for name in os.listdir(self.config.root_dir)
+            if os.path.exists(os.path.join(self.version_dir(name), MANIFEST_FILE))
+        ]
+        return sorted(manifests, key=lambda manifest: manifest['created_at'])
+
+    def current_version(self):
+        '''Returns the promoted version, or None if nothing was promoted yet.'''
+        try:
+            with open(self.pointer_path, 'r', encoding='utf-8') as file_obj:
+                return file_obj.read().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def promote(self, version):
+        '''Makes version the served one by atomically replacing the CURRENT pointer.'''
+        return self._promote(version)
+
+    def _promote(self, version, rollback=False):
+        try:
+            if not os.path.exists(os.path.join(self.version_dir(version), MANIFEST_FILE)):
+                raise ValueError(f"Unknown model version {version}")
+            previous = self.current_version()
+            tmp_path = self.pointer_path + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as file_obj:
+                file_obj.write(version + '\n')
+            os.replace(tmp_path, self.pointer_path)
+            with open(self.history_path, 'a', encoding='utf-8') as file_obj:
+                file_obj.write(json.dumps({
+                    'version': version, 'previous': previous, 'rollback': rollback, 'promoted_at': time.time()
+                }) + '\n')
+            logging.info(f"{'Rolled back to' if rollback else 'Promoted'} model version {version} (previous: {previous})")
+            self.prune()
+            return version
+
+        except Exception as e:
+            raise CustomException(e, sys)
+
+    @property
+    def history_path(self):
+        return os.path.join(self.config.root_dir, HISTORY_FILE)
+
+    def promotion_stack(self):
+        '''
+        Returns the promoted versions still in effect, oldest first, ending
+        with the current one: the promotion history replayed with every
+        rollback undoing the promotions after the version it returned to.
+        '''
+        stack = []
+        if not os.path.exists(self.history_path):
+            return stack
+        with open(self.history_path, 'r', encoding='utf-8') as file_obj:
+            for line in file_obj:
+                entry = json.loads(line)
+                if entry.get('rollback'):
+                    while stack and stack[-1] != entry['version']:
+                        stack.pop()
+                    if not stack:
+                        stack.append(entry['version'])
+                else:
+                    stack.append(entry['version'])
+        return stack
+
+    def rollback(self):
+        '''
+        Promotes the version that was current before the current one was
+        promoted; repeated rollbacks walk further back through the history.
+        '''
+        stack = self.promotion_stack()
+        if not stack:
+            raise CustomException("No promotion to roll back", sys)
+        for version in reversed(stack[:-1]):
+            if version != stack[-1] and os.path.exists(os.path.join(self.version_dir(version), MANIFEST_FILE)):
+                return self._promote(version, rollback=True)
+        raise CustomException(f"No version promoted before {stack[-1]} is left to roll back to", sys)
+
+    def prune(self):
+        '''Deletes the oldest versions beyond keep_versions, except the current one and its rollback target.'''
+        stack = self.promotion_stack()
+        keep = {self.current_version()} | set(stack[-2:])
+        versions = [manifest['version'] for manifest in self.versions()]
+        for version in versions[:max(len(versions) - self.config.keep_versions, 0)]:
+            if version not in keep:
+                shutil.rmtree(self.version_dir(version), ignore_errors=True)
+                logging.info(f"Pruned model version {version}")
+
+    def load_model(self, version, serving_mode='prophet'):
+        '''
+        Loads a version's Prophet model, or with serving_mode='lite' its
+        memory-mapped lite export. Pickled models are loaded in either mode.
+        '''
+        from src.components.lite_model import load_lite_model
+
+        version_dir = self.version_dir(version)
+        if self.manifest(version).get('format', PROPHET_FORMAT) != PROPHET_FORMAT:
+            return load_object(os.path.join(version_dir, PICKLED_MODEL_FILE))
+        if serving_mode == 'lite':
+            return load_lite_model(os.path.join(version_dir, LITE_MODEL_DIR))
+
+        from prophet.serialize import model_from_json
+        with open(os.path.join(version_dir, MODEL_FILE), 'r', encoding='utf-8') as file_obj:
+            return model_from_json(file_obj.read())
+
+    def load_train_data(self, version):
+        return load_frame(os.path.join(self.version_dir(version), TRAIN_DATA_FILE))
+
+_default_store = None
+_default_store_lock = threading.Lock()
+
+def get_model_store() -> ModelStore:
+    '''Returns the shared model store of this process, creating it on first use.'''
+    global _default_store
+    if _default_store is None:
+        with _default_store_lock:
+            if _default_store is None:
+                _default_store = ModelStore()
+    return _default_store
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="List, promote and roll back model versions.")
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('list', help="Show all versions with their metrics.")
+    promote = commands.add_parser('promote', help="Serve a version.")
+    promote.add_argument("version")
+    commands.add_parser('rollback', help="Serve the version that was current before the last promotion.")
+    return parser.parse_args(argv)
+
+if __name__ == "__main__":
+    args = parse_args()
+    store = ModelStore()
+    if args.command == 'list':
+        current = store.current_version()
+        for manifest in store.versions():
+            marker = '*' if manifest['version'] == current else ' '
+            print(f"{marker} {manifest['version']}  metrics={manifest['metrics']}  params={manifest['params']}")
+    elif args.command == 'promote':
+        store.promote(args.version)
+    elif args.command == 'rollback':
+        print(store.rollback())
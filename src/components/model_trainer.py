@@ -4,124 +4,621 @@ import pandas as pd
 import numpy as np
 import time
 import itertools
+import json
 import warnings
-from dataclasses import dataclass
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass, field
 from prophet import Prophet
-from prophet.diagnostics import cross_validation, performance_metrics
+from prophet.diagnostics import performance_metrics, generate_cutoffs
 
 from src.exception import CustomException
 from src.logger import logging
-from src.utils import save_object, get_holidays, mape
+from src.metrics import metrics, span, tracer
+from src.components.hyperparameter_search import get_search_strategy
+from src.components.lite_model import export_lite_model
+from src.components.holiday_provider import get_holiday_provider
+from src.components.model_store import ModelStore, ModelStoreConfig
+from src.components.backtesting import Backtester, BacktestConfig
+from src.components.regressor_store import RegressorStore, RegressorStoreConfig, TOTAL_TABLE
+from src.components.global_model import GlobalForecaster, GBM_PARAM_GRID, with_segment
+from src.utils import save_object, mape, load_frame
 import logging as py_logging 
 
+MODEL_BACKENDS = ('prophet', 'gbm')
+# Days held out at the end of the training data to tune the gbm backend,
+# the horizon of the Prophet cross-validation
+GBM_HOLDOUT_DAYS = 30
+
 @dataclass
 class ModelTrainerConfig:
+    # 'prophet' fits a Prophet model per series; 'gbm' one global scikit-learn
+    # gradient-boosting model across all series (see global_model.py)
+    model_backend: str = 'prophet'
     trained_model_file_path: str = os.path.join('artifacts', 'model.pkl')
+    # Pure-NumPy copy of the final model for serving without Prophet (None = skip the export)
+    lite_model_file_path: str = os.path.join('artifacts', 'model_lite.npz')
+    # Worker processes for the tuning loop (1 = run serially in this process)
+    n_jobs: int = 1
+    # Start each CV fit from the previous cutoff's fitted parameters. Off by default:
+    # it saves optimizer iterations on long histories but can settle in a
+    # slightly different optimum than a cold fit.
+    warm_start: bool = False
+    # One of 'grid', 'random', 'bayesian' or 'halving'
+    search_strategy: str = 'grid'
+    # Number of candidates evaluated by the random and bayesian strategies
+    search_trials: int = 20
+    # Fraction of candidates (1/eta) promoted to the next successive halving rung
+    halving_eta: int = 3
+    random_state: int = 42
+    tuning_trials_path: str = os.path.join('artifacts', 'tuning_trials.csv')
+    best_params_path: str = os.path.join('artifacts', 'best_params.json')
+    # Holiday calendars to model, e.g. ['MY'] or ['MY-SGR', 'SG'] (empty = no holidays)
+    holiday_calendars: list = field(default_factory=list)
+    # Custom event files with columns ds, holiday (and optionally lower_window, upper_window)
+    holiday_event_paths: list = field(default_factory=list)
+    # Years past the end of the training data covered by the holiday calendars
+    holiday_years_ahead: int = 2
+    # How tuning trials are scored: 'prophet' cross-validates each candidate in one
+    # task (warm-startable); 'backtest' fans every (candidate, cutoff) fold out over
+    # the pool and scores the mean fold MAPE
+    cv_backend: str = 'prophet'
+    # Regressors from the regressor store to fit as extra regressors, e.g.
+    # ['promotion', 'special_event'] (empty = none)
+    regressors: list = field(default_factory=list)
+    regressor_store_dir: str = os.path.join('artifacts', 'regressors')
+    # Versioned model store the final model is published to (None = don't publish)
+    model_store_dir: str = os.path.join('artifacts', 'models')
+
+PARAM_GRID = {
+    'changepoint_prior_scale': [0.01, 0.1, 0.5],
+    'seasonality_prior_scale': [0.1, 1.0, 10.0],
+    'holidays_prior_scale': [0.1, 1.0, 10.0],
+    'seasonality_mode': ['additive', 'multiplicative']
+}
+
+def silence_prophet_logs():
+    # Suppress Prophet's stan logs
+    warnings.filterwarnings('ignore')
+
+    # Set log levels to ERROR to hide INFO and WARNINGS
+    py_logging.getLogger('cmdstanpy').setLevel(py_logging.ERROR)
+    py_logging.getLogger('prophet').setLevel(py_logging.ERROR)
+
+def regressor_columns(df):
+    '''The extra regressors of a training frame: every column but ds and y.'''
+    return [col for col in df.columns if col not in ('ds', 'y')]
+
+def build_prophet(params, holidays_df=None, regressors=()):
+    '''
+    Creates an unfitted Prophet model for one set of hyperparameters,
+    with the holidays of holidays_df and the extra regressors if given.
+    '''
+    m = Prophet(
+        changepoint_prior_scale=params['changepoint_prior_scale'],
+        seasonality_prior_scale=params['seasonality_prior_scale'],
+        seasonality_mode=params['seasonality_mode'],
+        holidays=holidays_df,
+        holidays_prior_scale=params['holidays_prior_scale'],
+        daily_seasonality=False,
+        weekly_seasonality=True,
+        yearly_seasonality=True
+    )
+    for name in regressors:
+        m.add_regressor(name)
+    return m
+
+def warm_start_params(m):
+    '''
+    Returns the fitted parameters of m in the form Prophet.fit(init=...)
+    expects, so a similar model can start its optimization from them.
+    '''
+    res = {}
+    for pname in ['k', 'm', 'sigma_obs']:
+        res[pname] = m.params[pname][0][0]
+    for pname in ['delta', 'beta']:
+        res[pname] = m.params[pname][0]
+    return res
+
+def evaluate_params(params, train_df, cv_settings, warm_start=False, holidays_df=None):
+    '''
+    Cross-validates one hyperparameter combination and returns it together
+    with its MAPE (the mean over the cutoffs), the MAPE of every cutoff
+    under 'cutoff_mapes' (keyed by str(cutoff)), the number of Prophet fits
+    and the seconds it cost, or with the error message if a fit failed.
+
+    Cutoffs are fitted oldest first and, with warm_start, each fit starts
+    from the previous cutoff's parameters. Only the scores are returned;
+    the winner is fitted on all of train_df once, after the search.
+    '''
+    result = params.copy()
+    start_time = time.time()
+    n_fits = 0
+    try:
+        with span('prophet_cv', n_cutoffs=len(cv_settings['cutoffs']), **params):
+            history = train_df.assign(ds=pd.to_datetime(train_df['ds'])).sort_values('ds')
+            regressors = regressor_columns(train_df)
+            horizon = pd.Timedelta(cv_settings['horizon'])
+            init = None
+            cutoff_mapes = {}
+
+            for cutoff in sorted(cv_settings['cutoffs']):
+                m = build_prophet(params, holidays_df, regressors)
+                # Only yhat is scored, so skip the uncertainty simulation
+                m.uncertainty_samples = 0
+                fit_kwargs = {'init': init} if init is not None else {}
+                with span('prophet_fit', cutoff=str(cutoff.date()), **params):
+                    m.fit(history[history['ds'] <= cutoff], **fit_kwargs)
+                n_fits += 1
+                if warm_start:
+                    init = warm_start_params(m)
+
+                actuals = history[(history['ds'] > cutoff) & (history['ds'] <= cutoff + horizon)]
+                forecast = m.predict(actuals.drop(columns='y'))
+                df_cv = pd.DataFrame({
+                    'ds': actuals['ds'].values,
+                    'yhat': forecast['yhat'].values,
+                    'y': actuals['y'].values,
+                    'cutoff': cutoff
+                })
+                # Equal to the pooled MAPE for full horizons, and can be extended cutoff by cutoff
+                cutoff_mapes[str(cutoff)] = float(performance_metrics(df_cv, metrics=['mape'])['mape'].mean())
+
+            result['mape'] = float(np.mean(list(cutoff_mapes.values())))
+            result['cutoff_mapes'] = cutoff_mapes
+    except Exception as e:
+        result['error'] = str(e)
+    result['n_fits'] = n_fits
+    result['seconds'] = time.time() - start_time
+    return result
+
+# Tuning data shared with pool workers once, instead of pickling it per task
+_worker_state = {}
+
+def _init_tuning_worker(train_df, holidays_df=None):
+    silence_prophet_logs()
+    _worker_state['train_df'] = train_df
+    _worker_state['holidays_df'] = holidays_df
+
+def _evaluate_in_worker(params, cv_settings, warm_start):
+    with tracer.collect() as spans:
+        result = evaluate_params(
+            params, _worker_state['train_df'], cv_settings, warm_start, _worker_state['holidays_df']
+        )
+    # The parent merges the worker's spans into its own trace and metrics
+    result['spans'] = spans
+    return result
 
 class ModelTrainer:
-    def __init__(self):
-        self.model_trainer_config = ModelTrainerConfig()
+    def __init__(self, config: ModelTrainerConfig = None):
+        self.model_trainer_config = config or ModelTrainerConfig()
+        # Called with a dict after every tuning trial, e.g. by a training job
+        self.progress_callback = None
 
-    def initiate_model_training(self, cleaned_train_path, cleaned_test_path):
+    @contextmanager
+    def tuning_evaluator(self, train_df, cv_settings, holidays_df=None):
         '''
-        This function loads cleaned data, finds the best hyperparameters 
-        (including holiday effects) via cross-validation, then trains 
-        the single final model and saves it.
+        Yields evaluate(params_list, cutoffs, on_result) for the
+        search strategies. It runs serially or on one process pool kept open
+        for the whole search, depending on n_jobs. on_result is called with
+        each result as soon as it is in; results come back in the order of
+        params_list either way, so the best-params selection is identical.
         '''
-        logging.info("Entered model training method")
-        try:
-            cleaned_train_df = pd.read_csv(cleaned_train_path)
-            test_df = pd.read_csv(cleaned_test_path)
-            logging.info(f"Read cleaned train data ({len(cleaned_train_df)} rows) and test data ({len(test_df)} rows)")
+        n_jobs = self.model_trainer_config.n_jobs
+        warm_start = self.model_trainer_config.warm_start
+        if n_jobs is None or n_jobs < 1:
+            n_jobs = os.cpu_count() or 1
 
-            # Suppress Prophet's stan logs
-            warnings.filterwarnings('ignore')
+        if self.model_trainer_config.cv_backend == 'backtest':
+            with self.backtest_evaluator(train_df, cv_settings, holidays_df, n_jobs) as evaluate:
+                yield evaluate
+            return
 
-            # Set log levels to ERROR to hide INFO and WARNINGS 
-            py_logging.getLogger('cmdstanpy').setLevel(py_logging.ERROR)
-            py_logging.getLogger('prophet').setLevel(py_logging.ERROR)
-            
-            # Get Holidays (Because I don't know which country's data this is, so I am not using it in model training)
-            #logging.info("Loading Malaysia holiday data from utils")
-            #holidays_df = get_holidays()
+        if n_jobs == 1:
+            def evaluate(params_list, cutoffs, on_result):
+                results = []
+                for params in params_list:
+                    result = evaluate_params(params, train_df, dict(cv_settings, cutoffs=cutoffs), warm_start, holidays_df)
+                    on_result(result)
+                    results.append(result)
+                return results
 
-            # HYPERPARAMETER TUNING WITH CROSS-VALIDATION
-            logging.info("Starting hyperparameter tuning with cross-validation")
-            
-            param_grid = {
-                'changepoint_prior_scale': [0.01, 0.1, 0.5],
-                'seasonality_prior_scale': [0.1, 1.0, 10.0],
-                'holidays_prior_scale': [0.1, 1.0, 10.0],
-                'seasonality_mode': ['additive', 'multiplicative']
-            }
-            
-            all_params = [dict(zip(param_grid.keys(), v)) for v in itertools.product(*param_grid.values())]
-            logging.info(f"Testing {len(all_params)} parameter combinations")
+            yield evaluate
+            return
 
-            total_days = len(cleaned_train_df)
-            cv_initial = f'{int(total_days * 0.74)} days' 
-            cv_period = '30 days'
-            cv_horizon = '30 days'
-            logging.info(f"CV settings: Initial={cv_initial}, Period={cv_period}, Horizon={cv_horizon}")
+        logging.info(f"Running tuning on a pool of {n_jobs} worker processes")
+        with ProcessPoolExecutor(
+            max_workers=n_jobs,
+            initializer=_init_tuning_worker,
+            initargs=(train_df, holidays_df)
+        ) as executor:
+            def evaluate(params_list, cutoffs, on_result):
+                results = []
+                for result in executor.map(
+                    _evaluate_in_worker,
+                    params_list,
+                    itertools.repeat(dict(cv_settings, cutoffs=cutoffs)),
+                    itertools.repeat(warm_start)
+                ):
+                    tracer.add_events(result.pop('spans', []))
+                    on_result(result)
+                    results.append(result)
+                return results
 
-            results = []
-            start_time = time.time()
+            try:
+                yield evaluate
+            except BaseException:
+                # Don't wait for the queued trials of an aborted search
+                executor.shutdown(wait=False, cancel_futures=True)
+                raise
+
+    @contextmanager
+    def backtest_evaluator(self, train_df, cv_settings, holidays_df, n_jobs):
+        '''
+        The evaluate() of tuning_evaluator on a backtest session: all folds
+        of a batch run in parallel, and each candidate is reported, in
+        order, once all of its folds are in. Folds are independent, so
+        there is no warm start.
+        '''
+        backtester = Backtester(BacktestConfig(
+            horizon_days=pd.Timedelta(cv_settings['horizon']).days,
+            n_jobs=n_jobs,
+            min_train_rows=2,
+            uncertainty_samples=0,
+            results_path=None
+        ))
+        with backtester.session(train_df, holidays_df=holidays_df, regressor_cols=regressor_columns(train_df)) as session:
+            def evaluate(params_list, cutoffs, on_result):
+                tasks = session.tasks(params_list, cutoffs)
+                pending = [sum(1 for task in tasks if task[0] == i) for i in range(len(params_list))]
+                folds = [[] for _ in params_list]
+                results = []
+
+                def emit_ready():
+                    while len(results) < len(params_list) and pending[len(results)] == 0:
+                        i = len(results)
+                        result = dict(params_list[i], n_fits=len(folds[i]), seconds=sum(f['seconds'] for f in folds[i]))
+                        errors = [f['error'] for f in folds[i] if 'error' in f]
+                        if errors or not folds[i]:
+                            result['error'] = errors[0] if errors else 'No cutoff with enough data'
+                        else:
+                            result['mape'] = float(np.mean([f['mape'] for f in folds[i]]))
+                            result['cutoff_mapes'] = {str(f['cutoff']): f['mape'] for f in sorted(folds[i], key=lambda f: f['cutoff'])}
+                        on_result(result)
+                        results.append(result)
+
+                for row in session.iter_folds(params_list, cutoffs, tasks):
+                    folds[row['model']].append(row)
+                    pending[row['model']] -= 1
+                    emit_ready()
+                emit_ready()
+                return results
+
+            yield evaluate
+
+    def run_search(self, all_params, train_df, cv_settings, cutoffs, holidays_df=None):
+        '''
+        Runs the configured search strategy. Returns a dataframe with one
+        row per trial (the params, mape or error, n_fits, seconds, rung and
+        the number of cutoffs it was scored on).
+        '''
+        config = self.model_trainer_config
+        strategy = get_search_strategy(
+            config.search_strategy,
+            n_trials=config.search_trials,
+            eta=config.halving_eta,
+            random_state=config.random_state
+        )
+        logging.info(f"Search strategy: {strategy.name}")
+
+        progress = {'done': 0, 'best': float('inf')}
+
+        with self.tuning_evaluator(train_df, cv_settings, holidays_df) as evaluate:
+            def evaluate_with_progress(params_list, batch_cutoffs, prior=None):
+                # Results come back in the order of params_list
+                carried_scores = iter(prior or [{}] * len(params_list))
+
+                def on_result(result):
+                    carried = next(carried_scores)
+                    if carried and 'error' not in result:
+                        # Cutoffs scored in earlier calls count without being refitted
+                        result['cutoff_mapes'] = dict(carried, **result['cutoff_mapes'])
+                        result['mape'] = float(np.mean(list(result['cutoff_mapes'].values())))
+                    # Only trials scored on every cutoff can become the final model
+                    n_cutoffs = len(batch_cutoffs) + len(carried)
+                    complete = n_cutoffs == len(cutoffs)
+                    progress['done'] += 1
+                    metrics.inc('tuning_trials_total', status='error' if 'error' in result else 'ok')
+                    metrics.inc('prophet_fits_total', result['n_fits'])
+                    if 'error' in result:
+                        logging.warning(f"Failed tuning combo {({k: result[k] for k in PARAM_GRID})}: {result['error']}")
+                    elif complete and result['mape'] < progress['best']:
+                        # Strictly better only, so ties keep the earliest candidate
+                        progress['best'] = result['mape']
+                        metrics.set_gauge('tuning_best_mape', progress['best'])
 
-            # Run Tuning Loop
-            for idx, params in enumerate(all_params, 1):
-                try:
-                    m = Prophet(
-                        changepoint_prior_scale=params['changepoint_prior_scale'],
-                        seasonality_prior_scale=params['seasonality_prior_scale'],
-                        seasonality_mode=params['seasonality_mode'],
-                        #holidays=holidays_df, 
-                        holidays_prior_scale=params['holidays_prior_scale'],
-                        daily_seasonality=False,
-                        weekly_seasonality=True,
-                        yearly_seasonality=True
-                    )
-                    m.fit(cleaned_train_df) 
-                    
-                    df_cv = cross_validation(m, initial=cv_initial, period=cv_period, horizon=cv_horizon, parallel=None)
-                    df_p = performance_metrics(df_cv)
-                    
-                    result = params.copy()
-                    result['mape'] = df_p['mape'].mean()
-                    results.append(result)
-                    
                     # Log progress
-                    if idx % 5 == 0 or idx == len(all_params):
-                        logging.info(f"Completed {idx}/{len(all_params)} combinations. Current best MAPE: {min([r['mape'] for r in results]):.4f}")
+                    if progress['done'] % 5 == 0:
+                        logging.info(f"Completed {progress['done']} trials. Current best MAPE: {progress['best']:.4f}")
+                    if self.progress_callback is not None:
+                        self.progress_callback({
+                            'event': 'trial',
+                            'done': progress['done'],
+                            'n_candidates': len(all_params),
+                            'best_mape': progress['best'] if progress['best'] != float('inf') else None,
+                            'trial': dict(result),
+                            'n_cutoffs': n_cutoffs
+                        })
+
+                return evaluate(params_list, batch_cutoffs, on_result)
+
+            with span('tuning', strategy=strategy.name, n_candidates=len(all_params), n_cutoffs=len(cutoffs)):
+                trials = strategy.search(all_params, evaluate_with_progress, cutoffs)
+
+        return pd.DataFrame(trials)
+
+    def load_best_params(self):
+        '''
+        Returns the best hyperparameters saved by the last tuning run,
+        or None if there are none for the current PARAM_GRID.
+        '''
+        path = self.model_trainer_config.best_params_path
+        if not os.path.exists(path):
+            return None
+        with open(path, 'r', encoding='utf-8') as file_obj:
+            saved = json.load(file_obj)
+        if saved.get('param_grid') != self.param_grid() or saved.get('holidays', self.holiday_settings()) != self.holiday_settings():
+            return None
+        if saved.get('regressors', []) != list(self.model_trainer_config.regressors):
+            return None
+        return saved['params']
+
+    def save_best_params(self, best_params, best_mape):
+        os.makedirs(os.path.dirname(self.model_trainer_config.best_params_path), exist_ok=True)
+        with open(self.model_trainer_config.best_params_path, 'w', encoding='utf-8') as file_obj:
+            json.dump({
+                'params': best_params,
+                'cv_mape': best_mape,
+                'param_grid': self.param_grid(),
+                'holidays': self.holiday_settings(),
+                'regressors': list(self.model_trainer_config.regressors)
+            }, file_obj, indent=2)
+
+    def publish_model(self, model, train_df, best_params, test_mape):
+        '''Publishes the final model to the model store (unpromoted) and returns its version.'''
+        config = self.model_trainer_config
+        model_metrics = {'test_mape': test_mape, 'test_accuracy': 100 - test_mape}
+        if os.path.exists(config.best_params_path):
+            with open(config.best_params_path, 'r', encoding='utf-8') as file_obj:
+                saved = json.load(file_obj)
+            if saved.get('params') == best_params:
+                model_metrics['cv_mape'] = saved['cv_mape']
+        store = ModelStore(ModelStoreConfig(root_dir=config.model_store_dir))
+        manifest = store.publish(
+            model, train_df, metrics=model_metrics, params=best_params,
+            extra={'holidays': self.holiday_settings(), 'search_strategy': config.search_strategy,
+                   'regressors': list(config.regressors), 'model_backend': config.model_backend}
+        )
+        return manifest['version']
+
+    def param_grid(self):
+        return GBM_PARAM_GRID if self.model_trainer_config.model_backend == 'gbm' else PARAM_GRID
+
+    def holiday_settings(self):
+        config = self.model_trainer_config
+        return {'calendars': list(config.holiday_calendars), 'event_paths': list(config.holiday_event_paths)}
 
+    def load_holidays(self, train_df):
+        '''
+        Returns the holidays dataframe of the configured calendars over the
+        years of train_df plus holiday_years_ahead, or None without any.
+        '''
+        config = self.model_trainer_config
+        if not config.holiday_calendars and not config.holiday_event_paths:
+            return None
+        ds = pd.to_datetime(train_df['ds'])
+        years = range(ds.min().year, ds.max().year + config.holiday_years_ahead + 1)
+        return get_holiday_provider().get_holidays(
+            calendars=config.holiday_calendars,
+            years=years,
+            event_paths=config.holiday_event_paths
+        )
+
+    def attach_regressors(self, df):
+        '''
+        Returns df with the configured regressors as columns, aligned to its
+        dates by the regressor store (no join), or df itself without any.
+        '''
+        regressors = list(self.model_trainer_config.regressors)
+        if not regressors:
+            return df
+        store = RegressorStore(RegressorStoreConfig(store_dir=self.model_trainer_config.regressor_store_dir))
+        values = store.load(TOTAL_TABLE).aligned(df['ds'], columns=regressors)
+        return df.assign(**{col: values[:, i] for i, col in enumerate(regressors)})
+
+    def find_best_params(self, cleaned_train_df, holidays_df=None):
+        '''
+        Runs the hyperparameter search with cross-validation and returns
+        the best params.
+        '''
+        # HYPERPARAMETER TUNING WITH CROSS-VALIDATION
+        logging.info("Starting hyperparameter tuning with cross-validation")
+
+        all_params = [dict(zip(PARAM_GRID.keys(), v)) for v in itertools.product(*PARAM_GRID.values())]
+        logging.info(f"Testing {len(all_params)} parameter combinations")
+
+        total_days = len(cleaned_train_df)
+        cv_initial = f'{int(total_days * 0.74)} days'
+        cv_period = '30 days'
+        cv_horizon = '30 days'
+        logging.info(f"CV settings: Initial={cv_initial}, Period={cv_period}, Horizon={cv_horizon}")
+
+        # The cutoffs are computed once and shared by every trial
+        cutoffs = generate_cutoffs(
+            cleaned_train_df.assign(ds=pd.to_datetime(cleaned_train_df['ds'])),
+            horizon=pd.Timedelta(cv_horizon),
+            initial=pd.Timedelta(cv_initial),
+            period=pd.Timedelta(cv_period)
+        )
+        cv_settings = {'horizon': cv_horizon}
+
+        start_time = time.time()
+
+        # Run Tuning Loop
+        trials_df = self.run_search(all_params, cleaned_train_df, cv_settings, cutoffs, holidays_df)
+
+        os.makedirs(os.path.dirname(self.model_trainer_config.tuning_trials_path), exist_ok=True)
+        trials_df.to_csv(self.model_trainer_config.tuning_trials_path, index=False)
+        logging.info(
+            f"Ran {len(trials_df)} trials with {int(trials_df['n_fits'].sum())} Prophet fits "
+            f"(full grid: {len(all_params) * len(cutoffs)} fits). Trials saved to {self.model_trainer_config.tuning_trials_path}"
+        )
+
+        # Get Best Parameters
+        # Only trials scored on every cutoff are comparable with each other
+        results = trials_df[trials_df['n_cutoffs'] == len(cutoffs)]
+        if 'error' in results:
+            results = results[results['error'].isna()]
+        # Stable sort keeps candidate order among ties, whatever the backend
+        results_df = results.sort_values('mape', kind='stable').reset_index(drop=True)
+        if results_df.empty:
+            raise CustomException("All hyperparameter tuning combinations failed.", sys)
+
+        best_params = results_df[list(PARAM_GRID)].head(1).to_dict('records')[0]
+        best_mape = results_df.iloc[0]['mape']
+
+        logging.info(f"Tuning complete in {time.time() - start_time:.2f}s. Best CV MAPE: {best_mape:.4f}")
+        logging.info(f"Best parameters found: {best_params}")
+        self.save_best_params(best_params, best_mape)
+
+        return best_params
+
+    def fit_final_model(self, best_params, train_df, holidays_df=None):
+        '''Fits the one Prophet model of the best params on all of train_df.'''
+        final_model = build_prophet(best_params, holidays_df, self.model_trainer_config.regressors)
+        with span('prophet_fit', cutoff='final', **best_params):
+            final_model.fit(train_df)
+        return final_model
+
+    def fit_global_model(self, params, train_df):
+        '''Fits the gbm backend with params on the long frame train_df.'''
+        model = GlobalForecaster(params, random_state=self.model_trainer_config.random_state)
+        with span('gbm_fit', n_rows=len(train_df), **params):
+            return model.fit(train_df)
+
+    def evaluate_global_model(self, model, test_df):
+        '''
+        Returns the MAPE of a fitted GlobalForecaster on test_df over all
+        rows, and per segment. Rows of segments it was not fitted on are
+        not scored.
+        '''
+        test_df = with_segment(test_df)
+        test_df = test_df[test_df['segment'].isin(model.segments)]
+        scored = test_df[['segment', 'y']].assign(yhat=model.predict_frame(test_df['segment'], test_df['ds'])[0])
+        by_segment = {key: float(mape(group['y'], group['yhat'])) for key, group in scored.groupby('segment')}
+        return float(mape(scored['y'], scored['yhat'])), by_segment
+
+    def find_best_global_params(self, train_df):
+        '''
+        Tunes the gbm backend on the last GBM_HOLDOUT_DAYS of train_df,
+        forecast recursively from the days before and scored with MAPE.
+        Returns the best params, their holdout MAPE and the trials.
+        '''
+        logging.info("Starting gbm hyperparameter tuning on a holdout")
+        all_params = [dict(zip(GBM_PARAM_GRID.keys(), v)) for v in itertools.product(*GBM_PARAM_GRID.values())]
+        ds = pd.to_datetime(train_df['ds'])
+        cutoff = ds.max() - pd.Timedelta(days=GBM_HOLDOUT_DAYS)
+        history, holdout = train_df[ds <= cutoff], train_df[ds > cutoff]
+        logging.info(f"Testing {len(all_params)} parameter combinations, holdout after {cutoff.date()}")
+
+        trials, best_mape = [], float('inf')
+        with span('tuning', strategy='holdout', n_candidates=len(all_params), n_cutoffs=1):
+            for params in all_params:
+                start_time = time.time()
+                trial = params.copy()
+                try:
+                    trial['mape'] = self.evaluate_global_model(self.fit_global_model(params, history), holdout)[0]
                 except Exception as e:
-                    logging.warning(f"Failed tuning combo {params}: {e}")
-					
-            # Get Best Parameters
-            results_df = pd.DataFrame(results).sort_values('mape').reset_index(drop=True)
-            if results_df.empty:
-                raise CustomException("All hyperparameter tuning combinations failed.", sys)
-                
-            best_params = results_df.iloc[0].to_dict()
-            best_mape = best_params.pop('mape')
-            
-            logging.info(f"Tuning complete in {time.time() - start_time:.2f}s. Best CV MAPE: {best_mape:.4f}")
-            logging.info(f"Best parameters found: {best_params}")
+                    trial['error'] = str(e)
+                trial.update(n_fits=1, seconds=time.time() - start_time, n_cutoffs=1)
+                trials.append(trial)
+
+                metrics.inc('tuning_trials_total', status='error' if 'error' in trial else 'ok')
+                if 'error' in trial:
+                    logging.warning(f"Failed tuning combo {params}: {trial['error']}")
+                elif trial['mape'] < best_mape:
+                    best_mape = trial['mape']
+                    metrics.set_gauge('tuning_best_mape', best_mape)
+                if self.progress_callback is not None:
+                    self.progress_callback({
+                        'event': 'trial',
+                        'done': len(trials),
+                        'n_candidates': len(all_params),
+                        'best_mape': best_mape if best_mape != float('inf') else None,
+                        'trial': trial,
+                        'n_cutoffs': 1
+                    })
+
+        trials_df = pd.DataFrame(trials)
+        results = trials_df[trials_df['error'].isna()] if 'error' in trials_df else trials_df
+        if results.empty:
+            raise CustomException("All hyperparameter tuning combinations failed.", sys)
+        results = results.sort_values('mape', kind='stable')
+        best_params = results[list(GBM_PARAM_GRID)].head(1).to_dict('records')[0]
+        logging.info(f"Best holdout MAPE: {results.iloc[0]['mape']:.4f} with {best_params}")
+        return best_params, float(results.iloc[0]['mape']), trials_df
+
+    def initiate_model_training(self, cleaned_train_path, cleaned_test_path, best_params=None):
+        '''
+        This function loads cleaned data, finds the best hyperparameters 
+        (including holiday effects) via cross-validation, then trains 
+        the single final model and saves it.
+
+        If best_params is given the search is skipped and the final model
+        is simply refitted with them, e.g. after new days were appended.
+
+        With model_backend='gbm' the model is a GlobalForecaster of the one
+        series, tuned on a holdout instead and evaluated the same way.
+        '''
+        logging.info("Entered model training method")
+        try:
+            cleaned_train_df = load_frame(cleaned_train_path)
+            test_df = load_frame(cleaned_test_path)
+            logging.info(f"Read cleaned train data ({len(cleaned_train_df)} rows) and test data ({len(test_df)} rows)")
+            # Every fit, and the published training data, carry the regressors as columns
+            cleaned_train_df = self.attach_regressors(cleaned_train_df)
+            if self.model_trainer_config.regressors:
+                logging.info(f"Fitting with regressors {self.model_trainer_config.regressors}")
+            gbm = self.model_trainer_config.model_backend == 'gbm'
+            if gbm and self.model_trainer_config.regressors:
+                raise ValueError("The gbm backend does not support regressors, use the prophet backend.")
+
+            silence_prophet_logs()
+
+            # Get Holidays (off unless calendars are configured, as we don't know which country's data this is)
+            # Built once here and shared by every tuning fit
+            holidays_df = self.load_holidays(cleaned_train_df)
+            if gbm and holidays_df is not None:
+                logging.warning("The gbm backend models the calendar itself, ignoring the holiday calendars")
+
+            if best_params is not None:
+                logging.info(f"Skipping tuning, refitting with the previous best parameters: {best_params}")
+            elif gbm:
+                best_params, best_mape, trials_df = self.find_best_global_params(cleaned_train_df)
+                os.makedirs(os.path.dirname(self.model_trainer_config.tuning_trials_path), exist_ok=True)
+                trials_df.to_csv(self.model_trainer_config.tuning_trials_path, index=False)
+                self.save_best_params(best_params, best_mape)
+            else:
+                best_params = self.find_best_params(cleaned_train_df, holidays_df)
 
             #  TRAIN FINAL MODEL
+            # Once, for the winning params only
             logging.info("Training final model on the full cleaned training dataset...")
-            
-            final_model = Prophet(
-                changepoint_prior_scale=best_params['changepoint_prior_scale'],
-                seasonality_prior_scale=best_params['seasonality_prior_scale'],
-                seasonality_mode=best_params['seasonality_mode'],
-                #holidays=holidays_df,
-                holidays_prior_scale=best_params['holidays_prior_scale'],
-                daily_seasonality=False,
-                weekly_seasonality=True,
-                yearly_seasonality=True
-            )
-            
-            final_model.fit(cleaned_train_df) 
+            if gbm:
+                # The single series behind the same interface as a Prophet model
+                final_model = self.fit_global_model(best_params, cleaned_train_df).series()
+            else:
+                final_model = self.fit_final_model(best_params, cleaned_train_df, holidays_df)
             logging.info("Final model trained.")
 
             # Save the Model Artifact
@@ -130,12 +627,15 @@ class ModelTrainer:
                 file_path=self.model_trainer_config.trained_model_file_path,
                 obj=final_model
             )
+            if self.model_trainer_config.lite_model_file_path and not gbm:
+                export_lite_model(final_model, self.model_trainer_config.lite_model_file_path)
 
             # Evaluate on Test Set
             logging.info("Evaluating final model on unseen test data")
             
-            future = final_model.make_future_dataframe(periods=len(test_df))
-            forecast = final_model.predict(future)
+            with span('evaluate_test', n_rows=len(test_df)):
+                future = self.attach_regressors(final_model.make_future_dataframe(periods=len(test_df)))
+                forecast = final_model.predict(future)
             
             test_predictions = forecast.iloc[-len(test_df):]['yhat']
             test_actuals = test_df['y']
@@ -150,9 +650,14 @@ class ModelTrainer:
             if test_mape > 25: 
                 raise CustomException(f"Model accuracy ({test_accuracy}%) is too low (Threshold > 25% MAPE).", sys)
 
+            version = None
+            if self.model_trainer_config.model_store_dir:
+                version = self.publish_model(final_model, cleaned_train_df, best_params, test_mape)
+
             return (
                 test_accuracy,
-                self.model_trainer_config.trained_model_file_path
+                self.model_trainer_config.trained_model_file_path,
+                version
             )
 
         except Exception as e:
@@ -0,0 +1,248 @@
+import os
+import sys
+import threading
+import numpy as np
+import pandas as pd
+from dataclasses import dataclass, field
+
+from src.exception import CustomException
+from src.logger import logging
+from src.utils import load_frame
+
+# Segment name used for a single, unsegmented series
+TOTAL_SEGMENT = 'total'
+# Scales a median absolute deviation to the standard deviation of normal data
+MAD_TO_STD = 1.4826
+
+BOUNDARY_COLUMNS = ['detector', 'segment', 'period', 'season', 'center', 'scale', 'threshold', 'lower', 'upper']
+
+@dataclass
+class OutlierDetectionConfig:
+    # Detectors run on every series; a row is an outlier if any of them flags it.
+    # From 'zscore', 'rolling_mad', 'rolling_iqr' and 'seasonal_residual'
+    detectors: list = field(default_factory=lambda: ['zscore'])
+    zscore_threshold: float = 13.59  # ~95.44% of data
+    # Days in the centered window of the rolling detectors
+    rolling_window: int = 28
+    mad_threshold: float = 3.5
+    # Tukey's fences: outside q1 - k * IQR and q3 + k * IQR
+    iqr_k: float = 1.5
+    # Days per season of the seasonal-residual detector (7 = day of week)
+    seasonal_period: int = 7
+    seasonal_threshold: float = 3.5
+
+def season_of(ds, period):
+    '''Position of each date in a season of period days (the weekday for 7).'''
+    days = pd.to_datetime(ds).to_numpy(dtype='datetime64[D]').astype(np.int64)
+    # 1970-01-01 was a Thursday; shift so that 0 is Monday as in dayofweek
+    return (days + 3) % period
+
+class ZScoreDetector:
+    '''Mean and standard deviation of each series.'''
+    period = 0
+
+    def __init__(self, config):
+        self.threshold = config.zscore_threshold
+
+    def fit(self, frame):
+        groups = frame.groupby('code', sort=False)['y']
+        center = groups.transform('mean').to_numpy()
+        scale = groups.transform('std').to_numpy()
+        return center, scale, frame.assign(center=center, scale=scale).groupby('code').tail(1)
+
+class RollingMADDetector:
+    '''Rolling median and median absolute deviation in a centered window.'''
+    period = 0
+
+    def __init__(self, config):
+        self.threshold = config.mad_threshold
+        self.window = config.rolling_window
+
+    def rolling(self, frame, values):
+        return values.groupby(frame['code'], sort=False).rolling(
+            self.window, center=True, min_periods=max(self.window // 4, 2)
+        )
+
+    def fit(self, frame):
+        center = self.rolling(frame, frame['y']).median().droplevel(0).reindex(frame.index)
+        deviation = (frame['y'] - center).abs()
+        scale = MAD_TO_STD * self.rolling(frame, deviation).median().droplevel(0).reindex(frame.index)
+        center, scale = center.to_numpy(), scale.to_numpy()
+        # New data is judged by the window at the end of each series
+        return center, scale, frame.assign(center=center, scale=scale).groupby('code').tail(1)
+
+class RollingIQRDetector(RollingMADDetector):
+    '''
+    Tukey's fences in a centered rolling window, written as a center (the
+    quartiles' midpoint) and scale (the IQR) with threshold 0.5 + k.
+    '''
+    def __init__(self, config):
+        super().__init__(config)
+        self.threshold = 0.5 + config.iqr_k
+
+    def fit(self, frame):
+        q1 = self.rolling(frame, frame['y']).quantile(0.25).droplevel(0).reindex(frame.index).to_numpy()
+        q3 = self.rolling(frame, frame['y']).quantile(0.75).droplevel(0).reindex(frame.index).to_numpy()
+        center, scale = (q1 + q3) / 2, q3 - q1
+        return center, scale, frame.assign(center=center, scale=scale).groupby('code').tail(1)
+
+class SeasonalResidualDetector:
+    '''
+    Median of each season (e.g. weekday) of a series as its expected
+    value, and the robust spread of the residuals around it.
+    '''
+    def __init__(self, config):
+        self.threshold = config.seasonal_threshold
+        self.period = config.seasonal_period
+
+    def fit(self, frame):
+        profile = frame.groupby(['code', 'season'], sort=False)['y'].transform('median')
+        residual = frame['y'] - profile
+        codes = frame['code']
+        residual_median = residual.groupby(codes, sort=False).transform('median')
+        mad = (residual - residual_median).abs().groupby(codes, sort=False).transform('median')
+        center = (profile + residual_median).to_numpy()
+        scale = (MAD_TO_STD * mad).to_numpy()
+        fitted = frame.assign(center=center, scale=scale)
+        return center, scale, fitted.drop_duplicates(['code', 'season'])
+
+DETECTORS = {
+    'zscore': ZScoreDetector,
+    'rolling_mad': RollingMADDetector,
+    'rolling_iqr': RollingIQRDetector,
+    'seasonal_residual': SeasonalResidualDetector
+}
+
+def get_detector(name, config):
+    if name not in DETECTORS:
+        raise ValueError(f"Unknown outlier detector '{name}'. Choose from {sorted(DETECTORS)}")
+    return DETECTORS[name](config)
+
+def outlier_scores(y, center, scale):
+    '''|y - center| / scale, NaN where the scale is zero or unknown (never an outlier).'''
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.abs((np.asarray(y, dtype=np.float64) - center) / np.where(scale > 0, scale, np.nan))
+
+class OutlierFilter:
+    '''
+    Fits the configured detectors on every series of a long frame at
+    once: each detector is a handful of grouped pandas operations over all
+    segments, with no loop per series. Each yields a center and scale per
+    row; a row is an outlier when |y - center| / scale exceeds the
+    detector's threshold.
+
+    The fitted boundaries (per segment, and per season for the seasonal
+    detector) are returned as a table that apply() uses to judge new
+    data, e.g. the test set or observations arriving at serving time.
+    '''
+    def __init__(self, config: OutlierDetectionConfig = None):
+        self.config = config or OutlierDetectionConfig()
+        self.detectors = {name: get_detector(name, self.config) for name in self.config.detectors}
+
+    @staticmethod
+    def _frame(df, segment_col):
+        segments = df[segment_col] if segment_col else pd.Series(TOTAL_SEGMENT, index=df.index)
+        codes, names = pd.factorize(segments, sort=True)
+        frame = pd.DataFrame({'code': codes, 'ds': pd.to_datetime(df['ds']), 'y': df['y'].astype(np.float64)},
+                             index=df.index)
+        # Stable, so rows of a series keep their order when ds ties
+        return frame.sort_values(['code', 'ds'], kind='stable'), names
+
+    def fit(self, df, segment_col=None):
+        '''
+        Returns a boolean outlier mask aligned with df, the number of rows
+        each detector flagged and the boundaries table.
+        '''
+        try:
+            frame, names = self._frame(df, segment_col)
+            mask = np.zeros(len(frame), dtype=bool)
+            counts = {}
+            boundaries = []
+            for name, detector in self.detectors.items():
+                if detector.period:
+                    frame['season'] = season_of(frame['ds'], detector.period)
+                else:
+                    frame['season'] = -1
+                center, scale, fitted = detector.fit(frame)
+                flagged = outlier_scores(frame['y'], center, scale) > detector.threshold
+                counts[name] = int(flagged.sum())
+                mask |= flagged
+                boundaries.append(pd.DataFrame({
+                    'detector': name,
+                    'segment': np.asarray(names, dtype=object)[fitted['code'].to_numpy()],
+                    'period': detector.period,
+                    'season': fitted['season'].to_numpy(),
+                    'center': fitted['center'].to_numpy(),
+                    'scale': fitted['scale'].to_numpy(),
+                    'threshold': detector.threshold
+                }))
+
+            boundaries = pd.concat(boundaries, ignore_index=True)
+            boundaries['lower'] = boundaries['center'] - boundaries['threshold'] * boundaries['scale']
+            boundaries['upper'] = boundaries['center'] + boundaries['threshold'] * boundaries['scale']
+            boundaries = boundaries.sort_values(['detector', 'segment', 'season'], kind='stable')[BOUNDARY_COLUMNS]
+            return pd.Series(mask, index=frame.index).reindex(df.index).to_numpy(), counts, boundaries.reset_index(drop=True)
+
+        except Exception as e:
+            raise CustomException(e, sys)
+
+    @staticmethod
+    def apply(df, boundaries, segment_col=None):
+        '''
+        Returns a boolean outlier mask of df from fitted boundaries. Rows of
+        segments (or seasons) without boundaries are never outliers.
+        '''
+        try:
+            segments = df[segment_col].to_numpy(dtype=object) if segment_col else np.full(len(df), TOTAL_SEGMENT, dtype=object)
+            y = df['y'].to_numpy(dtype=np.float64)
+            mask = np.zeros(len(df), dtype=bool)
+            for _, fitted in boundaries.groupby('detector', sort=False):
+                period = int(fitted['period'].iloc[0])
+                keys = pd.DataFrame({
+                    'segment': segments,
+                    'season': season_of(df['ds'], period) if period else -1
+                })
+                matched = keys.merge(fitted, on=['segment', 'season'], how='left')
+                mask |= outlier_scores(y, matched['center'].to_numpy(), matched['scale'].to_numpy()) \
+                    > matched['threshold'].to_numpy()
+            return mask
+
+        except Exception as e:
+            raise CustomException(e, sys)
+
+def log_outliers(label, n_rows, counts, mask):
+    for name, count in counts.items():
+        logging.info(f"{label}: detector '{name}' flagged {count} of {n_rows} rows")
+    logging.info(f"{label}: dropping {int(mask.sum())} outlier rows, {n_rows - int(mask.sum())} remain")
+
+class BoundaryCache:
+    '''
+    The saved outlier boundaries for serving-time checks: each file is read
+    once and re-read only after training rewrote it. A missing file raises
+    FileNotFoundError.
+    '''
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._frames = {}
+
+    def load(self, path):
+        with self._lock:
+            mtime = os.stat(path).st_mtime_ns
+            cached = self._frames.get(path)
+            if cached is not None and cached[0] == mtime:
+                return cached[1]
+            boundaries = load_frame(path)
+            self._frames[path] = (mtime, boundaries)
+            return boundaries
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+def get_boundary_cache() -> BoundaryCache:
+    '''Returns the shared boundary cache of this process, creating it on first use.'''
+    global _default_cache
+    if _default_cache is None:
+        with _default_cache_lock:
+            if _default_cache is None:
+                _default_cache = BoundaryCache()
+    return _default_cache
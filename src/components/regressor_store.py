@@ -0,0 +1,387 @@
+import os
+import sys
+import glob
+import json
+import uuid
+import shutil
+import hashlib
+import argparse
+import warnings
+import threading
+import numpy as np
+import pandas as pd
+from dataclasses import dataclass, field
+
+from src.exception import CustomException
+from src.logger import logging
+from src.utils import load_frame
+from src.components.outlier_detection import TOTAL_SEGMENT
+
+# Source columns the regressors are derived from; any of them may be missing
+SOURCE_COLUMNS = ['has_promotion', 'special_event', 'weather_condition', 'actual_selling_price', 'observed_market_price']
+TRUE_VALUES = ['TRUE', 'True', 'true', '1']
+# Table of the grand total series and of the segments of the last segment ingestion
+TOTAL_TABLE = 'total'
+SEGMENT_TABLE = 'segments'
+VALUES_FILE = 'values.npy'
+FILL_FILE = 'fill.npy'
+# Regressors filled with 0 ("no promotion") on days without a value, e.g.
+# future days missing from the calendars. The others get the segment's mean.
+ZERO_FILLED = ('promotion', 'special_event')
+
+@dataclass
+class RegressorStoreConfig:
+    store_dir: str = os.path.join('artifacts', 'regressors')
+    # Future regressor calendars applied on every build, in addition to the ones added
+    # with add_calendar: files (or glob patterns) with columns ds, optionally segment,
+    # and any regressor columns, e.g. a promotion plan
+    calendar_paths: list = field(default_factory=list)
+
+def regressor_sums(chunk):
+    '''
+    Per-row terms of the daily regressors of a chunk of source rows, to be
+    summed per (date, group) along with quantity_sold: the row count, rows
+    on promotion, rows during an event, the selling / market price ratio
+    with the count of rows that have one, and one count column per weather
+    condition.
+    '''
+    sums = pd.DataFrame({'n_rows': np.ones(len(chunk), dtype=np.float32)}, index=chunk.index)
+    if 'has_promotion' in chunk:
+        sums['promotion'] = chunk['has_promotion'].isin(TRUE_VALUES).astype(np.float32)
+    if 'special_event' in chunk:
+        sums['special_event'] = chunk['special_event'].isin(TRUE_VALUES).astype(np.float32)
+    if 'actual_selling_price' in chunk and 'observed_market_price' in chunk:
+        with np.errstate(divide='ignore', invalid='ignore'):
+            ratio = chunk['actual_selling_price'].to_numpy(dtype=np.float64) / chunk['observed_market_price'].to_numpy(dtype=np.float64)
+        priced = np.isfinite(ratio)
+        sums['price_index'] = np.where(priced, ratio, 0).astype(np.float32)
+        sums['n_priced'] = priced.astype(np.float32)
+    if 'weather_condition' in chunk:
+        weather = pd.get_dummies(chunk['weather_condition'], dtype=np.float32)
+        weather.columns = ['weather_' + str(name).strip().lower().replace(' ', '_') for name in weather.columns]
+        sums = sums.join(weather)
+    return sums
+
+def daily_regressors(df, keys):
+    '''
+    Turns the summed terms of regressor_sums into the daily regressors of
+    every (ds, group): the share of rows on promotion, during an event and
+    per weather condition, and the mean price index over the rows with a
+    price (NaN on days without any).
+    '''
+    columns = [col for col in df.columns if col not in keys and col not in ('n_rows', 'n_priced', 'y')]
+    n_rows = df['n_rows'].to_numpy(dtype=np.float64)
+    regressors = df[keys].copy()
+    for col in columns:
+        counts = df['n_priced'].to_numpy(dtype=np.float64) if col == 'price_index' else n_rows
+        with np.errstate(divide='ignore', invalid='ignore'):
+            regressors[col] = np.where(counts > 0, df[col].to_numpy(dtype=np.float64) / counts, np.nan).astype(np.float32)
+    return regressors
+
+def resolve_calendar_paths(patterns):
+    paths = []
+    for pattern in patterns:
+        matches = sorted(glob.glob(pattern)) if glob.has_magic(pattern) else [pattern]
+        paths.extend(path for path in matches if os.path.isfile(path) and path not in paths)
+    return paths
+
+def calendar_values(column):
+    '''A calendar column as floats; TRUE/FALSE flags become 1/0.'''
+    if column.dtype == object:
+        flags = column.astype(str).str.upper()
+        column = column.mask(flags == 'TRUE', 1).mask(flags == 'FALSE', 0)
+    return pd.to_numeric(column, errors='coerce').to_numpy(dtype=np.float64)
+
+class RegressorTable:
+    '''
+    The daily regressors of a set of segments as one dense float32 array of
+    shape (segments, days, regressors), memory-mapped from disk. Lookups
+    turn dates into day offsets and segments into row numbers, so aligning
+    the regressors with any frame is a single fancy-indexing operation.
+    NaN marks a day without a value, which is filled per segment.
+    '''
+    def __init__(self, meta, values, fill):
+        self.meta = meta
+        self.version = meta['version']
+        self.start = np.datetime64(meta['start'], 'D')
+        self.columns = list(meta['columns'])
+        self.segments = pd.Index(meta['segments'])
+        self.values = values
+        self.fill = fill
+
+    @property
+    def end(self):
+        return self.start + np.timedelta64(self.values.shape[1] - 1, 'D')
+
+    def _column_index(self, columns):
+        missing = [col for col in columns if col not in self.columns]
+        if missing:
+            raise KeyError(f"Unknown regressors {missing}, the store has {self.columns}")
+        return np.array([self.columns.index(col) for col in columns], dtype=np.intp)
+
+    def aligned(self, ds, segments=TOTAL_SEGMENT, columns=None):
+        '''
+        Returns the regressors (all, or the given columns in that order) of
+        every (ds, segment) as a float64 array of shape (len(ds), columns).
+        segments is one key for all rows or one per row.
+        '''
+        columns = self.columns if columns is None else list(columns)
+        col_idx = self._column_index(columns)
+        days = (pd.to_datetime(ds).to_numpy(dtype='datetime64[D]') - self.start).astype(np.int64)
+        if isinstance(segments, str):
+            codes = np.full(len(days), self.segments.get_loc(segments), dtype=np.intp)
+        else:
+            codes = self.segments.get_indexer(np.asarray(segments, dtype=object))
+            if (codes < 0).any():
+                raise KeyError(f"Unknown segments, e.g. '{np.asarray(segments, dtype=object)[codes < 0][0]}'")
+
+        out = np.full((len(days), len(columns)), np.nan)
+        inside = (days >= 0) & (days < self.values.shape[1])
+        out[inside] = self.values[codes[inside], days[inside]][:, col_idx]
+        fill = self.fill[codes][:, col_idx]
+        return np.where(np.isnan(out), fill, out)
+
+    def frame(self, ds, segments=TOTAL_SEGMENT, columns=None):
+        '''aligned() as a dataframe with one column per regressor.'''
+        columns = self.columns if columns is None else list(columns)
+        return pd.DataFrame(self.aligned(ds, segments, columns), columns=columns)
+
+class RegressorStore:
+    '''
+    Date- and segment-indexed store of the regressors (promotions, events,
+    weather and price) built during ingestion.
+
+    Each table is a directory named after its content hash holding the
+    values and fill arrays as .npy files; the table's <name>.json pointer
+    names the current directory and is replaced atomically, so readers
+    always see a complete table. Loaded tables are cached and reloaded
+    when the pointer changes.
+    '''
+    def __init__(self, config: RegressorStoreConfig = None):
+        self.config = config or RegressorStoreConfig()
+        self._lock = threading.Lock()
+        self._tables = {}
+
+    def meta_path(self, table):
+        return os.path.join(self.config.store_dir, f"{table}.json")
+
+    @property
+    def calendar_dir(self):
+        return os.path.join(self.config.store_dir, 'calendars')
+
+    def calendar_paths(self):
+        '''The added and the configured future regressor calendar files.'''
+        return resolve_calendar_paths([os.path.join(self.calendar_dir, '*')] + list(self.config.calendar_paths))
+
+    def read_calendars(self):
+        '''Returns all future regressor calendars as one frame.'''
+        frames = []
+        for path in self.calendar_paths():
+            calendar = load_frame(path)
+            calendar['ds'] = pd.to_datetime(calendar['ds'])
+            frames.append(calendar)
+            logging.info(f"Read regressor calendar {path} ({len(calendar)} rows)")
+        return pd.concat(frames, ignore_index=True) if frames else None
+
+    def build(self, table, regressors, segment_col=None, extra=None):
+        '''
+        Writes a table from a frame of daily regressors (ds, optionally
+        segment_col, regressor columns) with the configured calendars
+        applied on top, and returns its metadata.
+        '''
+        try:
+            keys = ['ds'] + ([segment_col] if segment_col else [])
+            columns = [col for col in regressors.columns if col not in keys and col in regressors.select_dtypes('number')]
+            segments = regressors[segment_col] if segment_col else pd.Series(TOTAL_SEGMENT, index=regressors.index)
+            codes, names = pd.factorize(segments, sort=True)
+            days = pd.to_datetime(regressors['ds']).to_numpy(dtype='datetime64[D]')
+            start = days.min()
+
+            calendar = self.read_calendars()
+            end = days.max()
+            if calendar is not None:
+                end = max(end, calendar['ds'].max().to_datetime64().astype('datetime64[D]'))
+
+            values = np.full((len(names), int((end - start).astype(np.int64)) + 1, len(columns)), np.nan, dtype=np.float32)
+            values[codes, (days - start).astype(np.int64)] = regressors[columns].to_numpy(dtype=np.float32)
+            fill = self._fill_values(values, columns)
+            if calendar is not None:
+                self._apply_calendar(values, start, pd.Index(names), columns, calendar)
+
+            return self._publish(table, start, list(names), columns, values, fill, extra)
+
+        except Exception as e:
+            raise CustomException(e, sys)
+
+    @staticmethod
+    def _fill_values(values, columns):
+        '''Per segment and regressor: 0 for ZERO_FILLED regressors, else the mean of the observed days.'''
+        with warnings.catch_warnings():
+            # Segments without any value for a regressor ("mean of empty slice") get 0
+            warnings.simplefilter('ignore', RuntimeWarning)
+            fill = np.nanmean(values, axis=1)
+        fill[:, [i for i, col in enumerate(columns) if col in ZERO_FILLED]] = 0
+        return np.nan_to_num(fill, nan=0.0).astype(np.float32)
+
+    @staticmethod
+    def _apply_calendar(values, start, segments, columns, calendar):
+        '''
+        Writes the calendar's values over the table. Rows without a segment
+        (or '*') apply to every segment; rows of other segments are ignored.
+        '''
+        days = (calendar['ds'].to_numpy(dtype='datetime64[D]') - start).astype(np.int64)
+        if 'segment' in calendar:
+            keys = calendar['segment'].astype(object)
+            every = keys.isna().to_numpy() | (keys == '*').to_numpy()
+            codes = segments.get_indexer(keys.where(~every, None))
+        else:
+            every = np.ones(len(calendar), dtype=bool)
+            codes = np.full(len(calendar), -1, dtype=np.intp)
+        inside = (days >= 0) & (days < values.shape[1])
+
+        for col_idx, col in enumerate(columns):
+            if col not in calendar:
+                continue
+            column = calendar_values(calendar[col])
+            given = inside & ~np.isnan(column)
+            rows = given & ~every & (codes >= 0)
+            values[codes[rows], days[rows], col_idx] = column[rows]
+            for i in np.flatnonzero(given & every):
+                values[:, days[i], col_idx] = column[i]
+
+        unknown = [col for col in calendar.columns if col not in columns and col not in ('ds', 'segment')]
+        if unknown:
+            logging.warning(f"Ignoring unknown regressor calendar columns {unknown}")
+
+    def _publish(self, table, start, segments, columns, values, fill, extra=None):
+        digest = hashlib.sha256(values.tobytes())
+        digest.update(fill.tobytes())
+        digest.update(json.dumps([str(start), segments, columns]).encode())
+        version = digest.hexdigest()[:12]
+        meta = {
+            'table': table,
+            'version': version,
+            'dir': f"{table}-{version}",
+            'start': str(start),
+            'n_days': int(values.shape[1]),
+            'segments': segments,
+            'columns': columns
+        }
+        meta.update(extra or {})
+
+        os.makedirs(self.config.store_dir, exist_ok=True)
+        final_dir = os.path.join(self.config.store_dir, meta['dir'])
+        if not os.path.isdir(final_dir):
+            staging_dir = os.path.join(self.config.store_dir, f".staging-{uuid.uuid4().hex}")
+            os.makedirs(staging_dir)
+            try:
+                np.save(os.path.join(staging_dir, VALUES_FILE), values)
+                np.save(os.path.join(staging_dir, FILL_FILE), fill)
+                os.rename(staging_dir, final_dir)
+            except BaseException:
+                shutil.rmtree(staging_dir, ignore_errors=True)
+                raise
+
+        previous_dir = None
+        if os.path.exists(self.meta_path(table)):
+            with open(self.meta_path(table), 'r', encoding='utf-8') as file_obj:
+                previous_dir = json.load(file_obj).get('dir')
+        tmp_path = self.meta_path(table) + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as file_obj:
+            json.dump(meta, file_obj, indent=2)
+        os.replace(tmp_path, self.meta_path(table))
+
+        # The previous directory is kept for readers that read its pointer just
+        # before the swap; older ones are only held open by their mappings
+        for name in os.listdir(self.config.store_dir):
+            if name.startswith(f"{table}-") and name not in (meta['dir'], previous_dir):
+                shutil.rmtree(os.path.join(self.config.store_dir, name), ignore_errors=True)
+
+        logging.info(f"Wrote regressor table '{table}' ({len(segments)} segments x {values.shape[1]} days "
+                     f"x {len(columns)} regressors from {start}) to {final_dir}")
+        return meta
+
+    def load(self, table):
+        '''Returns a table, memory-mapped, re-reading it only after it was rebuilt.'''
+        try:
+            with self._lock:
+                mtime = os.stat(self.meta_path(table)).st_mtime_ns
+                cached = self._tables.get(table)
+                if cached is not None and cached[0] == mtime:
+                    return cached[1]
+                with open(self.meta_path(table), 'r', encoding='utf-8') as file_obj:
+                    meta = json.load(file_obj)
+                table_dir = os.path.join(self.config.store_dir, meta['dir'])
+                loaded = RegressorTable(
+                    meta,
+                    np.load(os.path.join(table_dir, VALUES_FILE), mmap_mode='r'),
+                    np.load(os.path.join(table_dir, FILL_FILE))
+                )
+                self._tables[table] = (mtime, loaded)
+                return loaded
+        except FileNotFoundError:
+            raise CustomException(f"No regressor table '{table}'. Run the ingestion first.", sys)
+        except Exception as e:
+            raise CustomException(e, sys)
+
+    def add_calendar(self, path, tables=(TOTAL_TABLE, SEGMENT_TABLE)):
+        '''
+        Copies a future regressor calendar next to the store, where every
+        later build picks it up, and applies it to the existing tables now,
+        extending them to the calendar's last date.
+        '''
+        try:
+            os.makedirs(self.calendar_dir, exist_ok=True)
+            shutil.copyfile(path, os.path.join(self.calendar_dir, os.path.basename(path)))
+
+            calendar = load_frame(path)
+            calendar['ds'] = pd.to_datetime(calendar['ds'])
+            updated = []
+            for name in tables:
+                if not os.path.exists(self.meta_path(name)):
+                    continue
+                table = self.load(name)
+                end = max(table.end, calendar['ds'].max().to_datetime64().astype('datetime64[D]'))
+                values = np.full((len(table.segments), int((end - table.start).astype(np.int64)) + 1, len(table.columns)),
+                                 np.nan, dtype=np.float32)
+                values[:, :table.values.shape[1]] = table.values
+                self._apply_calendar(values, table.start, table.segments, table.columns, calendar)
+                extra = {key: value for key, value in table.meta.items()
+                         if key not in ('table', 'version', 'dir', 'start', 'n_days', 'segments', 'columns')}
+                updated.append(self._publish(name, table.start, list(table.segments), table.columns,
+                                             values, np.asarray(table.fill), extra))
+            return updated
+
+        except Exception as e:
+            raise CustomException(e, sys)
+
+_default_store = None
+_default_store_lock = threading.Lock()
+
+def get_regressor_store() -> RegressorStore:
+    '''Returns the shared regressor store of this process, creating it on first use.'''
+    global _default_store
+    if _default_store is None:
+        with _default_store_lock:
+            if _default_store is None:
+                _default_store = RegressorStore()
+    return _default_store
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Inspect the regressor store and add future regressor calendars.")
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('list', help="Show the tables with their date range and regressors.")
+    calendar = commands.add_parser('add-calendar', help="Add a file of future regressor values "
+                                                         "(columns ds, optionally segment, and regressor columns).")
+    calendar.add_argument("path")
+    return parser.parse_args(argv)
+
+if __name__ == "__main__":
+    args = parse_args()
+    store = RegressorStore()
+    if args.command == 'add-calendar':
+        store.add_calendar(args.path)
+    for name in (TOTAL_TABLE, SEGMENT_TABLE):
+        if os.path.exists(store.meta_path(name)):
+            table = store.load(name)
+            print(f"{name}: {len(table.segments)} segments, {table.start} to {table.end}, regressors {table.columns}")
@@ -0,0 +1,139 @@
+import os
+import sys
+import json
+import hashlib
+import threading
+from dataclasses import dataclass
+
+from src.exception import CustomException
+from src.logger import logging
+from src.utils import save_object, load_object
+
+# One model shared by every segment, written by the gbm backend
+GLOBAL_MODEL_FILE = 'global_model.pkl'
+
+@dataclass
+class SegmentStoreConfig:
+    store_dir: str = os.path.join('artifacts', 'fleet')
+    index_file_name: str = 'index.json'
+
+def segment_file_name(key):
+    '''
+    Returns a filesystem-safe, collision-free file name for a segment key.
+    '''
+    slug = ''.join(c if c.isalnum() else '_' for c in key)[:40]
+    return f"{slug}_{hashlib.sha1(key.encode()).hexdigest()[:10]}.pkl"
+
+class SegmentModelStore:
+    '''
+    Segment-indexed store of fleet models.
+
+    Every segment model is its own file in store_dir. index.json maps the
+    segment key to that file, the fingerprint of the data and params it was
+    fitted on, and its metrics. The index is rewritten atomically, and loaded
+    models are cached in memory until their fingerprint changes.
+
+    Entries marked 'global' all point to one GLOBAL_MODEL_FILE, which is
+    loaded once and serves each of them through its series() view.
+    '''
+    def __init__(self, config: SegmentStoreConfig = None):
+        self.config = config or SegmentStoreConfig()
+        self._lock = threading.Lock()
+        self._index = None
+        self._index_mtime = None
+        self._models = {}
+        self._global = None
+
+    @property
+    def index_path(self):
+        return os.path.join(self.config.store_dir, self.config.index_file_name)
+
+    def model_path(self, key):
+        return os.path.join(self.config.store_dir, segment_file_name(key))
+
+    def read_index(self):
+        '''Returns the index, re-reading it if the file changed on disk.'''
+        try:
+            with self._lock:
+                try:
+                    mtime = os.stat(self.index_path).st_mtime_ns
+                except FileNotFoundError:
+                    return {'segment_keys': [], 'segments': {}}
+                if self._index is None or mtime != self._index_mtime:
+                    with open(self.index_path, 'r', encoding='utf-8') as file_obj:
+                        self._index = json.load(file_obj)
+                    self._index_mtime = mtime
+                return self._index
+        except Exception as e:
+            raise CustomException(e, sys)
+
+    def write_index(self, index):
+        try:
+            os.makedirs(self.config.store_dir, exist_ok=True)
+            tmp_path = self.index_path + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as file_obj:
+                json.dump(index, file_obj, indent=2, default=str)
+            os.replace(tmp_path, self.index_path)
+            logging.info(f"Wrote fleet index with {len(index['segments'])} segments to {self.index_path}")
+        except Exception as e:
+            raise CustomException(e, sys)
+
+    def save_model(self, key, model):
+        save_object(file_path=self.model_path(key), obj=model)
+
+    def save_global_model(self, model):
+        save_object(file_path=os.path.join(self.config.store_dir, GLOBAL_MODEL_FILE), obj=model)
+
+    def _load_global(self, fingerprint):
+        cached = self._global
+        if cached is not None and cached[0] == fingerprint:
+            return cached[1]
+        model = load_object(file_path=os.path.join(self.config.store_dir, GLOBAL_MODEL_FILE))
+        with self._lock:
+            self._global = (fingerprint, model)
+        logging.info(f"Loaded the global fleet model ({len(model.segments)} segments)")
+        return model
+
+    def segments(self):
+        return sorted(self.read_index()['segments'])
+
+    def entry(self, key):
+        entry = self.read_index()['segments'].get(key)
+        if entry is None:
+            raise CustomException(f"Unknown segment '{key}'. No fleet model was trained for it.", sys)
+        return entry
+
+    def version(self, key):
+        '''The version of a segment's model, without loading it.'''
+        return f"{key}:{self.entry(key)['fingerprint'][:16]}"
+
+    def load(self, key):
+        '''
+        Returns (version, model) for a segment, loading the model from disk
+        only the first time or after it was retrained.
+        '''
+        entry = self.entry(key)
+        version = self.version(key)
+        cached = self._models.get(key)
+        if cached is not None and cached[0] == version:
+            return cached
+        if entry.get('global'):
+            model = self._load_global(entry['fingerprint']).series(key)
+        else:
+            model = load_object(file_path=os.path.join(self.config.store_dir, entry['file']))
+        with self._lock:
+            self._models[key] = (version, model)
+        logging.info(f"Loaded fleet model for segment '{key}'")
+        return version, model
+
+_default_store = None
+_default_store_lock = threading.Lock()
+
+def get_segment_store() -> SegmentModelStore:
+    '''Returns the shared segment store of this process, creating it on first use.'''
+    global _default_store
+    if _default_store is None:
+        with _default_store_lock:
+            if _default_store is None:
+                _default_store = SegmentModelStore()
+    return _default_store
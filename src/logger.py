@@ -1,11 +1,13 @@
 from pathlib import Path
+import os
 import logging
-from datetime import datetime
 
 logs_dir = Path.cwd() / "logs"
 logs_dir.mkdir(parents=True, exist_ok=True)
 
-LOG_FILE = f"log_{datetime.now().strftime('%Y_%m_%d_%H_%M_%S')}.log"
+# One log file shared by every process, appended to, instead of a new
+# timestamped file each time a worker imports this module
+LOG_FILE = os.environ.get("LOG_FILE", "app.log")
 LOG_FILE_PATH = logs_dir / LOG_FILE
 
 logging.basicConfig(
@@ -0,0 +1,194 @@
+import os
+import json
+import time
+import threading
+import itertools
+import contextvars
+from contextlib import contextmanager
+
+# Upper bounds (seconds) of the duration histogram buckets
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+def _label_key(labels):
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+def _format_labels(key, extra=()):
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+class MetricsRegistry:
+    '''
+    Thread-safe, in-process counters, gauges and duration histograms,
+    rendered in the Prometheus text exposition format.
+    '''
+    def __init__(self, buckets=DURATION_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._gauges = {}
+        self._histograms = {}
+        self._help = {}
+
+    def describe(self, name, text):
+        self._help[name] = text
+
+    def inc(self, name, value=1.0, **labels):
+        key = (name, _label_key(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0.0) + value
+
+    def set_gauge(self, name, value, **labels):
+        with self._lock:
+            self._gauges[(name, _label_key(labels))] = float(value)
+
+    def observe(self, name, value, **labels):
+        key = (name, _label_key(labels))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = {'buckets': [0] * len(self.buckets), 'sum': 0.0, 'count': 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    histogram['buckets'][i] += 1
+            histogram['sum'] += value
+            histogram['count'] += 1
+
+    @contextmanager
+    def timer(self, name, **labels):
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start_time, **labels)
+
+    def render_prometheus(self):
+        with self._lock:
+            counters = dict(self._counters)
+            gauges = dict(self._gauges)
+            histograms = {key: dict(value, buckets=list(value['buckets'])) for key, value in self._histograms.items()}
+
+        lines = []
+        def header(name, kind):
+            if name in self._help:
+                lines.append(f"# HELP {name} {self._help[name]}")
+            lines.append(f"# TYPE {name} {kind}")
+
+        for kind, values in (('counter', counters), ('gauge', gauges)):
+            for name in sorted({name for name, _ in values}):
+                header(name, kind)
+                for (metric, key), value in sorted(values.items()):
+                    if metric == name:
+                        lines.append(f"{name}{_format_labels(key)} {value:g}")
+
+        for name in sorted({name for name, _ in histograms}):
+            header(name, 'histogram')
+            for (metric, key), histogram in sorted(histograms.items()):
+                if metric != name:
+                    continue
+                for bound, count in zip(self.buckets, histogram['buckets']):
+                    lines.append(f"{name}_bucket{_format_labels(key, [('le', f'{bound:g}')])} {count}")
+                lines.append(f"{name}_bucket{_format_labels(key, [('le', '+Inf')])} {histogram['count']}")
+                lines.append(f"{name}_sum{_format_labels(key)} {histogram['sum']:.6f}")
+                lines.append(f"{name}_count{_format_labels(key)} {histogram['count']}")
+        return "\n".join(lines) + "\n"
+
+class Tracer:
+    '''
+    Records nested timing spans. Every span feeds the span_duration_seconds
+    histogram; while a trace is active the spans are also kept, with their
+    attributes, so they can be written as a Chrome/Perfetto trace file.
+    '''
+    def __init__(self, metrics):
+        self.metrics = metrics
+        self._lock = threading.Lock()
+        self._events = None
+        self._current = contextvars.ContextVar('current_span', default=None)
+        self._collected = contextvars.ContextVar('collected_spans', default=None)
+        self._ids = itertools.count(1)
+
+    @property
+    def active(self):
+        return self._events is not None
+
+    def start_trace(self):
+        with self._lock:
+            self._events = []
+
+    def stop_trace(self):
+        with self._lock:
+            events, self._events = self._events or [], None
+        return events
+
+    def add_events(self, events):
+        '''Adds spans recorded elsewhere, e.g. in a pool worker.'''
+        for event in events:
+            self.metrics.observe('span_duration_seconds', event['dur'] / 1e6, span=event['name'])
+        with self._lock:
+            if self._events is not None:
+                self._events.extend(events)
+
+    @contextmanager
+    def span(self, name, **attributes):
+        parent = self._current.get()
+        # Unique across processes, so spans merged from pool workers never clash
+        span_id = f"{os.getpid()}:{next(self._ids)}"
+        token = self._current.set(span_id)
+        start_wall = time.time()
+        start_time = time.perf_counter()
+        try:
+            yield attributes
+        except BaseException as e:
+            attributes['error'] = type(e).__name__
+            raise
+        finally:
+            duration = time.perf_counter() - start_time
+            self._current.reset(token)
+            self.metrics.observe('span_duration_seconds', duration, span=name)
+            collected = self._collected.get()
+            if collected is not None or self._events is not None:
+                event = {
+                    'name': name,
+                    'ph': 'X',
+                    'ts': int(start_wall * 1e6),
+                    'dur': int(duration * 1e6),
+                    'pid': os.getpid(),
+                    'tid': threading.get_ident() % 2**31,
+                    'args': dict(attributes, span_id=span_id, parent_id=parent)
+                }
+                if collected is not None:
+                    collected.append(event)
+                else:
+                    with self._lock:
+                        if self._events is not None:
+                            self._events.append(event)
+
+    @contextmanager
+    def collect(self):
+        '''
+        Records the spans of a block, in the current context only, into the
+        yielded list instead of the active trace, e.g. one task in a pool
+        worker, whose spans are sent back to the parent for add_events. The
+        spans still feed this process's histogram, so in-process code must
+        not pass them to add_events again.
+        '''
+        collected = []
+        token = self._collected.set(collected)
+        try:
+            yield collected
+        finally:
+            self._collected.reset(token)
+
+    def write_trace(self, events, file_path):
+        os.makedirs(os.path.dirname(file_path) or '.', exist_ok=True)
+        tmp_path = file_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as file_obj:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, file_obj, default=str)
+        os.replace(tmp_path, file_path)
+
+metrics = MetricsRegistry()
+metrics.describe('span_duration_seconds', 'Duration of instrumented operations by span name.')
+tracer = Tracer(metrics)
+span = tracer.span
@@ -0,0 +1,83 @@
+import time
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+
+@dataclass
+class ForecastCacheConfig:
+    max_entries: int = 64
+    # Seconds a cached forecast stays valid (None = until evicted)
+    ttl: float = 3600.0
+    # Horizon computed on a miss; any shorter horizon is sliced from it
+    max_horizon: int = 180
+
+class ForecastCache:
+    '''
+    Thread-safe LRU/TTL cache of forecast dataframes keyed by
+    (model version, periods).
+
+    A forecast for a short horizon is just the head of a longer one, so
+    on a miss the caller computes max_horizon once and every horizon up
+    to it is served by slicing that single entry.
+    '''
+    def __init__(self, config: ForecastCacheConfig = None):
+        self.config = config or ForecastCacheConfig()
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _get_locked(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        stored_at, value = entry
+        if self.config.ttl is not None and time.monotonic() - stored_at > self.config.ttl:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def get(self, version, periods):
+        '''
+        Returns the cached forecast for (version, periods), slicing it
+        from the cached max_horizon forecast if needed, or None on a miss.
+        '''
+        with self._lock:
+            forecast = self._get_locked((version, periods))
+            if forecast is None and periods < self.config.max_horizon:
+                longest = self._get_locked((version, self.config.max_horizon))
+                if longest is not None:
+                    # Forecast holds the history followed by max_horizon future rows
+                    forecast = longest.iloc[:len(longest) - self.config.max_horizon + periods]
+            if forecast is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return forecast.copy()
+
+    def put(self, version, periods, forecast):
+        with self._lock:
+            self._entries[(version, periods)] = (time.monotonic(), forecast.copy())
+            self._entries.move_to_end((version, periods))
+            while len(self._entries) > self.config.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+def get_forecast_cache() -> ForecastCache:
+    '''Returns the shared forecast cache of this process, creating it on first use.'''
+    global _default_cache
+    if _default_cache is None:
+        with _default_cache_lock:
+            if _default_cache is None:
+                _default_cache = ForecastCache()
+    return _default_cache
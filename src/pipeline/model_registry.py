@@ -0,0 +1,176 @@
+import os
+import sys
+import time
+import hashlib
+import threading
+import pandas as pd
+from dataclasses import dataclass
+
+from src.exception import CustomException
+from src.logger import logging
+from src.metrics import metrics, span
+from src.utils import load_object, file_checksum, artifact_path, load_frame
+from src.components.lite_model import load_lite_model
+from src.components.model_store import ModelStore, ModelStoreConfig
+
+@dataclass
+class ModelRegistryConfig:
+    model_path: str = os.path.join("artifacts", "model.pkl")
+    lite_model_path: str = os.path.join("artifacts", "model_lite.npz")
+    # 'prophet' serves the pickled Prophet model, 'lite' its pure-NumPy export
+    serving_mode: str = os.getenv("SERVING_MODE", "prophet")
+    train_data_path: str = artifact_path("train_cleaned")
+    # Versioned model store; once a version is promoted there it is served
+    # instead of the files above (None = always serve the files)
+    model_store_dir: str = os.path.join("artifacts", "models")
+    # Minimum number of seconds between two stat() checks of the artifacts
+    check_interval: float = 2.0
+
+@dataclass(frozen=True)
+class LoadedModel:
+    '''
+    Immutable snapshot of everything PredictPipeline needs.
+    A hot-swap replaces the whole snapshot, so readers never
+    see a model paired with the wrong training data.
+    '''
+    version: str
+    model: object
+    train_df: pd.DataFrame
+    regressor_cols: tuple
+    loaded_at: float
+
+class ModelRegistry:
+    '''
+    Process-wide, thread-safe holder of the trained model.
+
+    The model and cleaned training data are loaded once and shared by
+    every request. On access the registry stat()s the artifacts (at most
+    once per check_interval); if their mtime or size changed it compares
+    checksums and reloads only when the content actually changed.
+
+    Once a version is promoted in the model store, the registry instead
+    reads the store's CURRENT pointer and loads the promoted version's
+    immutable directory when it changes, so a retrain in progress (new
+    training data but still the old model) is never served.
+    '''
+    def __init__(self, config: ModelRegistryConfig = None):
+        self.config = config or ModelRegistryConfig()
+        self._lock = threading.Lock()
+        self._current = None
+        self._store = ModelStore(ModelStoreConfig(root_dir=self.config.model_store_dir)) if self.config.model_store_dir else None
+        self._stat_signature = None
+        self._checksums = None
+        self._last_check = 0.0
+
+    @property
+    def artifact_paths(self):
+        model_path = self.config.lite_model_path if self.config.serving_mode == 'lite' else self.config.model_path
+        return (model_path, self.config.train_data_path)
+
+    def _stat(self):
+        signature = []
+        for path in self.artifact_paths:
+            st = os.stat(path)
+            signature.append((st.st_mtime_ns, st.st_size))
+        return tuple(signature)
+
+    def _load(self, checksums=None, store_version=None):
+        logging.info(f"Loading {self.config.serving_mode} model and training data for prediction...")
+        with span('model_load', mode=self.config.serving_mode):
+            if store_version is not None:
+                model = self._store.load_model(store_version, self.config.serving_mode)
+                train_df = self._store.load_train_data(store_version)
+                version = store_version
+            else:
+                model_path = self.artifact_paths[0]
+                if self.config.serving_mode == 'lite':
+                    model = load_lite_model(model_path)
+                else:
+                    model = load_object(file_path=model_path)
+                train_df = load_frame(self.config.train_data_path)
+                version = hashlib.sha256("".join(checksums).encode()).hexdigest()[:16]
+
+        # Their values are read from the regressor store at prediction time
+        regressor_cols = tuple(model.extra_regressors)
+        logging.info(f"Loaded model version {version} and {len(regressor_cols)} regressors.")
+        return LoadedModel(
+            version=version,
+            model=model,
+            train_df=train_df,
+            regressor_cols=regressor_cols,
+            loaded_at=time.time()
+        )
+
+    def _refresh_locked(self):
+        store_version = self._store.current_version() if self._store is not None else None
+        if store_version is not None:
+            if self._current is not None and self._current.version == store_version:
+                return
+            self._swap(self._load(store_version=store_version))
+            return
+
+        signature = self._stat()
+        if self._current is not None and signature == self._stat_signature:
+            return
+        checksums = tuple(
+            file_checksum(path) for path in self.artifact_paths
+        )
+        if self._current is not None and checksums == self._checksums:
+            # Touched but not modified, nothing to reload
+            self._stat_signature = signature
+            return
+        self._swap(self._load(checksums))
+        self._stat_signature = signature
+        self._checksums = checksums
+
+    def _swap(self, loaded):
+        metrics.inc('model_loads_total', mode=self.config.serving_mode)
+        if self._current is not None:
+            logging.info(f"Hot-swapped model {self._current.version} -> {loaded.version}")
+        self._current = loaded
+
+    def get(self) -> LoadedModel:
+        '''
+        Returns the current model snapshot, reloading it first
+        if the artifacts on disk have changed.
+        '''
+        try:
+            now = time.monotonic()
+            current = self._current
+            if current is not None and now - self._last_check < self.config.check_interval:
+                return current
+
+            with self._lock:
+                if self._current is None or now - self._last_check >= self.config.check_interval:
+                    try:
+                        self._refresh_locked()
+                    except FileNotFoundError:
+                        # Artifacts are being replaced; keep serving the old model
+                        if self._current is None:
+                            raise
+                        logging.warning("Model artifacts missing during refresh, keeping current model")
+                    self._last_check = now
+                return self._current
+
+        except Exception as e:
+            raise CustomException(e, sys)
+
+    def warm_up(self):
+        '''Loads the model eagerly, e.g. at application startup.'''
+        return self.get()
+
+    @property
+    def is_loaded(self):
+        return self._current is not None
+
+_default_registry = None
+_default_registry_lock = threading.Lock()
+
+def get_model_registry() -> ModelRegistry:
+    '''Returns the shared registry of this process, creating it on first use.'''
+    global _default_registry
+    if _default_registry is None:
+        with _default_registry_lock:
+            if _default_registry is None:
+                _default_registry = ModelRegistry()
+    return _default_registry
@@ -0,0 +1,141 @@
+import sys
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from io import BytesIO
+
+from src.exception import CustomException
+from src.logger import logging
+from src.metrics import span
+
+PLOT_KINDS = ('forecast', 'components')
+
+@dataclass
+class PlotRendererConfig:
+    max_entries: int = 64
+    dpi: int = 150
+    # Matplotlib is not thread-safe, so one background thread renders everything
+    workers: int = 1
+
+@dataclass(frozen=True)
+class RenderedPlot:
+    png: bytes
+    etag: str
+
+def plot_etag(version, periods, kind, dpi):
+    '''
+    ETag of a plot. It only depends on the model version and the request,
+    so a client revalidation can be answered without rendering anything.
+    '''
+    return hashlib.sha1(f"{version}:{periods}:{kind}:{dpi}".encode()).hexdigest()[:20]
+
+def fig_to_png(fig, dpi):
+    """Convert matplotlib figure to PNG bytes."""
+    import matplotlib.pyplot as plt
+    buf = BytesIO()
+    fig.savefig(buf, format='png', dpi=dpi, bbox_inches='tight')
+    plt.close(fig)
+    return buf.getvalue()
+
+def render_plot(kind, model, forecast_df, periods, dpi):
+    '''
+    Renders the Prophet forecast or components plot of forecast_df as PNG bytes.
+    '''
+    import matplotlib
+    matplotlib.use('Agg')  # Use non-interactive backend
+
+    if kind == 'forecast':
+        # Plot 1: Main forecast plot with historical data
+        fig = model.plot(forecast_df, figsize=(14, 6))
+        ax = fig.gca()
+        ax.set_title(f'{periods}-Day Sales Forecast', fontsize=16, fontweight='bold')
+        ax.set_xlabel('Date', fontsize=12)
+        ax.set_ylabel('Quantity Sold', fontsize=12)
+
+        # Add vertical line at forecast start
+        last_historical_date = forecast_df.iloc[-periods - 1]['ds']
+        ax.axvline(x=last_historical_date, color='red', linestyle='--', linewidth=2, label='Forecast Start')
+        ax.legend()
+        ax.grid(alpha=0.3)
+    elif kind == 'components':
+        # Plot 2: Components plot (trend, weekly, yearly seasonality)
+        fig = model.plot_components(forecast_df, figsize=(14, 10))
+    else:
+        raise ValueError(f"Unknown plot kind '{kind}'")
+    return fig_to_png(fig, dpi)
+
+class PlotRenderer:
+    '''
+    Renders Prophet plots on a background thread and caches the PNGs by
+    (model version, periods, kind). Concurrent requests for the same plot
+    share one render; the HTML page only links to the images, so the
+    request that computes a forecast never waits for matplotlib.
+    '''
+    def __init__(self, config: PlotRendererConfig = None):
+        self.config = config or PlotRendererConfig()
+        self._cache = OrderedDict()
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=self.config.workers, thread_name_prefix='plot-render')
+
+    def etag(self, version, periods, kind):
+        return plot_etag(version, periods, kind, self.config.dpi)
+
+    def _render(self, key, model, forecast_df):
+        version, periods, kind = key
+        try:
+            with span('plot_render', kind=kind, periods=periods):
+                png = render_plot(kind, model, forecast_df, periods, self.config.dpi)
+            plot = RenderedPlot(png=png, etag=self.etag(version, periods, kind))
+            with self._lock:
+                self._cache[key] = plot
+                while len(self._cache) > self.config.max_entries:
+                    self._cache.popitem(last=False)
+            logging.info(f"Rendered {kind} plot for {periods} periods (model {version})")
+            return plot
+        finally:
+            with self._lock:
+                self._pending.pop(key, None)
+
+    def submit(self, version, periods, kind, model, forecast_df) -> Future:
+        '''
+        Returns a future of the rendered plot, scheduling a render only if
+        the plot is neither cached nor already being rendered.
+        '''
+        key = (version, periods, kind)
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                future = Future()
+                future.set_result(self._cache[key])
+                return future
+            if key in self._pending:
+                return self._pending[key]
+            future = self._executor.submit(self._render, key, model, forecast_df)
+            self._pending[key] = future
+            return future
+
+    def prefetch(self, version, periods, model, forecast_df):
+        '''Starts rendering every plot kind in the background.'''
+        for kind in PLOT_KINDS:
+            self.submit(version, periods, kind, model, forecast_df)
+
+    def get(self, version, periods, kind, model, forecast_df, timeout=60.0) -> RenderedPlot:
+        try:
+            return self.submit(version, periods, kind, model, forecast_df).result(timeout=timeout)
+        except Exception as e:
+            raise CustomException(e, sys)
+
+_default_renderer = None
+_default_renderer_lock = threading.Lock()
+
+def get_plot_renderer() -> PlotRenderer:
+    '''Returns the shared plot renderer of this process, creating it on first use.'''
+    global _default_renderer
+    if _default_renderer is None:
+        with _default_renderer_lock:
+            if _default_renderer is None:
+                _default_renderer = PlotRenderer()
+    return _default_renderer
@@ -1,82 +1,262 @@
-import os
 import sys
 import pandas as pd
-from dataclasses import dataclass
-
 
 from src.exception import CustomException
 from src.logger import logging
-from src.utils import load_object
-
-@dataclass
-class PredictPipelineConfig:
-    model_path: str = os.path.join("artifacts", "model.pkl")
-    train_data_path: str = os.path.join("artifacts", "train_cleaned.csv")
+from src.metrics import metrics, span
+from src.pipeline.model_registry import ModelRegistry, get_model_registry
+from src.pipeline.forecast_cache import ForecastCache, get_forecast_cache
+from src.components.segment_store import SegmentModelStore, get_segment_store
+from src.components.regressor_store import RegressorStore, get_regressor_store, TOTAL_TABLE, SEGMENT_TABLE
+from src.components.forecast_store import ForecastStore, get_forecast_store
+from src.components.outlier_detection import TOTAL_SEGMENT
+from src.pipeline.scenario_engine import ScenarioEngine
 
 class PredictPipeline:
-    def __init__(self):
+    def __init__(self, registry: ModelRegistry = None, forecast_cache: ForecastCache = None,
+                 segment_store: SegmentModelStore = None, regressor_store: RegressorStore = None,
+                 forecast_store: ForecastStore = None):
         try:
-            self.config = PredictPipelineConfig()
-            
-            logging.info("Loading model and training data for prediction...")
-            self.model = load_object(file_path=self.config.model_path)
-            
-            # We need the training data to get historical regressor values
-            self.train_df = pd.read_csv(self.config.train_data_path)
-            self.train_df['ds'] = pd.to_datetime(self.train_df['ds'])
-            
-            # Get regressor names from the loaded data
-            self.regressor_cols = [col for col in self.train_df.columns if col not in ['ds', 'y']]
-            logging.info(f"Loaded model and {len(self.regressor_cols)} regressors.")
-            
+            # Models are loaded once per process and shared between requests
+            self.registry = registry or get_model_registry()
+            self.forecast_cache = forecast_cache or get_forecast_cache()
+            self.segment_store = segment_store or get_segment_store()
+            self.regressor_store = regressor_store or get_regressor_store()
+            self.forecast_store = forecast_store or get_forecast_store()
+            self.model_version = None
+            self.model = None
+
         except Exception as e:
             raise CustomException(e, sys)
 
+    def _resolve(self, segment=None):
+        '''
+        Returns (version, model, regressor_cols) of the global model, or of
+        the fleet model of a segment.
+        '''
+        if segment is None:
+            loaded = self.registry.get()
+            return loaded.version, loaded.model, list(loaded.regressor_cols)
+        version, model = self.segment_store.load(segment)
+        return version, model, list(model.extra_regressors)
+
+    def _lookup(self, segment, periods):
+        '''
+        Returns (model version, forecast) from the materialized forecasts if
+        they hold the next periods days of the current model, else None. The
+        current version is read without loading a segment's model.
+        '''
+        try:
+            table = self.forecast_store.load()
+            key = segment or TOTAL_SEGMENT
+            entry = table.entry(key) if table is not None else None
+            if entry is None or periods > table.horizon:
+                return None
+            version = self.registry.get().version if segment is None else self.segment_store.version(segment)
+            forecast_version = version
+            if entry['regressors']:
+                forecast_version = f"{version}+{self.regressor_store.load(TOTAL_TABLE if segment is None else SEGMENT_TABLE).version}"
+            if entry['version'] != forecast_version:
+                # Materialized before the model or its regressors changed
+                return None
+            return version, table.frame(key, periods)
+        except Exception as e:
+            # The live path serves the request, or reports the real problem
+            logging.warning(f"Forecast store lookup of '{segment or TOTAL_SEGMENT}' failed, predicting live: {e}")
+            return None
+
     def predict(self, features):
         try:
             # 'features' dataframe comes from CustomData.get_data_as_data_frame()
-            # It just contains the number of periods to predict
+            # It contains the number of periods to predict and optionally a segment key
             periods = int(features['periods'].iloc[0])
-            
-            logging.info(f"Making future dataframe for {periods} periods.")
-            
-            # Create future dataframe
-            future = self.model.make_future_dataframe(periods=periods)
-            
-            # Merge regressor columns into the future dataframe
-            # This gets all the *historical* values for the regressors
-            future_with_regressors = pd.merge(
-                future,
-                self.train_df[['ds'] + self.regressor_cols],
-                on='ds',
-                how='left'
-            )
-            
-            # Fill future regressor values (for the new 'periods' days) with 0
-            # This assumes no promotions, events, etc. for the future forecast
-            future_with_regressors[self.regressor_cols] = future_with_regressors[self.regressor_cols].fillna(0)
+            segment = features['segment'].iloc[0] if 'segment' in features else None
 
-            # Predict
-            logging.info("Generating forecast...")
-            forecast = self.model.predict(future_with_regressors)
-            
-            # Return the full forecast (not just future) so we can plot historical data
+            stored = self._lookup(segment, periods)
+            metrics.inc('forecast_store_requests_total', result='miss' if stored is None else 'hit')
+            if stored is not None:
+                # The model is only loaded if get_model() asks for it
+                self.model_version, self.model = stored[0], None
+                return stored[1]
+
+            version, model, regressor_cols = self._resolve(segment)
+            self.model_version, self.model = version, model
+            regressors = None
+            if regressor_cols:
+                regressors = self.regressor_store.load(TOTAL_TABLE if segment is None else SEGMENT_TABLE)
+            return self._predict_with(version, model, periods, segment, regressors, regressor_cols)
+
+        except Exception as e:
+            raise CustomException(e, sys)
+
+    def _predict_with(self, version, model, periods, segment=None, regressors=None, regressor_cols=()):
+        '''The forecast of one resolved model and regressor table, from the cache or computed.'''
+        if regressors is not None:
+            # New regressor calendars change the forecast of the same model
+            version = f"{version}+{regressors.version}"
+
+        forecast = self.forecast_cache.get(version, periods)
+        if forecast is not None:
+            metrics.inc('forecast_cache_requests_total', result='hit')
+            logging.info(f"Serving cached forecast for {periods} periods (model {version}).")
             return forecast
+        metrics.inc('forecast_cache_requests_total', result='miss')
+
+        # Compute the longest horizon once; shorter horizons are sliced from it
+        max_horizon = self.forecast_cache.config.max_horizon
+        horizon = max(periods, max_horizon)
+        with span('predict', periods=horizon, segment=segment, model_version=version):
+            forecast = self._forecast(model, horizon, regressors, regressor_cols, segment)
+        self.forecast_cache.put(version, horizon, forecast)
+
+        # Return the full forecast (not just future) so we can plot historical data
+        return forecast.iloc[:len(forecast) - horizon + periods].copy()
+
+    def _forecast(self, model, periods, regressors=None, regressor_cols=(), segment=None):
+        logging.info(f"Making future dataframe for {periods} periods.")
+
+        # Create future dataframe
+        future = model.make_future_dataframe(periods=periods)
+
+        if regressor_cols:
+            # Historical values and the future calendars, read from the regressor
+            # store by date offset; days without a value get the store's fill
+            values = regressors.aligned(future['ds'], segment or TOTAL_SEGMENT, regressor_cols)
+            for i, col in enumerate(regressor_cols):
+                future[col] = values[:, i]
+
+        # Predict
+        logging.info("Generating forecast...")
+        return model.predict(future)
+
+    def materialize(self, horizon):
+        '''
+        Computes the forecast of the next horizon days of the global model
+        and of every segment model, as predict() would, and writes them
+        into the forecast store. Forecasts still current in the previous
+        snapshot are copied instead of recomputed. Returns the new index.
+        '''
+        try:
+            previous = self.forecast_store.load()
+            if previous is not None and previous.horizon != horizon:
+                previous = None
+            forecasts, reused = {}, 0
+            for segment in [None] + self.segment_store.segments():
+                key = segment or TOTAL_SEGMENT
+                try:
+                    stored = self._lookup(segment, horizon) if previous is not None else None
+                    if stored is not None:
+                        forecast = stored[1]
+                        version, regressor_cols = previous.entry(key)['version'], previous.entry(key)['regressors']
+                        reused += 1
+                    else:
+                        version, model, regressor_cols = self._resolve(segment)
+                        regressors = None
+                        if regressor_cols:
+                            regressors = self.regressor_store.load(TOTAL_TABLE if segment is None else SEGMENT_TABLE)
+                            version = f"{version}+{regressors.version}"
+                        with span('materialize_forecast', segment=segment, model_version=version):
+                            forecast = self._forecast(model, horizon, regressors, regressor_cols, segment)
+                except Exception as e:
+                    # e.g. only a fleet was trained; that key is predicted live
+                    logging.warning(f"Not materializing the forecast of '{key}': {e}")
+                    continue
+                forecasts[key] = {
+                    'version': version, 'regressors': bool(regressor_cols),
+                    'n_history': len(forecast) - horizon, 'frame': forecast
+                }
+
+            logging.info(f"Materialized {len(forecasts)} forecasts, {reused} unchanged ones copied")
+            return self.forecast_store.write(forecasts, horizon)
+
+        except Exception as e:
+            raise CustomException(e, sys)
+
+    def predict_batch(self, queries):
+        '''
+        Answers many (segment, periods) queries with a single forecast per
+        distinct segment over the longest horizon requested for it. Returns,
+        in query order, one dict per query with the model version and the
+        future rows as compact arrays (ds, yhat, yhat_lower, yhat_upper).
+        '''
+        try:
+            horizons = {}
+            for query in queries:
+                horizons[query.segment] = max(horizons.get(query.segment, 0), int(query.periods))
+
+            forecasts = {}
+            for segment, horizon in horizons.items():
+                forecast = self.predict(CustomData(horizon, segment).get_data_as_data_frame())
+                forecasts[segment] = (forecast, self.model_version, len(forecast) - horizon)
+
+            results = []
+            for query in queries:
+                forecast, version, n_history = forecasts[query.segment]
+                future = forecast.iloc[n_history:n_history + int(query.periods)]
+                results.append({
+                    'segment': query.segment,
+                    'periods': int(query.periods),
+                    'model_version': version,
+                    'ds': future['ds'].dt.strftime('%Y-%m-%d').tolist(),
+                    'yhat': future['yhat'].round(2).tolist(),
+                    'yhat_lower': future['yhat_lower'].round(2).tolist(),
+                    'yhat_upper': future['yhat_upper'].round(2).tolist()
+                })
+            return results
 
         except Exception as e:
             raise CustomException(e, sys)
-    
-    def get_model(self):
-        """Return the trained Prophet model for plotting."""
+
+    def simulate(self, periods, scenarios, segment=None):
+        '''
+        Runs what-if regressor scenarios (see scenario_engine.parse_scenarios)
+        against the cached baseline forecast of the next periods days.
+        Returns a dict with the dates, the baseline and, per scenario, its
+        forecast and delta to the baseline. Raises ValueError if a scenario
+        is invalid or the model has no regressors to change.
+        '''
+        # The baseline and the regressor effects must come from the same model
+        version, model, regressor_cols = self._resolve(segment)
+        if not regressor_cols:
+            raise ValueError("The model has no regressors to simulate, train it with --regressors.")
+        try:
+            self.model_version, self.model = version, model
+            regressors = self.regressor_store.load(TOTAL_TABLE if segment is None else SEGMENT_TABLE)
+            forecast = self._predict_with(version, model, int(periods), segment, regressors, regressor_cols)
+            future = forecast.iloc[-int(periods):]
+            base_values = regressors.aligned(future['ds'], segment or TOTAL_SEGMENT, regressor_cols)
+            with span('simulate', periods=periods, n_scenarios=len(scenarios), segment=segment):
+                engine = ScenarioEngine(model, future, regressor_cols, base_values)
+                names, simulated = engine.simulate(scenarios)
+            metrics.inc('scenarios_simulated_total', len(names))
+            return {
+                'model_version': version,
+                'ds': future['ds'].dt.strftime('%Y-%m-%d').tolist(),
+                'regressors': {col: base_values[:, i].round(4).tolist() for i, col in enumerate(regressor_cols)},
+                'names': names,
+                'baseline': engine.baseline,
+                'simulated': simulated
+            }
+
+        except ValueError:
+            raise
+        except Exception as e:
+            raise CustomException(e, sys)
+
+    def get_model(self, segment=None):
+        """Return the trained Prophet model used by the last predict, for plotting."""
+        if self.model is None or segment is not None:
+            self.model_version, self.model = self._resolve(segment)[:2]
         return self.model
 
 class CustomData:
     '''
-    This class takes the number of periods to forecast
-    and prepares it for the PredictPipeline.
+    This class takes the number of periods to forecast (and optionally
+    the key of a fleet segment) and prepares it for the PredictPipeline.
     '''
-    def __init__(self, periods: int):
+    def __init__(self, periods: int, segment: str = None):
         self.periods = periods
+        self.segment = segment
 
     def get_data_as_data_frame(self):
         try:
@@ -84,6 +264,8 @@ class CustomData:
             custom_data_input_dict = {
                 "periods": [self.periods]
             }
+            if self.segment is not None:
+                custom_data_input_dict["segment"] = [self.segment]
             
             return pd.DataFrame(custom_data_input_dict)
 
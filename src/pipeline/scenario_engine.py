@@ -0,0 +1,130 @@
+import sys
+import numpy as np
+import pandas as pd
+
+from src.exception import CustomException
+
+SCENARIO_OPERATIONS = ('set', 'scale', 'shift')
+
+def regressor_effects(model):
+    '''
+    Returns the extra regressors of a fitted model (Prophet or lite) as
+    (names, coef, multiplicative): the change of the forecast per unit of
+    each regressor, in data units for additive regressors and as a
+    fraction of the trend for multiplicative ones.
+    '''
+    if hasattr(model, 'regressor_coefficients'):
+        coefficients = model.regressor_coefficients()
+    else:
+        from prophet.utilities import regressor_coefficients
+        coefficients = regressor_coefficients(model)
+    return (
+        list(coefficients['regressor']),
+        coefficients['coef'].to_numpy(dtype=np.float64),
+        (coefficients['regressor_mode'] == 'multiplicative').to_numpy()
+    )
+
+def parse_scenarios(scenarios, regressor_cols, ds):
+    '''
+    Validates scenario specs and returns them as (name, changes) with every
+    change as (regressor index, operation, value, day mask). A spec looks
+    like {"name": "weekend promo", "changes": [{"regressor": "promotion",
+    "set": 1, "start": "2025-01-04", "end": "2025-01-05"}]}. A change
+    applies 'set', 'scale' or 'shift' to one regressor on its 'dates', or
+    from 'start' to 'end' (both optional, inclusive). Raises ValueError
+    with a client-facing message on bad input.
+    '''
+    if not isinstance(scenarios, list) or not scenarios:
+        raise ValueError("'scenarios' must be a non-empty list.")
+    days = pd.to_datetime(ds).to_numpy(dtype='datetime64[D]')
+
+    parsed = []
+    for idx, scenario in enumerate(scenarios):
+        if not isinstance(scenario, dict) or not isinstance(scenario.get('changes'), list):
+            raise ValueError(f"Scenario {idx} must be an object with a 'changes' list.")
+        changes = []
+        for change in scenario['changes']:
+            if not isinstance(change, dict) or change.get('regressor') not in regressor_cols:
+                raise ValueError(f"Scenario {idx}: every change needs a 'regressor' from {list(regressor_cols)}.")
+            operations = [op for op in SCENARIO_OPERATIONS if op in change]
+            if len(operations) != 1:
+                raise ValueError(f"Scenario {idx}: every change needs exactly one of {list(SCENARIO_OPERATIONS)}.")
+            value = change[operations[0]]
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                raise ValueError(f"Scenario {idx}: '{operations[0]}' must be a number.")
+            try:
+                if 'dates' in change:
+                    mask = np.isin(days, pd.to_datetime(change['dates']).to_numpy(dtype='datetime64[D]'))
+                else:
+                    mask = np.ones(len(days), dtype=bool)
+                    if change.get('start') is not None:
+                        mask &= days >= np.datetime64(pd.Timestamp(change['start']), 'D')
+                    if change.get('end') is not None:
+                        mask &= days <= np.datetime64(pd.Timestamp(change['end']), 'D')
+            except (ValueError, TypeError):
+                raise ValueError(f"Scenario {idx}: 'dates', 'start' and 'end' must be dates like 2025-01-31.")
+            changes.append((regressor_cols.index(change['regressor']), operations[0], float(value), mask))
+        parsed.append((str(scenario.get('name', f"scenario_{idx}")), changes))
+    return parsed
+
+class ScenarioEngine:
+    '''
+    What-if simulation of regressor scenarios against one baseline forecast.
+
+    A Prophet forecast is linear in its extra regressors: a change dx of
+    regressor r moves yhat by coef_r * dx, times the trend if r is
+    multiplicative. The baseline forecast and the per-day sensitivity to
+    every regressor are computed once; any number of scenarios is then
+    their (scenarios, days, regressors) value changes contracted with the
+    sensitivity in one matrix operation, with no model prediction per
+    scenario. Intervals are the baseline's, shifted by the change.
+    '''
+    def __init__(self, model, forecast, regressor_cols, base_values):
+        try:
+            names, coef, multiplicative = regressor_effects(model)
+            order = [names.index(col) for col in regressor_cols]
+            self.regressor_cols = list(regressor_cols)
+            self.ds = forecast['ds'].reset_index(drop=True)
+            self.baseline = forecast[['yhat', 'yhat_lower', 'yhat_upper']].to_numpy(dtype=np.float64)
+            self.base_values = np.asarray(base_values, dtype=np.float64)
+            trend = forecast['trend'].to_numpy(dtype=np.float64)
+            # d yhat / d regressor on every day, shape (days, regressors)
+            self.sensitivity = np.where(multiplicative[order], trend[:, None] * coef[order], coef[order])
+
+        except Exception as e:
+            raise CustomException(e, sys)
+
+    def scenario_values(self, parsed):
+        '''The regressor values of every parsed scenario, shape (scenarios, days, regressors).'''
+        values = np.repeat(self.base_values[None], len(parsed), axis=0)
+        for s, (_, changes) in enumerate(parsed):
+            for r, operation, value, mask in changes:
+                if operation == 'set':
+                    values[s, mask, r] = value
+                elif operation == 'scale':
+                    values[s, mask, r] *= value
+                else:
+                    values[s, mask, r] += value
+        return values
+
+    def simulate(self, scenarios):
+        '''
+        Returns the names of the scenarios and their forecasts: yhat,
+        yhat_lower, yhat_upper and the delta to the baseline, each of shape
+        (scenarios, days).
+        '''
+        try:
+            parsed = parse_scenarios(scenarios, self.regressor_cols, self.ds)
+            changes = self.scenario_values(parsed) - self.base_values
+            delta = np.einsum('sdr,dr->sd', changes, self.sensitivity)
+            return [name for name, _ in parsed], {
+                'yhat': self.baseline[:, 0] + delta,
+                'yhat_lower': self.baseline[:, 1] + delta,
+                'yhat_upper': self.baseline[:, 2] + delta,
+                'delta': delta
+            }
+
+        except ValueError:
+            raise
+        except Exception as e:
+            raise CustomException(e, sys)
@@ -1,41 +1,394 @@
 import os
 import sys
-from src.components.data_ingestion import DataIngestion
-from src.components.data_transformation import DataTransformation
-from src.components.model_trainer import ModelTrainer
+import json
+import argparse
+import dataclasses
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from src.components.data_ingestion import DataIngestion, resolve_source_paths
+from src.components.data_transformation import DataTransformation, DataTransformationConfig
+from src.components.outlier_detection import OutlierDetectionConfig
+from src.components.model_trainer import ModelTrainer, ModelTrainerConfig, MODEL_BACKENDS
+from src.components.fleet_trainer import FleetTrainer, FleetTrainerConfig
+from src.components.model_store import ModelStore, ModelStoreConfig
+from src.components.regressor_store import RegressorStore, RegressorStoreConfig, TOTAL_TABLE, SEGMENT_TABLE
+from src.components.segment_store import SegmentModelStore
+from src.components.forecast_store import ForecastStore, ForecastStoreConfig
+from src.components.hierarchy import HierarchicalForecaster, HierarchyConfig, RECONCILIATION_METHODS, MINT_COVARIANCES
+from src.pipeline.predict_pipeline import PredictPipeline
+from src.pipeline.model_registry import ModelRegistry, ModelRegistryConfig
+from src.pipeline.forecast_cache import ForecastCache
 from src.exception import CustomException
 from src.logger import logging
+from src.metrics import span, tracer
+from src.utils import file_checksum, frame_fingerprint, load_frame
+
+@dataclass
+class TrainPipelineConfig:
+    # Input fingerprints and outputs of the last run of every stage
+    state_path: str = os.path.join('artifacts', 'pipeline_state.json')
+    # Chrome/Perfetto trace of the spans of the last run (open in ui.perfetto.dev)
+    trace_path: str = os.path.join('artifacts', 'traces', 'train_pipeline.json')
+    fleet_trace_path: str = os.path.join('artifacts', 'traces', 'fleet_pipeline.json')
+    hierarchy_trace_path: str = os.path.join('artifacts', 'traces', 'hierarchy_pipeline.json')
+    # Precompute the forecasts of the trained models into the forecast store,
+    # which serving answers from by lookup
+    materialize: bool = True
+    forecast_store: ForecastStoreConfig = field(default_factory=ForecastStoreConfig)
+
+def fingerprint(*parts):
+    '''Combines file checksums and config values into one stage fingerprint.'''
+    return json.dumps(parts, sort_keys=True, default=str)
 
 class TrainPipeline:
-    def __init__(self):
+    def __init__(self, model_trainer_config: ModelTrainerConfig = None, fleet_trainer_config: FleetTrainerConfig = None,
+                 data_transformation_config: DataTransformationConfig = None, progress_callback=None,
+                 hierarchy_config: HierarchyConfig = None, pipeline_config: TrainPipelineConfig = None):
+        self.config = pipeline_config or TrainPipelineConfig()
         self.data_ingestion = DataIngestion()
-        self.data_transformation = DataTransformation()
-        self.model_trainer = ModelTrainer()
+        self.data_transformation = DataTransformation(data_transformation_config)
+        self.model_trainer = ModelTrainer(model_trainer_config)
+        self.fleet_trainer = FleetTrainer(fleet_trainer_config)
+        self.hierarchical_forecaster = HierarchicalForecaster(hierarchy_config)
+        self.state = {}
+        # Called with a dict per stage and per tuning trial, e.g. by a training job
+        self.progress_callback = progress_callback
+        self.model_trainer.progress_callback = progress_callback
+
+    def notify(self, event):
+        if self.progress_callback is not None:
+            self.progress_callback(event)
+
+    def load_state(self):
+        if os.path.exists(self.config.state_path):
+            with open(self.config.state_path, 'r', encoding='utf-8') as file_obj:
+                return json.load(file_obj)
+        return {}
+
+    def save_state(self):
+        os.makedirs(os.path.dirname(self.config.state_path), exist_ok=True)
+        tmp_path = self.config.state_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as file_obj:
+            json.dump(self.state, file_obj, indent=2)
+        os.replace(tmp_path, self.config.state_path)
 
-    def run_pipeline(self):
+    def run_stage(self, name, inputs, run, incremental):
+        '''
+        Runs one pipeline stage, or in incremental mode returns the outputs
+        of its last run when its inputs fingerprint is unchanged and those
+        outputs still exist.
+        '''
+        previous = self.state.get(name)
+        if (incremental and previous is not None and previous['inputs'] == inputs
+                and all(os.path.exists(path) for path in previous['outputs'])):
+            logging.info(f"Stage '{name}' inputs unchanged, reusing its outputs")
+            self.notify({'event': 'stage', 'stage': name, 'status': 'skipped'})
+            with span('pipeline_stage', stage=name, skipped=True):
+                return previous['outputs']
+
+        self.notify({'event': 'stage', 'stage': name, 'status': 'running'})
+        with span('pipeline_stage', stage=name, skipped=False):
+            outputs = list(run())
+        self.state[name] = {'inputs': inputs, 'outputs': outputs}
+        self.save_state()
+        self.notify({'event': 'stage', 'stage': name, 'status': 'done'})
+        return outputs
+
+    @contextmanager
+    def traced(self, name, trace_path):
+        '''Records the spans of a pipeline run and writes them to trace_path, also if it fails.'''
+        tracer.start_trace()
         try:
-            logging.info("Starting the training pipeline...")
+            with span(name):
+                yield
+        finally:
+            events = tracer.stop_trace()
+            tracer.write_trace(events, trace_path)
+            logging.info(f"Wrote {len(events)} trace spans to {trace_path}")
 
-            # Data Ingestion
-            train_path, test_path = self.data_ingestion.initiate_data_ingestion()
+    def is_append_only(self, cleaned_train_path):
+        '''
+        True if the cleaned training data starts with exactly the rows the
+        current model was trained on, i.e. only new days were appended.
+        '''
+        previous = self.state.get('training_data')
+        if previous is None:
+            return False
+        train_df = load_frame(cleaned_train_path)
+        n_rows = previous['n_rows']
+        return len(train_df) >= n_rows and frame_fingerprint(train_df.head(n_rows)) == previous['fingerprint']
 
+    def materialization_inputs(self):
+        '''
+        Checksums of everything the served forecasts depend on: the promoted
+        model (or the model file), the segment index and the regressor tables.
+        '''
+        trainer_config = self.model_trainer.model_trainer_config
+        regressor_store = RegressorStore(RegressorStoreConfig(store_dir=trainer_config.regressor_store_dir))
+        paths = [
+            trainer_config.trained_model_file_path,
+            SegmentModelStore(self.fleet_trainer.fleet_trainer_config.store).index_path,
+            regressor_store.meta_path(TOTAL_TABLE),
+            regressor_store.meta_path(SEGMENT_TABLE)
+        ]
+        if trainer_config.model_store_dir:
+            paths.append(ModelStore(ModelStoreConfig(root_dir=trainer_config.model_store_dir)).pointer_path)
+        return fingerprint(
+            {path: file_checksum(path) for path in paths if os.path.exists(path)},
+            dataclasses.asdict(self.config.forecast_store)
+        )
 
-            # Data Transformation
-            cleaned_train_path, cleaned_test_path = self.data_transformation.initiate_data_transformation(train_path, test_path)
+    def materialize_forecasts(self):
+        '''
+        Writes the forecast of the next horizon_days of the served model and
+        of every segment model into the forecast store, computed like serving
+        would. Returns the store's index path.
+        '''
+        trainer_config = self.model_trainer.model_trainer_config
+        pipeline = PredictPipeline(
+            registry=ModelRegistry(ModelRegistryConfig(
+                model_path=trainer_config.trained_model_file_path,
+                lite_model_path=trainer_config.lite_model_file_path,
+                model_store_dir=trainer_config.model_store_dir
+            )),
+            forecast_cache=ForecastCache(),
+            segment_store=SegmentModelStore(self.fleet_trainer.fleet_trainer_config.store),
+            regressor_store=RegressorStore(RegressorStoreConfig(store_dir=trainer_config.regressor_store_dir)),
+            forecast_store=ForecastStore(self.config.forecast_store)
+        )
+        pipeline.materialize(self.config.forecast_store.horizon_days)
+        return [pipeline.forecast_store.index_path]
+
+    def run_pipeline(self, incremental=False):
+        '''
+        Runs ingestion, transformation and training. With incremental=True
+        stages whose inputs are unchanged since the last run are skipped, and
+        when only new days were appended the final model is refitted with
+        the last best hyperparameters instead of rerunning the search.
+        '''
+        try:
+            with self.traced('train_pipeline', self.config.trace_path):
+                logging.info(f"Starting the training pipeline{' (incremental)' if incremental else ''}...")
+                self.state = self.load_state() if incremental else {}
 
-            # Model Training
-            accuracy, model_path = self.model_trainer.initiate_model_training(cleaned_train_path, cleaned_test_path)
+                # Data Ingestion
+                ingestion_config = self.data_ingestion.ingestion_config
+                regressor_store = RegressorStore(ingestion_config.regressor_store)
+                train_path, test_path = self.run_stage(
+                    'ingestion',
+                    fingerprint(
+                        [file_checksum(path) for path in resolve_source_paths(ingestion_config.source_data_path)],
+                        dataclasses.asdict(ingestion_config),
+                        # The regressor calendars are part of the ingestion's output
+                        {path: file_checksum(path) for path in regressor_store.calendar_paths()}
+                    ),
+                    self.data_ingestion.initiate_data_ingestion,
+                    incremental
+                )
 
-            logging.info("Training pipeline finished successfully.")
+                # Data Transformation
+                cleaned_train_path, cleaned_test_path = self.run_stage(
+                    'transformation',
+                    fingerprint(
+                        file_checksum(train_path),
+                        file_checksum(test_path),
+                        dataclasses.asdict(self.data_transformation.transformation_config)
+                    ),
+                    lambda: self.data_transformation.initiate_data_transformation(train_path, test_path),
+                    incremental
+                )
+
+                # Model Training
+                best_params = None
+                if incremental and self.is_append_only(cleaned_train_path):
+                    best_params = self.model_trainer.load_best_params()
+
+                def train():
+                    accuracy, model_path, version = self.model_trainer.initiate_model_training(
+                        cleaned_train_path, cleaned_test_path, best_params=best_params
+                    )
+                    train_df = load_frame(cleaned_train_path)
+                    self.state['training_data'] = {'n_rows': len(train_df), 'fingerprint': frame_fingerprint(train_df)}
+                    self.state['accuracy'] = accuracy
+                    self.state['model_version'] = version
+                    outputs = [model_path]
+                    lite_model_path = self.model_trainer.model_trainer_config.lite_model_file_path
+                    if lite_model_path and self.model_trainer.model_trainer_config.model_backend == 'prophet':
+                        outputs.append(lite_model_path)
+                    if version is not None:
+                        # Serving processes switch to the new version on their next check
+                        store = ModelStore(ModelStoreConfig(root_dir=self.model_trainer.model_trainer_config.model_store_dir))
+                        store.promote(version)
+                        outputs.append(store.version_dir(version))
+                    return outputs
+
+                trainer_config = self.model_trainer.model_trainer_config
+                regressors_version = None
+                if trainer_config.regressors:
+                    regressors_version = RegressorStore(
+                        RegressorStoreConfig(store_dir=trainer_config.regressor_store_dir)
+                    ).load(TOTAL_TABLE).version
+                self.run_stage(
+                    'training',
+                    fingerprint(
+                        file_checksum(cleaned_train_path),
+                        file_checksum(cleaned_test_path),
+                        dataclasses.asdict(trainer_config),
+                        regressors_version
+                    ),
+                    train,
+                    incremental
+                )
+
+                # Forecast Materialization
+                if self.config.materialize:
+                    self.run_stage('materialization', self.materialization_inputs(), self.materialize_forecasts, incremental)
+
+                logging.info("Training pipeline finished successfully.")
 
         except Exception as e:
             logging.error("Exception occurred in the training pipeline")
             raise CustomException(e, sys)
 
+    def run_fleet_pipeline(self):
+        '''
+        Trains one model per segment (see FleetTrainerConfig.segment_keys)
+        instead of a single model on the grand total, or with the gbm
+        backend one global model across all segments.
+        '''
+        try:
+            with self.traced('fleet_pipeline', self.config.fleet_trace_path):
+                logging.info("Starting the fleet training pipeline...")
+
+                segment_keys = self.fleet_trainer.fleet_trainer_config.segment_keys
+                with span('pipeline_stage', stage='segment_ingestion'):
+                    train_path, test_path = self.data_ingestion.initiate_segment_ingestion(segment_keys)
+
+                with span('pipeline_stage', stage='segment_transformation'):
+                    train_path, test_path = self.data_transformation.initiate_segment_transformation(train_path, test_path)
+
+                with span('pipeline_stage', stage='fleet_training'):
+                    if self.model_trainer.model_trainer_config.model_backend == 'gbm':
+                        index_path = self.fleet_trainer.initiate_global_training(train_path, test_path, self.model_trainer)
+                    else:
+                        index_path = self.fleet_trainer.initiate_fleet_training(train_path, test_path)
+
+                if self.config.materialize:
+                    with span('pipeline_stage', stage='materialization'):
+                        self.materialize_forecasts()
+
+                logging.info(f"Fleet training pipeline finished successfully. Index: {index_path}")
+
+        except Exception as e:
+            logging.error("Exception occurred in the fleet training pipeline")
+            raise CustomException(e, sys)
+
+    def run_hierarchy_pipeline(self):
+        '''
+        Forecasts every level of the hierarchy (see HierarchyConfig.levels)
+        coherently from base forecasts of the chosen levels. The outlier
+        filter is skipped: its dropped rows would become days without sales
+        in the dense panel the hierarchy is summed from.
+        '''
+        try:
+            with self.traced('hierarchy_pipeline', self.config.hierarchy_trace_path):
+                logging.info("Starting the hierarchical forecasting pipeline...")
+
+                levels = self.hierarchical_forecaster.config.levels
+                with span('pipeline_stage', stage='hierarchy_ingestion'):
+                    train_path, test_path = self.data_ingestion.initiate_hierarchy_ingestion(levels)
+
+                with span('pipeline_stage', stage='hierarchical_forecast'):
+                    forecast_path, metrics_path = self.hierarchical_forecaster.initiate_hierarchical_forecast(train_path, test_path)
+
+                logging.info(f"Hierarchical forecasting pipeline finished successfully. Forecast: {forecast_path}, "
+                             f"metrics: {metrics_path}")
+
+        except Exception as e:
+            logging.error("Exception occurred in the hierarchical forecasting pipeline")
+            raise CustomException(e, sys)
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Run the sales forecasting training pipeline.")
+    parser.add_argument("--n-jobs", type=int, default=1,
+                        help="Worker processes for hyperparameter tuning (0 = one per CPU core).")
+    parser.add_argument("--warm-start", action="store_true",
+                        help="Start each cross-validation fit from the previous cutoff's parameters.")
+    parser.add_argument("--backend", choices=MODEL_BACKENDS, default="prophet",
+                        help="Model backend: a Prophet model per series, or one global gradient-boosting "
+                             "model across all series (gbm).")
+    parser.add_argument("--search", choices=["grid", "random", "bayesian", "halving"], default="grid",
+                        help="Hyperparameter search strategy.")
+    parser.add_argument("--cv-backend", choices=["prophet", "backtest"], default="prophet",
+                        help="Score tuning trials with per-candidate Prophet cross-validation, or with the "
+                             "backtesting engine, which runs every (candidate, cutoff) fold as its own task.")
+    parser.add_argument("--search-trials", type=int, default=20,
+                        help="Candidates evaluated by the random and bayesian strategies.")
+    parser.add_argument("--holidays", default="",
+                        help="Comma-separated holiday calendars to model, e.g. MY or MY-SGR,SG.")
+    parser.add_argument("--events", default="",
+                        help="Comma-separated custom event files (columns ds, holiday).")
+    parser.add_argument("--regressors", default="",
+                        help="Comma-separated regressors from the regressor store to fit, e.g. "
+                             "promotion,special_event,price_index,weather_rainy.")
+    parser.add_argument("--outliers", default="zscore",
+                        help="Comma-separated outlier detectors: zscore, rolling_mad, rolling_iqr, seasonal_residual.")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Skip stages whose inputs are unchanged and, when only new days were "
+                             "appended, refit with the last best hyperparameters instead of retuning.")
+    parser.add_argument("--no-materialize", action="store_true",
+                        help="Don't precompute the served forecasts; serving then predicts live.")
+    parser.add_argument("--segments", default=None,
+                        help="Train one model per segment instead, grouped by these comma-separated "
+                             "columns (e.g. restaurant_type or restaurant_id,menu_item_name).")
+    parser.add_argument("--hierarchy", default=None,
+                        help="Forecast a hierarchy coherently instead, with these comma-separated levels "
+                             "from the top down (e.g. restaurant_type,restaurant_id,menu_item_name).")
+    parser.add_argument("--forecast-levels", default=None,
+                        help="Comma-separated hierarchy levels given base forecasts, 'total' included (default: all).")
+    parser.add_argument("--reconcile", choices=RECONCILIATION_METHODS, default="mint",
+                        help="Hierarchical reconciliation method.")
+    parser.add_argument("--mint-covariance", choices=MINT_COVARIANCES, default="wls",
+                        help="Error covariance of MinT reconciliation.")
+    return parser.parse_args(argv)
+
 if __name__ == "__main__":
+    args = parse_args()
     try:
-        pipeline = TrainPipeline()
-        pipeline.run_pipeline()
+        model_trainer_config = ModelTrainerConfig(
+            model_backend=args.backend,
+            n_jobs=args.n_jobs,
+            warm_start=args.warm_start,
+            search_strategy=args.search,
+            search_trials=args.search_trials,
+            cv_backend=args.cv_backend,
+            regressors=[r.strip() for r in args.regressors.split(',') if r.strip()],
+            holiday_calendars=[c.strip() for c in args.holidays.split(',') if c.strip()],
+            holiday_event_paths=[p.strip() for p in args.events.split(',') if p.strip()]
+        )
+        data_transformation_config = DataTransformationConfig(
+            outliers=OutlierDetectionConfig(detectors=[d.strip() for d in args.outliers.split(',') if d.strip()])
+        )
+        pipeline_config = TrainPipelineConfig(materialize=not args.no_materialize)
+        if args.hierarchy:
+            hierarchy_config = HierarchyConfig(
+                levels=[level.strip() for level in args.hierarchy.split(',')],
+                forecast_levels=[level.strip() for level in args.forecast_levels.split(',')] if args.forecast_levels else None,
+                method=args.reconcile,
+                mint_covariance=args.mint_covariance,
+                n_jobs=args.n_jobs
+            )
+            TrainPipeline(hierarchy_config=hierarchy_config).run_hierarchy_pipeline()
+        elif args.segments:
+            fleet_trainer_config = FleetTrainerConfig(
+                segment_keys=[key.strip() for key in args.segments.split(',')],
+                n_jobs=args.n_jobs
+            )
+            TrainPipeline(model_trainer_config, fleet_trainer_config, data_transformation_config,
+                          pipeline_config=pipeline_config).run_fleet_pipeline()
+        else:
+            TrainPipeline(model_trainer_config, data_transformation_config=data_transformation_config,
+                          pipeline_config=pipeline_config).run_pipeline(incremental=args.incremental)
     except Exception as e:
         logging.critical(f"Pipeline failed: {e}")
         sys.exit(1)
\ No newline at end of file
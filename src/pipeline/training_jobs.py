@@ -0,0 +1,389 @@
+import os
+import sys
+import json
+import time
+import uuid
+import sqlite3
+import argparse
+import threading
+import subprocess
+from contextlib import closing
+from dataclasses import dataclass
+
+from src.exception import CustomException
+from src.logger import logging
+from src.metrics import metrics
+
+JOB_STATUSES = ('queued', 'running', 'succeeded', 'failed', 'cancelled')
+
+# Options a job may set, with their types; the rest comes from ModelTrainerConfig
+JOB_OPTIONS = {
+    'incremental': bool,
+    'n_jobs': int,
+    'warm_start': bool,
+    'search_strategy': str,
+    'search_trials': int,
+    'cv_backend': str,
+    'holiday_calendars': list,
+    'holiday_event_paths': list,
+    'regressors': list,
+    'model_backend': str
+}
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    options TEXT NOT NULL,
+    progress TEXT NOT NULL DEFAULT '{}',
+    result TEXT,
+    error TEXT,
+    cancel_requested INTEGER NOT NULL DEFAULT 0,
+    worker_pid INTEGER,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL,
+    heartbeat_at REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at);
+CREATE TABLE IF NOT EXISTS workers (
+    pid INTEGER PRIMARY KEY,
+    heartbeat_at REAL NOT NULL
+);
+'''
+
+@dataclass
+class TrainingJobConfig:
+    db_path: str = os.path.join('artifacts', 'training_jobs.sqlite')
+    # Seconds between a worker's queue polls and heartbeats
+    poll_interval: float = 2.0
+    # A worker or running job without a heartbeat for this long is considered dead
+    heartbeat_timeout: float = 60.0
+    # A worker started by the app exits after this many idle seconds
+    idle_timeout: float = 300.0
+    # Start a worker process on submit when none is alive
+    autostart_worker: bool = os.getenv('TRAINING_WORKER_AUTOSTART', '1') == '1'
+
+class JobCancelled(Exception):
+    pass
+
+def validate_options(options):
+    '''Checks the options of a submitted job, raising ValueError on unknown keys or wrong types.'''
+    if options is None:
+        return {}
+    if not isinstance(options, dict):
+        raise ValueError("Job options must be a JSON object")
+    unknown = sorted(set(options) - set(JOB_OPTIONS))
+    if unknown:
+        raise ValueError(f"Unknown job options {unknown}, expected some of {sorted(JOB_OPTIONS)}")
+    for key, value in options.items():
+        expected = JOB_OPTIONS[key]
+        # bool is an int subclass, don't accept it for counts
+        if not isinstance(value, expected) or (expected is int and isinstance(value, bool)):
+            raise ValueError(f"Job option '{key}' must be of type {expected.__name__}")
+    if 'search_strategy' in options:
+        from src.components.hyperparameter_search import get_search_strategy
+        get_search_strategy(options['search_strategy'])
+    if 'model_backend' in options:
+        from src.components.model_trainer import MODEL_BACKENDS
+        if options['model_backend'] not in MODEL_BACKENDS:
+            raise ValueError(f"Job option 'model_backend' must be one of {list(MODEL_BACKENDS)}")
+    return dict(options)
+
+class TrainingJobStore:
+    '''
+    SQLite-backed queue and status table of training jobs, shared by the
+    web workers (submit, poll, cancel) and the training worker process.
+
+    Every call opens its own short connection, so it is safe from any
+    thread or process. At most one job runs at a time, since every run
+    writes the same artifacts.
+    '''
+    def __init__(self, config: TrainingJobConfig = None):
+        self.config = config or TrainingJobConfig()
+        os.makedirs(os.path.dirname(self.config.db_path) or '.', exist_ok=True)
+        with closing(self._connect()) as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.executescript(SCHEMA)
+
+    def _connect(self):
+        # Autocommit; multi-statement updates use explicit BEGIN IMMEDIATE
+        conn = sqlite3.connect(self.config.db_path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    @staticmethod
+    def _to_dict(row):
+        if row is None:
+            return None
+        job = dict(row)
+        job['options'] = json.loads(job['options'])
+        job['progress'] = json.loads(job['progress'])
+        job['result'] = json.loads(job['result']) if job['result'] else None
+        job['cancel_requested'] = bool(job['cancel_requested'])
+        return job
+
+    def submit(self, options=None):
+        job_id = uuid.uuid4().hex[:12]
+        with closing(self._connect()) as conn:
+            conn.execute(
+                'INSERT INTO jobs (id, status, options, created_at) VALUES (?, ?, ?, ?)',
+                (job_id, 'queued', json.dumps(validate_options(options)), time.time())
+            )
+        metrics.inc('training_jobs_total', status='queued')
+        logging.info(f"Queued training job {job_id} with options {options or {}}")
+        return self.get(job_id)
+
+    def get(self, job_id):
+        with closing(self._connect()) as conn:
+            return self._to_dict(conn.execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone())
+
+    def list(self, limit=20):
+        with closing(self._connect()) as conn:
+            rows = conn.execute('SELECT * FROM jobs ORDER BY created_at DESC LIMIT ?', (limit,)).fetchall()
+        return [self._to_dict(row) for row in rows]
+
+    def cancel(self, job_id):
+        '''
+        Cancels a queued job right away; a running job is asked to stop
+        and does so at its next stage or tuning trial.
+        '''
+        with closing(self._connect()) as conn:
+            conn.execute(
+                "UPDATE jobs SET status = 'cancelled', finished_at = ? WHERE id = ? AND status = 'queued'",
+                (time.time(), job_id)
+            )
+            conn.execute("UPDATE jobs SET cancel_requested = 1 WHERE id = ? AND status = 'running'", (job_id,))
+        return self.get(job_id)
+
+    def claim_next(self, worker_pid):
+        '''
+        Marks the oldest queued job as running and returns it, or returns
+        None when the queue is empty or another job is still running.
+        '''
+        now = time.time()
+        with closing(self._connect()) as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                # Jobs whose worker died can never finish
+                conn.execute(
+                    "UPDATE jobs SET status = 'failed', error = 'Training worker stopped responding', finished_at = ? "
+                    "WHERE status = 'running' AND heartbeat_at < ?",
+                    (now, now - self.config.heartbeat_timeout)
+                )
+                if conn.execute("SELECT 1 FROM jobs WHERE status = 'running'").fetchone() is not None:
+                    conn.execute('COMMIT')
+                    return None
+                row = conn.execute(
+                    "SELECT id FROM jobs WHERE status = 'queued' ORDER BY created_at LIMIT 1"
+                ).fetchone()
+                if row is not None:
+                    conn.execute(
+                        "UPDATE jobs SET status = 'running', worker_pid = ?, started_at = ?, heartbeat_at = ? WHERE id = ?",
+                        (worker_pid, now, now, row['id'])
+                    )
+                conn.execute('COMMIT')
+            except BaseException:
+                conn.execute('ROLLBACK')
+                raise
+        return self.get(row['id']) if row is not None else None
+
+    def heartbeat(self, worker_pid, job_id=None):
+        '''Records that a worker (and its running job) is alive. Returns whether the job should be cancelled.'''
+        now = time.time()
+        with closing(self._connect()) as conn:
+            conn.execute('INSERT OR REPLACE INTO workers (pid, heartbeat_at) VALUES (?, ?)', (worker_pid, now))
+            if job_id is None:
+                return False
+            conn.execute('UPDATE jobs SET heartbeat_at = ? WHERE id = ?', (now, job_id))
+            row = conn.execute('SELECT cancel_requested FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        return bool(row['cancel_requested'])
+
+    def remove_worker(self, worker_pid):
+        with closing(self._connect()) as conn:
+            conn.execute('DELETE FROM workers WHERE pid = ?', (worker_pid,))
+
+    def worker_alive(self):
+        with closing(self._connect()) as conn:
+            row = conn.execute(
+                'SELECT 1 FROM workers WHERE heartbeat_at >= ?', (time.time() - self.config.heartbeat_timeout,)
+            ).fetchone()
+        return row is not None
+
+    def update_progress(self, job_id, progress):
+        with closing(self._connect()) as conn:
+            conn.execute(
+                'UPDATE jobs SET progress = ?, heartbeat_at = ? WHERE id = ?',
+                (json.dumps(progress, default=str), time.time(), job_id)
+            )
+
+    def finish(self, job_id, status, result=None, error=None):
+        with closing(self._connect()) as conn:
+            conn.execute(
+                'UPDATE jobs SET status = ?, result = ?, error = ?, finished_at = ? WHERE id = ?',
+                (status, json.dumps(result, default=str) if result is not None else None, error, time.time(), job_id)
+            )
+        metrics.inc('training_jobs_total', status=status)
+
+class JobProgress:
+    '''
+    Progress callback of one job's TrainPipeline: keeps per-stage status
+    and every tuning trial, writes them to the store and raises
+    JobCancelled once a cancel was requested.
+    '''
+    def __init__(self, store, job_id, cancel_event):
+        self.store = store
+        self.job_id = job_id
+        self.cancel_event = cancel_event
+        self.progress = {'stage': None, 'stages': {}, 'done': 0, 'n_candidates': None, 'best_mape': None, 'trials': []}
+
+    def __call__(self, event):
+        if event['event'] == 'stage':
+            self.progress['stage'] = event['stage']
+            self.progress['stages'][event['stage']] = event['status']
+        elif event['event'] == 'trial':
+            for key in ('done', 'n_candidates', 'best_mape'):
+                self.progress[key] = event[key]
+            self.progress['trials'].append(dict(event['trial'], n_cutoffs=event['n_cutoffs']))
+        self.store.update_progress(self.job_id, self.progress)
+        if self.cancel_event.is_set():
+            raise JobCancelled(f"Training job {self.job_id} was cancelled")
+
+class TrainingWorker:
+    '''
+    Runs queued training jobs one at a time in this process, off the web
+    workers. A heartbeat thread keeps the worker and its job marked alive
+    and picks up cancel requests. When the pipeline finishes, it promotes
+    the new model version, which every ModelRegistry then swaps to.
+    '''
+    def __init__(self, store: TrainingJobStore = None):
+        self.store = store or TrainingJobStore()
+        self.config = self.store.config
+        self.pid = os.getpid()
+        self._job_id = None
+        self._cancel_event = threading.Event()
+        self._stop_event = threading.Event()
+
+    def _heartbeat_loop(self):
+        while not self._stop_event.wait(self.config.poll_interval):
+            try:
+                if self.store.heartbeat(self.pid, self._job_id):
+                    self._cancel_event.set()
+            except sqlite3.Error as e:
+                logging.warning(f"Training worker heartbeat failed: {e}")
+
+    def run_job(self, job):
+        # Imported here: the web app only needs the queue, not the training stack
+        from src.components.model_trainer import ModelTrainerConfig
+        from src.pipeline.train_pipeline import TrainPipeline
+
+        job_id = job['id']
+        options = dict(job['options'])
+        incremental = options.pop('incremental', False)
+        self._cancel_event.clear()
+        self._job_id = job_id
+        progress = JobProgress(self.store, job_id, self._cancel_event)
+        logging.info(f"Starting training job {job_id}")
+        start_time = time.time()
+        try:
+            pipeline = TrainPipeline(ModelTrainerConfig(**options), progress_callback=progress)
+            pipeline.run_pipeline(incremental=incremental)
+            result = {
+                'accuracy': pipeline.state.get('accuracy'),
+                'seconds': round(time.time() - start_time, 3),
+                'model_version': pipeline.state.get('model_version')
+            }
+            self.store.finish(job_id, 'succeeded', result=result)
+            logging.info(f"Training job {job_id} succeeded in {result['seconds']}s")
+        except Exception as e:
+            # run_pipeline wraps everything in CustomException, so check the flag
+            if self._cancel_event.is_set():
+                self.store.finish(job_id, 'cancelled', error='Cancelled on request')
+                logging.info(f"Training job {job_id} cancelled")
+            else:
+                self.store.finish(job_id, 'failed', error=str(e))
+                logging.error(f"Training job {job_id} failed: {e}")
+        finally:
+            self._job_id = None
+
+    def run(self, exit_when_idle=False):
+        '''Polls the queue and runs jobs until stopped, or with exit_when_idle after idle_timeout seconds without work.'''
+        try:
+            heartbeat = threading.Thread(target=self._heartbeat_loop, name='training-worker-heartbeat', daemon=True)
+            heartbeat.start()
+            logging.info(f"Training worker {self.pid} polling {self.config.db_path}")
+            idle_since = time.monotonic()
+            while True:
+                self.store.heartbeat(self.pid)
+                job = self.store.claim_next(self.pid)
+                if job is not None:
+                    self.run_job(job)
+                    idle_since = time.monotonic()
+                    continue
+                if exit_when_idle and time.monotonic() - idle_since >= self.config.idle_timeout:
+                    logging.info(f"Training worker {self.pid} idle, exiting")
+                    break
+                time.sleep(self.config.poll_interval)
+
+        except Exception as e:
+            raise CustomException(e, sys)
+        finally:
+            self._stop_event.set()
+            self.store.remove_worker(self.pid)
+
+def start_worker_process(store: TrainingJobStore):
+    '''
+    Starts a detached worker process unless one is alive. A second worker
+    started by a race is harmless: jobs are claimed one at a time.
+    '''
+    if store.worker_alive():
+        return None
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'src.pipeline.training_jobs', 'worker', '--exit-when-idle'],
+        cwd=os.getcwd(),
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        start_new_session=True
+    )
+    logging.info(f"Started training worker process {process.pid}")
+    return process
+
+_default_store = None
+_default_store_lock = threading.Lock()
+
+def get_training_job_store() -> TrainingJobStore:
+    '''Returns the shared job store of this process, creating it on first use.'''
+    global _default_store
+    if _default_store is None:
+        with _default_store_lock:
+            if _default_store is None:
+                _default_store = TrainingJobStore()
+    return _default_store
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Queue and run training jobs in the background.")
+    commands = parser.add_subparsers(dest='command', required=True)
+    worker = commands.add_parser('worker', help="Run queued training jobs.")
+    worker.add_argument("--exit-when-idle", action="store_true",
+                        help="Exit after TrainingJobConfig.idle_timeout seconds without queued jobs.")
+    submit = commands.add_parser('submit', help="Queue a training job.")
+    submit.add_argument("--options", default="{}",
+                        help=f"JSON object with any of {sorted(JOB_OPTIONS)}.")
+    status = commands.add_parser('status', help="Show a job, or the latest jobs.")
+    status.add_argument("job_id", nargs='?')
+    cancel = commands.add_parser('cancel', help="Cancel a job.")
+    cancel.add_argument("job_id")
+    return parser.parse_args(argv)
+
+if __name__ == "__main__":
+    args = parse_args()
+    store = TrainingJobStore()
+    if args.command == 'worker':
+        TrainingWorker(store).run(exit_when_idle=args.exit_when_idle)
+    elif args.command == 'submit':
+        print(json.dumps(store.submit(json.loads(args.options)), indent=2))
+    elif args.command == 'status':
+        print(json.dumps(store.get(args.job_id) if args.job_id else store.list(), indent=2, default=str))
+    elif args.command == 'cancel':
+        print(json.dumps(store.cancel(args.job_id), indent=2, default=str))
@@ -1,30 +1,164 @@
 import os
 import sys
+import hashlib
+import importlib.util
 import numpy as np
 import pandas as pd
-import dill
-import holidays
 from datetime import datetime
 from src.exception import CustomException
 from src.logger import logging
 
+# Storage format of the dataframes passed between pipeline stages. Parquet is
+# zstd-compressed; feather is left uncompressed so it can be memory-mapped
+# without decoding. Both need pyarrow, without it everything falls back to CSV.
+FRAME_EXTENSIONS = {'parquet': '.parquet', 'feather': '.feather', 'csv': '.csv'}
+ARTIFACT_FORMAT = os.environ.get('ARTIFACT_FORMAT', 'parquet').lower()
+if ARTIFACT_FORMAT not in FRAME_EXTENSIONS or (
+        ARTIFACT_FORMAT != 'csv' and importlib.util.find_spec('pyarrow') is None):
+    ARTIFACT_FORMAT = 'csv'
+# Also write a CSV copy next to every columnar artifact, for inspection/export
+ARTIFACT_EXPORT_CSV = os.environ.get('ARTIFACT_EXPORT_CSV', '0') == '1'
+
 def save_object(file_path, obj):
     try:
         dir_path = os.path.dirname(file_path)
         os.makedirs(dir_path, exist_ok=True)
-        with open(file_path, "wb") as file_obj:
+        import dill
+        # Written aside and renamed, so readers never load a half-written file
+        tmp_path = file_path + ".tmp"
+        with open(tmp_path, "wb") as file_obj:
             dill.dump(obj, file_obj)
+        os.replace(tmp_path, file_path)
         logging.info(f"Saved object to {file_path}")
     except Exception as e:
         raise CustomException(e, sys)
 
 def load_object(file_path):
     try:
+        import dill
         with open(file_path, "rb") as file_obj:
             return dill.load(file_obj)
     except Exception as e:
         raise CustomException(e, sys)
 
+def artifact_path(name, artifact_format=None):
+    '''
+    Returns the path of a dataframe artifact in the configured format,
+    e.g. artifact_path('train') -> 'artifacts/train.parquet'.
+    '''
+    return os.path.join('artifacts', name + FRAME_EXTENSIONS[artifact_format or ARTIFACT_FORMAT])
+
+def save_frame(df, file_path, export_csv=None):
+    '''
+    Saves a dataframe in the format given by the file extension.
+    '''
+    try:
+        dir_path = os.path.dirname(file_path)
+        if dir_path:
+            os.makedirs(dir_path, exist_ok=True)
+        df = df.reset_index(drop=True)
+        extension = os.path.splitext(file_path)[1]
+        tmp_path = file_path + '.tmp'
+        if extension == '.parquet':
+            df.to_parquet(tmp_path, index=False, compression='zstd')
+        elif extension == '.feather':
+            df.to_feather(tmp_path, compression='uncompressed')
+        else:
+            df.to_csv(tmp_path, index=False, header=True)
+        os.replace(tmp_path, file_path)
+
+        if extension != '.csv' and (ARTIFACT_EXPORT_CSV if export_csv is None else export_csv):
+            df.to_csv(os.path.splitext(file_path)[0] + '.csv', index=False, header=True)
+    except Exception as e:
+        raise CustomException(e, sys)
+
+def load_frame(file_path, columns=None, memory_map=True):
+    '''
+    Loads a dataframe saved by save_frame. Columnar files are memory-mapped
+    and only the requested columns are read. For CSV a 'ds' column is
+    parsed as dates, so every format returns the same dtypes.
+    '''
+    try:
+        extension = os.path.splitext(file_path)[1]
+        if extension == '.parquet':
+            return pd.read_parquet(file_path, columns=columns, memory_map=memory_map)
+        if extension == '.feather':
+            from pyarrow import feather
+            return feather.read_table(file_path, columns=columns, memory_map=memory_map).to_pandas()
+
+        header = pd.read_csv(file_path, nrows=0).columns
+        parse_dates = ['ds'] if 'ds' in header and (columns is None or 'ds' in columns) else None
+        return pd.read_csv(file_path, usecols=columns, parse_dates=parse_dates)
+    except Exception as e:
+        raise CustomException(e, sys)
+
+class FrameWriter:
+    '''
+    Appends dataframe chunks to one artifact file (format given by the
+    extension) so large frames can be written without holding them in memory.
+    '''
+    def __init__(self, file_path):
+        self.file_path = file_path
+        self.extension = os.path.splitext(file_path)[1]
+        self._writer = None
+        self._schema = None
+        self.rows_written = 0
+
+    def write(self, df):
+        try:
+            if self.rows_written == 0 and self._writer is None:
+                dir_path = os.path.dirname(self.file_path)
+                if dir_path:
+                    os.makedirs(dir_path, exist_ok=True)
+
+            if self.extension in ('.parquet', '.feather'):
+                import pyarrow as pa
+                table = pa.Table.from_pandas(df, preserve_index=False)
+                if self._writer is None:
+                    self._schema = table.schema
+                    if self.extension == '.parquet':
+                        import pyarrow.parquet as pq
+                        self._writer = pq.ParquetWriter(self.file_path, self._schema, compression='zstd')
+                    else:
+                        self._writer = pa.ipc.new_file(self.file_path, self._schema)
+                else:
+                    # Later chunks may infer narrower types (e.g. all-null columns)
+                    table = table.cast(self._schema)
+                self._writer.write_table(table)
+            else:
+                df.to_csv(self.file_path, mode='w' if self.rows_written == 0 else 'a',
+                          header=self.rows_written == 0, index=False)
+            self.rows_written += len(df)
+        except Exception as e:
+            raise CustomException(e, sys)
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+def file_checksum(file_path, chunk_size=1 << 20):
+    '''
+    Returns the sha256 hex digest of a file, read in chunks.
+    '''
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as file_obj:
+        for chunk in iter(lambda: file_obj.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def frame_fingerprint(df):
+    '''
+    Returns the sha256 hex digest of a dataframe's values (index ignored).
+    '''
+    return hashlib.sha256(pd.util.hash_pandas_object(df, index=False).values.tobytes()).hexdigest()
+
 def mape(actual, pred): 
     '''
     Mean Absolute Percentage Error (MAPE) Function
@@ -47,26 +181,14 @@ def get_holidays(): ## as we dont know which custom holidays to add, we will cre
     '''
     logging.info("Preparing MY holiday dataframe")
     try:
-        my_holidays_df = pd.DataFrame([])
-        
+        # Imported here: only training needs the holiday calendars
+        from src.components.holiday_provider import get_holiday_provider
+
         current_year = datetime.now().year
         years_range = list(range(current_year - 1, current_year + 3)) 
 
         logging.info(f"Generating MY holidays for years: {years_range}")
-        
-        # Get Malaysia Holidays
-        for date_, name in sorted(holidays.MY(years=years_range).items()):
-            my_holidays_df = pd.concat([
-                my_holidays_df, 
-                pd.DataFrame({
-                    'ds': date_, 
-                    'holiday': 'MY-Holiday',
-                    'lower_window': -2,
-                    'upper_window': 1
-                }, index=[0])
-            ], ignore_index=True)
-
-        my_holidays_df['ds'] = pd.to_datetime(my_holidays_df['ds'])
+        my_holidays_df = get_holiday_provider().get_holidays(calendars=['MY'], years=years_range)
         
         # Remove any duplicate dates
         my_holidays_df = my_holidays_df.drop_duplicates(subset=['ds'])
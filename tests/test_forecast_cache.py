@@ -0,0 +1,52 @@
+import pandas as pd
+
+from src.pipeline.forecast_cache import ForecastCache, ForecastCacheConfig
+
+HISTORY_DAYS = 10
+
+def make_forecast(horizon):
+    ds = pd.date_range('2024-01-01', periods=HISTORY_DAYS + horizon, freq='D')
+    return pd.DataFrame({'ds': ds, 'yhat': range(len(ds))})
+
+def test_shorter_horizons_are_sliced_from_the_longest():
+    cache = ForecastCache(ForecastCacheConfig(max_horizon=30))
+    cache.put('v1', 30, make_forecast(30))
+
+    forecast = cache.get('v1', 7)
+    assert len(forecast) == HISTORY_DAYS + 7
+    pd.testing.assert_frame_equal(forecast, make_forecast(30).iloc[:HISTORY_DAYS + 7])
+    assert (cache.hits, cache.misses) == (1, 0)
+
+def test_other_versions_and_longer_horizons_miss():
+    cache = ForecastCache(ForecastCacheConfig(max_horizon=30))
+    cache.put('v1', 30, make_forecast(30))
+
+    assert cache.get('v2', 7) is None
+    assert cache.get('v1', 60) is None
+    assert cache.misses == 2
+
+def test_returned_forecasts_are_copies():
+    cache = ForecastCache(ForecastCacheConfig(max_horizon=30))
+    cache.put('v1', 30, make_forecast(30))
+
+    for periods in (30, 5):
+        forecast = cache.get('v1', periods)
+        forecast['yhat'] = -1
+    assert (cache.get('v1', 30)['yhat'] >= 0).all()
+
+def test_least_recently_used_entries_are_evicted():
+    cache = ForecastCache(ForecastCacheConfig(max_entries=2, max_horizon=30))
+    cache.put('v1', 30, make_forecast(30))
+    cache.put('v2', 30, make_forecast(30))
+    cache.get('v1', 30)
+    cache.put('v3', 30, make_forecast(30))
+
+    assert cache.get('v2', 30) is None
+    assert cache.get('v1', 30) is not None
+    assert len(cache) == 2
+
+def test_expired_entries_miss():
+    cache = ForecastCache(ForecastCacheConfig(ttl=0, max_horizon=30))
+    cache.put('v1', 30, make_forecast(30))
+    assert cache.get('v1', 30) is None
+    assert len(cache) == 0
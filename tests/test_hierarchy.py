@@ -0,0 +1,81 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.components.hierarchy import Hierarchy, reconcile, shrunk_covariance
+
+# Two regions over three stores: total -> A (a1, a2), B (b1)
+BOTTOM_KEYS = pd.DataFrame({'region': ['A', 'A', 'B'], 'store': ['a1', 'a2', 'b1']})
+
+@pytest.fixture
+def hierarchy():
+    return Hierarchy(BOTTOM_KEYS, ['region', 'store'])
+
+def test_summing_matrix(hierarchy):
+    assert hierarchy.S.shape == (6, 3)
+    assert list(hierarchy.nodes['node']) == ['total', 'A', 'B', 'A|a1', 'A|a2', 'B|b1']
+    np.testing.assert_array_equal(hierarchy.S[hierarchy.bottom_rows].toarray(), np.eye(3))
+    np.testing.assert_array_equal(hierarchy.S.toarray()[:3], [[1, 1, 1], [1, 1, 0], [0, 0, 1]])
+
+@pytest.mark.parametrize('method, covariance', [
+    ('bottom_up', 'ols'), ('mint', 'ols'), ('mint', 'wls'), ('mint', 'shrink')
+])
+def test_reconciled_forecasts_are_coherent(hierarchy, method, covariance):
+    rng = np.random.default_rng(0)
+    rows = np.arange(len(hierarchy.nodes))
+    base = rng.normal(100, 10, (len(rows), 5))
+    residuals = rng.normal(0, 1, (len(rows), 40))
+    reconciled = reconcile(hierarchy, base, rows, method, residuals=residuals, covariance=covariance)
+
+    assert reconciled.shape == base.shape
+    np.testing.assert_allclose(hierarchy.S @ reconciled[hierarchy.bottom_rows], reconciled, rtol=1e-10)
+
+def test_bottom_up_keeps_the_bottom_forecasts(hierarchy):
+    base = np.array([[1.0], [2.0], [3.0]])
+    reconciled = reconcile(hierarchy, base, hierarchy.bottom_rows, 'bottom_up')
+    np.testing.assert_allclose(reconciled[:, 0], [6, 3, 3, 1, 2, 3])
+
+def test_top_down_splits_by_historical_shares(hierarchy):
+    bottom_history = np.array([[1.0, 1.0], [3.0, 3.0], [4.0, 4.0]])
+    history = hierarchy.S @ bottom_history
+    total_row = hierarchy.level_rows['total']
+    reconciled = reconcile(hierarchy, np.array([[80.0, 16.0]]), total_row, 'top_down', history=history)
+
+    np.testing.assert_allclose(reconciled[hierarchy.bottom_rows], [[10, 2], [30, 6], [40, 8]])
+    np.testing.assert_allclose(reconciled[total_row], [[80, 16]])
+
+def test_top_down_from_a_middle_level(hierarchy):
+    bottom_history = np.array([[1.0], [3.0], [5.0]])
+    history = hierarchy.S @ bottom_history
+    region_rows = hierarchy.level_rows['region']
+    reconciled = reconcile(hierarchy, np.array([[40.0], [7.0]]), region_rows, 'top_down', history=history)
+
+    # Each region is split over its own stores only
+    np.testing.assert_allclose(reconciled[hierarchy.bottom_rows, 0], [10, 30, 7])
+    np.testing.assert_allclose(reconciled[:3, 0], [47, 40, 7])
+
+def test_mint_ols_is_the_orthogonal_projection(hierarchy):
+    rng = np.random.default_rng(1)
+    rows = np.arange(len(hierarchy.nodes))
+    base = rng.normal(50, 20, (len(rows), 7))
+    reconciled = reconcile(hierarchy, base, rows, 'mint', covariance='ols')
+
+    S = hierarchy.S.toarray()
+    expected = S @ np.linalg.solve(S.T @ S, S.T @ base)
+    np.testing.assert_allclose(reconciled, expected, rtol=1e-10, atol=1e-10)
+
+def test_mint_needs_the_bottom_level(hierarchy):
+    with pytest.raises(ValueError):
+        reconcile(hierarchy, np.ones((1, 2)), hierarchy.level_rows['total'], 'mint', covariance='ols')
+
+def test_shrunk_covariance_keeps_the_variances():
+    rng = np.random.default_rng(2)
+    residuals = rng.normal(0, 1, (6, 4))
+    covariance = residuals @ residuals.T / residuals.shape[1]
+    shrunk = shrunk_covariance(residuals)
+
+    np.testing.assert_allclose(np.diag(shrunk), np.diag(covariance))
+    np.testing.assert_allclose(shrunk, shrunk.T)
+    # More nodes than days: the sample covariance is singular, the shrunk one is not
+    assert np.linalg.matrix_rank(covariance) < 6
+    assert np.linalg.eigvalsh(shrunk).min() > 0
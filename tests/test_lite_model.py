@@ -0,0 +1,45 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+prophet = pytest.importorskip('prophet')
+
+from src.components.lite_model import LiteForecaster, lite_model_arrays, export_lite_model, load_lite_model
+
+@pytest.fixture(scope='module')
+def fitted():
+    rng = np.random.default_rng(0)
+    ds = pd.date_range('2023-01-01', periods=400, freq='D')
+    promotion = (rng.random(len(ds)) < 0.2).astype(float)
+    y = 100 + 0.1 * np.arange(len(ds)) + 10 * np.sin(2 * np.pi * ds.dayofweek / 7) + 15 * promotion + rng.normal(0, 2, len(ds))
+    holidays = pd.DataFrame({'holiday': 'closing', 'ds': pd.to_datetime(['2023-06-01', '2024-06-01']),
+                             'lower_window': 0, 'upper_window': 1})
+    m = prophet.Prophet(holidays=holidays, seasonality_mode='multiplicative', yearly_seasonality=True)
+    m.add_regressor('promotion', mode='additive')
+    m.fit(pd.DataFrame({'ds': ds, 'y': y, 'promotion': promotion}))
+
+    future = m.make_future_dataframe(periods=60)
+    future['promotion'] = np.r_[promotion, (rng.random(60) < 0.5).astype(float)]
+    return m, future
+
+def assert_matches_prophet(lite, m, future):
+    expected = m.predict(future)
+    actual = lite.predict(future)
+    for col in ['trend', 'yhat', 'additive_terms', 'multiplicative_terms', 'weekly', 'yearly', 'holidays', 'promotion']:
+        np.testing.assert_allclose(actual[col], expected[col], rtol=1e-6, atol=1e-6, err_msg=col)
+    # The intervals are a closed-form approximation of Prophet's sampled ones
+    width = (expected['yhat_upper'] - expected['yhat_lower']).mean()
+    assert abs((actual['yhat_upper'] - actual['yhat_lower']).mean() - width) < 0.25 * width
+
+def test_lite_model_matches_prophet(fitted):
+    m, future = fitted
+    assert_matches_prophet(LiteForecaster(lite_model_arrays(m)), m, future)
+
+def test_exported_lite_model_matches_prophet(fitted, tmp_path):
+    m, future = fitted
+    path = str(tmp_path / 'model_lite.npz')
+    export_lite_model(m, path)
+    lite = load_lite_model(path)
+    assert_matches_prophet(lite, m, future)
+    np.testing.assert_array_equal(lite.make_future_dataframe(periods=60)['ds'].to_numpy(dtype='datetime64[ns]'),
+                                  m.make_future_dataframe(periods=60)['ds'].to_numpy(dtype='datetime64[ns]'))
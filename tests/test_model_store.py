@@ -0,0 +1,74 @@
+import pandas as pd
+import pytest
+
+from src.exception import CustomException
+from src.components.model_store import ModelStore, ModelStoreConfig
+
+class ConstantModel:
+    '''A stand-in for a fitted model, pickled by the store like the gbm backend's.'''
+    model_format = 'constant-pickle'
+
+    def __init__(self, value):
+        self.value = value
+
+def make_train_df():
+    return pd.DataFrame({'ds': pd.date_range('2024-01-01', periods=5, freq='D'), 'y': [1.0, 2.0, 3.0, 4.0, 5.0]})
+
+def publish_versions(store, n):
+    return [store.publish(ConstantModel(i), make_train_df(), metrics={'test_mape': float(i)})['version'] for i in range(n)]
+
+def test_published_versions_are_not_served_until_promoted(tmp_path):
+    store = ModelStore(ModelStoreConfig(root_dir=str(tmp_path)))
+    version, = publish_versions(store, 1)
+
+    assert store.current_version() is None
+    assert [manifest['version'] for manifest in store.versions()] == [version]
+    store.promote(version)
+    assert store.current_version() == version
+    assert store.load_model(version).value == 0
+    pd.testing.assert_frame_equal(store.load_train_data(version), make_train_df(), check_dtype=False)
+
+def test_promoting_an_unknown_version_fails(tmp_path):
+    store = ModelStore(ModelStoreConfig(root_dir=str(tmp_path)))
+    with pytest.raises(CustomException):
+        store.promote('no-such-version')
+    assert store.current_version() is None
+
+def test_repeated_rollbacks_walk_back_through_the_promotions(tmp_path):
+    store = ModelStore(ModelStoreConfig(root_dir=str(tmp_path)))
+    v1, v2, v3 = publish_versions(store, 3)
+    for version in (v1, v2, v3):
+        store.promote(version)
+
+    assert store.rollback() == v2
+    assert store.rollback() == v1
+    assert store.current_version() == v1
+    with pytest.raises(CustomException):
+        store.rollback()
+
+def test_promotion_after_a_rollback_starts_a_new_branch(tmp_path):
+    store = ModelStore(ModelStoreConfig(root_dir=str(tmp_path)))
+    v1, v2, v3 = publish_versions(store, 3)
+    store.promote(v1)
+    store.promote(v2)
+    store.rollback()
+    store.promote(v3)
+
+    assert store.promotion_stack() == [v1, v3]
+    assert store.rollback() == v1
+
+def test_prune_keeps_the_current_version_and_its_rollback_target(tmp_path):
+    store = ModelStore(ModelStoreConfig(root_dir=str(tmp_path), keep_versions=1))
+    promoted = []
+    for i in range(3):
+        promoted.append(store.publish(ConstantModel(i), make_train_df())['version'])
+        store.promote(promoted[-1])
+    v1, v2, v3 = promoted
+
+    # v3 is served and v2 is what a rollback returns to
+    assert [manifest['version'] for manifest in store.versions()] == [v2, v3]
+    assert store.rollback() == v2
+    assert [manifest['version'] for manifest in store.versions()] == [v2, v3]
+    # v1 was pruned, so there is nothing left to roll back to
+    with pytest.raises(CustomException):
+        store.rollback()
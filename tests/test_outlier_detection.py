@@ -0,0 +1,71 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.components.outlier_detection import DETECTORS, OutlierDetectionConfig, OutlierFilter
+
+SPIKE_ROW = 50
+
+def make_series(seed, n_days=120):
+    rng = np.random.default_rng(seed)
+    ds = pd.date_range('2024-01-01', periods=n_days, freq='D')
+    weekly = 10 * np.sin(2 * np.pi * ds.dayofweek / 7)
+    return pd.DataFrame({'ds': ds, 'y': 100 + weekly + rng.normal(0, 2, n_days)})
+
+def make_segments():
+    a, b = make_series(0), make_series(1)
+    a.loc[SPIKE_ROW, 'y'] += 80
+    b['y'] *= 3
+    return pd.concat([a.assign(store='a'), b.assign(store='b')], ignore_index=True)
+
+def make_filter(detectors):
+    return OutlierFilter(OutlierDetectionConfig(detectors=detectors, zscore_threshold=3.0))
+
+@pytest.mark.parametrize('detector', sorted(DETECTORS))
+def test_segments_are_fitted_independently(detector):
+    df = make_segments()
+    outlier_filter = make_filter([detector])
+    mask, counts, boundaries = outlier_filter.fit(df, 'store')
+
+    expected = np.concatenate([outlier_filter.fit(df[df['store'] == store], 'store')[0] for store in ('a', 'b')])
+    np.testing.assert_array_equal(mask, expected)
+    assert counts[detector] == mask.sum()
+    assert set(boundaries['segment']) == {'a', 'b'}
+
+def test_zscore_flags_an_injected_spike():
+    df = make_segments()
+    mask, counts, _ = make_filter(['zscore']).fit(df, 'store')
+
+    assert mask[SPIKE_ROW]
+    assert counts == {'zscore': 1}
+
+def test_unsorted_rows_keep_their_mask():
+    df = make_segments()
+    shuffled = df.sample(frac=1, random_state=0)
+    outlier_filter = make_filter(['zscore', 'rolling_mad', 'seasonal_residual'])
+
+    mask = outlier_filter.fit(df, 'store')[0]
+    shuffled_mask = outlier_filter.fit(shuffled, 'store')[0]
+    np.testing.assert_array_equal(shuffled_mask, mask[shuffled.index])
+
+@pytest.mark.parametrize('detectors', [['zscore'], ['seasonal_residual'], ['zscore', 'seasonal_residual']])
+def test_apply_reproduces_the_fitted_mask(detectors):
+    df = make_segments()
+    mask, _, boundaries = make_filter(detectors).fit(df, 'store')
+
+    np.testing.assert_array_equal(OutlierFilter.apply(df, boundaries, 'store'), mask)
+
+def test_apply_never_flags_unknown_segments():
+    df = make_segments()
+    _, _, boundaries = make_filter(['zscore', 'seasonal_residual']).fit(df, 'store')
+
+    unknown = df.assign(store='c', y=df['y'] * 100)
+    assert not OutlierFilter.apply(unknown, boundaries, 'store').any()
+
+def test_unsegmented_series():
+    df = make_segments()
+    df = df[df['store'] == 'a'].drop(columns='store')
+    mask, _, boundaries = make_filter(['zscore']).fit(df)
+
+    assert list(boundaries['segment']) == ['total']
+    np.testing.assert_array_equal(OutlierFilter.apply(df, boundaries), mask)
@@ -0,0 +1,81 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+prophet = pytest.importorskip('prophet')
+
+from src.pipeline.scenario_engine import ScenarioEngine, parse_scenarios
+
+REGRESSOR_COLS = ['promotion', 'price']
+PERIODS = 28
+
+@pytest.fixture(scope='module')
+def fitted():
+    rng = np.random.default_rng(0)
+    ds = pd.date_range('2023-01-01', periods=300 + PERIODS, freq='D')
+    promotion = (rng.random(len(ds)) < 0.2).astype(float)
+    price = rng.normal(10, 1, len(ds))
+    trend = 100 + 0.1 * np.arange(len(ds))
+    y = trend * (1 - 0.03 * (price - 10)) + 15 * promotion + rng.normal(0, 2, len(ds))
+    history = pd.DataFrame({'ds': ds, 'y': y, 'promotion': promotion, 'price': price})
+
+    m = prophet.Prophet(weekly_seasonality=True, yearly_seasonality=False)
+    m.add_regressor('promotion', mode='additive')
+    m.add_regressor('price', mode='multiplicative')
+    m.fit(history.iloc[:-PERIODS])
+
+    future = history.iloc[-PERIODS:].drop(columns='y').reset_index(drop=True)
+    return m, future, m.predict(future)
+
+def apply_changes(future, changes):
+    '''The future frame with the changes of one scenario applied the slow way.'''
+    future = future.copy()
+    for change in changes:
+        rows = future['ds'] >= pd.Timestamp(change.get('start', future['ds'].min()))
+        col = change['regressor']
+        if 'set' in change:
+            future.loc[rows, col] = change['set']
+        elif 'scale' in change:
+            future.loc[rows, col] *= change['scale']
+        else:
+            future.loc[rows, col] += change['shift']
+    return future
+
+def test_simulated_scenarios_match_a_full_prediction(fitted):
+    m, future, forecast = fitted
+    engine = ScenarioEngine(m, forecast, REGRESSOR_COLS, future[REGRESSOR_COLS].to_numpy())
+    start = str(future['ds'].iloc[10].date())
+    scenarios = [
+        {'name': 'promo', 'changes': [{'regressor': 'promotion', 'set': 1, 'start': start}]},
+        {'name': 'discount', 'changes': [{'regressor': 'price', 'scale': 0.8}]},
+        {'name': 'both', 'changes': [{'regressor': 'price', 'shift': 1.5},
+                                     {'regressor': 'promotion', 'set': 0, 'start': start}]}
+    ]
+    names, simulated = engine.simulate(scenarios)
+
+    assert names == ['promo', 'discount', 'both']
+    for s, scenario in enumerate(scenarios):
+        expected = m.predict(apply_changes(future, scenario['changes']))['yhat'].to_numpy()
+        np.testing.assert_allclose(simulated['yhat'][s], expected, rtol=1e-8, err_msg=scenario['name'])
+        np.testing.assert_allclose(simulated['delta'][s], expected - forecast['yhat'].to_numpy(), atol=1e-6)
+
+def test_an_empty_scenario_is_the_baseline(fitted):
+    m, future, forecast = fitted
+    engine = ScenarioEngine(m, forecast, REGRESSOR_COLS, future[REGRESSOR_COLS].to_numpy())
+    _, simulated = engine.simulate([{'changes': []}])
+
+    np.testing.assert_array_equal(simulated['delta'], 0)
+    np.testing.assert_allclose(simulated['yhat_lower'][0], forecast['yhat_lower'])
+
+@pytest.mark.parametrize('scenarios', [
+    [],
+    [{'name': 'no changes'}],
+    [{'changes': [{'regressor': 'weather', 'set': 1}]}],
+    [{'changes': [{'regressor': 'promotion', 'set': 1, 'scale': 2}]}],
+    [{'changes': [{'regressor': 'promotion', 'set': True}]}],
+    [{'changes': [{'regressor': 'promotion', 'set': 1, 'start': 'soon'}]}]
+])
+def test_invalid_scenarios_are_rejected(scenarios):
+    ds = pd.date_range('2024-01-01', periods=7, freq='D')
+    with pytest.raises(ValueError):
+        parse_scenarios(scenarios, REGRESSOR_COLS, ds)
@@ -0,0 +1,78 @@
+import os
+
+import pandas as pd
+import pytest
+
+from src.pipeline.train_pipeline import TrainPipeline, TrainPipelineConfig
+from src.utils import frame_fingerprint, save_frame
+
+def make_train_df(n_rows):
+    ds = pd.date_range('2024-01-01', periods=n_rows, freq='D')
+    return pd.DataFrame({'ds': ds, 'y': [float(i) for i in range(n_rows)]})
+
+@pytest.fixture
+def pipeline(tmp_path):
+    return TrainPipeline(pipeline_config=TrainPipelineConfig(state_path=str(tmp_path / 'state.json')))
+
+@pytest.fixture
+def output(tmp_path):
+    path = tmp_path / 'output.txt'
+    path.write_text('done')
+    return str(path)
+
+class CountingStage:
+    def __init__(self, outputs):
+        self.outputs = outputs
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        return self.outputs
+
+def test_unchanged_stage_is_skipped_in_incremental_mode(pipeline, output):
+    stage = CountingStage([output])
+    pipeline.run_stage('ingestion', 'inputs-1', stage, incremental=True)
+
+    assert pipeline.run_stage('ingestion', 'inputs-1', stage, incremental=True) == [output]
+    assert stage.calls == 1
+    assert pipeline.load_state()['ingestion'] == {'inputs': 'inputs-1', 'outputs': [output]}
+
+def test_stage_reruns_when_its_inputs_change(pipeline, output):
+    stage = CountingStage([output])
+    pipeline.run_stage('ingestion', 'inputs-1', stage, incremental=True)
+    pipeline.run_stage('ingestion', 'inputs-2', stage, incremental=True)
+
+    assert stage.calls == 2
+    assert pipeline.state['ingestion']['inputs'] == 'inputs-2'
+
+def test_stage_reruns_when_an_output_is_missing(pipeline, output):
+    stage = CountingStage([output])
+    pipeline.run_stage('ingestion', 'inputs-1', stage, incremental=True)
+    os.remove(output)
+    pipeline.run_stage('ingestion', 'inputs-1', stage, incremental=True)
+
+    assert stage.calls == 2
+
+def test_stage_always_runs_without_incremental(pipeline, output):
+    stage = CountingStage([output])
+    pipeline.run_stage('ingestion', 'inputs-1', stage, incremental=False)
+    pipeline.run_stage('ingestion', 'inputs-1', stage, incremental=False)
+
+    assert stage.calls == 2
+
+def test_is_append_only(pipeline, tmp_path):
+    train_path = str(tmp_path / 'train.parquet')
+    save_frame(make_train_df(10), train_path, export_csv=False)
+    # No model trained yet
+    assert not pipeline.is_append_only(train_path)
+
+    pipeline.state['training_data'] = {'n_rows': 8, 'fingerprint': frame_fingerprint(make_train_df(8))}
+    assert pipeline.is_append_only(train_path)
+
+    changed = make_train_df(10)
+    changed.loc[3, 'y'] = -1.0
+    save_frame(changed, train_path, export_csv=False)
+    assert not pipeline.is_append_only(train_path)
+
+    save_frame(make_train_df(6), train_path, export_csv=False)
+    assert not pipeline.is_append_only(train_path)